@@ -0,0 +1,189 @@
+"""Admission control under a burst of dictation turns, against a fake model with a quota.
+
+--users clients each send --turns turns at the same moment, and one noisy
+client sends --noisy-requests turns back to back. The fake model takes
+--model-latency-ms per call and fails any call beyond --quota concurrent calls
+with a quota error, like Vertex AI's ResourceExhausted.
+
+Without admission control a quota error is a 500, and clients retry at once,
+up to --max-attempts times per turn. With it, each turn passes the per-client
+TokenBucket and takes a ConcurrencyLimiter slot around the model call, as in
+medical_record_assistant. A turn turned away gets 429 and its client waits
+Retry-After before trying again.
+
+Reported per run: turns completed and given up, responses by status, calls
+that reached the model, quota errors, and the latency of completed turns
+including the waits. The exit status is 1 if, with admission control, a call
+hit the quota, a regular client's turn was given up, or a 429 had no
+Retry-After.
+
+    python benchmarks/bench_admission.py --users 40 --quota 4 --max-concurrency 4
+    python benchmarks/bench_admission.py --rate-per-minute 30 --burst 5 --noisy-requests 50
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "medical-dictation-function"))
+
+from admission import ConcurrencyLimiter, Overloaded, TokenBucket  # noqa: E402
+
+
+class QuotaExceeded(Exception):
+    """Like google.api_core.exceptions.ResourceExhausted (HTTP 429 from Vertex AI)."""
+
+
+class QuotaModel:
+    """Fails calls beyond `quota` in flight at once; the others take `latency` seconds."""
+
+    def __init__(self, quota: int, latency: float):
+        self.quota = quota
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.quota_errors = 0
+
+    def predict(self) -> str:
+        with self.lock:
+            self.calls += 1
+            if self.in_flight >= self.quota:
+                self.quota_errors += 1
+                raise QuotaExceeded("Quota exceeded for aiplatform.googleapis.com/online_prediction_requests")
+            self.in_flight += 1
+        try:
+            time.sleep(self.latency)
+            return "{}"
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class Server:
+    """The admission path of medical_record_assistant, reduced to status codes."""
+
+    def __init__(self, model: QuotaModel, rate_limiter: Optional[TokenBucket], model_slots: Optional[ConcurrencyLimiter]):
+        self.model = model
+        self.rate_limiter = rate_limiter
+        self.model_slots = model_slots
+
+    def handle(self, client: str) -> Dict[str, Any]:
+        try:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(client)
+            if self.model_slots is not None:
+                with self.model_slots.slot():
+                    self.model.predict()
+            else:
+                self.model.predict()
+            return {"status": 200}
+        except Overloaded as e:
+            return {"status": 429, "retry_after": e.retry_after, "reason": e.reason}
+        except QuotaExceeded:
+            # The broad `except Exception` in the handler
+            return {"status": 500}
+
+
+def run(args: argparse.Namespace, admission: bool) -> Dict[str, Any]:
+    model = QuotaModel(args.quota, args.model_latency_ms / 1000)
+    rate_limiter = TokenBucket(args.rate_per_minute / 60, args.burst) if admission else None
+    model_slots = ConcurrencyLimiter(args.max_concurrency, args.queue_size, args.queue_timeout) if admission else None
+    server = Server(model, rate_limiter, model_slots)
+
+    lock = threading.Lock()
+    statuses: Dict[str, int] = {}
+    reasons: Dict[str, int] = {}
+    latencies: List[float] = []
+    given_up = {"regular": 0, "noisy": 0}
+    missing_retry_after = 0
+
+    def turn(client: str, kind: str) -> None:
+        nonlocal missing_retry_after
+        start = time.perf_counter()
+        for _ in range(args.max_attempts):
+            response = server.handle(client)
+            with lock:
+                statuses[str(response["status"])] = statuses.get(str(response["status"]), 0) + 1
+                if response["status"] == 429:
+                    reasons[response["reason"]] = reasons.get(response["reason"], 0) + 1
+                    missing_retry_after += not response.get("retry_after")
+            if response["status"] == 200:
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                return
+            if response["status"] == 429:
+                time.sleep(response.get("retry_after") or 1)
+            # A 500 is retried at once, as the frontend's resend does
+        with lock:
+            given_up[kind] += 1
+
+    def client(name: str, kind: str, turns: int) -> None:
+        for _ in range(turns):
+            turn(name, kind)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users + 1) as pool:
+        futures = [pool.submit(client, f"session-{index}", "regular", args.turns) for index in range(args.users)]
+        if args.noisy_requests:
+            # The noisy client does not wait for its own turns to finish
+            futures += [pool.submit(turn, "noisy", "noisy") for _ in range(args.noisy_requests)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    values = sorted(latencies)
+    return {
+        "completed": len(values),
+        "given_up": given_up,
+        "statuses": dict(sorted(statuses.items())),
+        "rejections": dict(sorted(reasons.items())),
+        "model_calls": model.calls,
+        "quota_errors": model.quota_errors,
+        "missing_retry_after": missing_retry_after,
+        "p50_s": statistics.median(values) if values else 0.0,
+        "p95_s": values[max(0, math.ceil(0.95 * len(values)) - 1)] if values else 0.0,
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=3, help="turns per regular client")
+    parser.add_argument("--noisy-requests", type=int, default=30, help="turns sent at once by one client")
+    parser.add_argument("--model-latency-ms", type=float, default=200)
+    parser.add_argument("--quota", type=int, default=4, help="model calls the fake quota allows at once")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="MODEL_MAX_CONCURRENCY")
+    parser.add_argument("--queue-size", type=int, default=16, help="MODEL_QUEUE_SIZE")
+    parser.add_argument("--queue-timeout", type=float, default=2.0, help="MODEL_QUEUE_TIMEOUT_SECONDS")
+    parser.add_argument("--rate-per-minute", type=float, default=60, help="RATE_LIMIT_PER_MINUTE")
+    parser.add_argument("--burst", type=float, default=10, help="RATE_LIMIT_BURST")
+    parser.add_argument("--max-attempts", type=int, default=20, help="attempts per turn before the client gives up")
+    args = parser.parse_args()
+
+    failed = False
+    for admission in (False, True):
+        result = run(args, admission)
+        print("admission control" if admission else "no admission control")
+        print(f"  turns completed {result['completed']}, given up {result['given_up']['regular']} regular / "
+              f"{result['given_up']['noisy']} noisy, {result['elapsed_s']:.1f} s")
+        print(f"  responses {result['statuses']}  429 reasons {result['rejections']}")
+        print(f"  model calls {result['model_calls']}, quota errors {result['quota_errors']}")
+        print(f"  completed turn latency p50 {result['p50_s'] * 1000:.0f} ms, p95 {result['p95_s'] * 1000:.0f} ms")
+        if admission and args.max_concurrency <= args.quota and (
+                result["quota_errors"] or result["given_up"]["regular"] or result["missing_retry_after"]):
+            failed = True
+    if failed:
+        print("\nWith admission control, a call hit the quota, a regular turn was given up or a 429 had no Retry-After")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
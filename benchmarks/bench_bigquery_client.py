@@ -0,0 +1,120 @@
+"""Compare cold and warm per-request BigQuery client overhead.
+
+Cold builds a new client and table reference for every request (the previous
+behaviour of submit-to-bigquery); warm reuses the shared BigQueryClientCache.
+No network calls are made: when google-cloud-bigquery is installed a real
+client is built with anonymous credentials over a stubbed HTTP session,
+otherwise a stand-in client simulates construction cost.
+
+    python benchmarks/bench_bigquery_client.py --requests 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+
+from medical_records.bigquery_client import BigQueryClientCache  # noqa: E402
+
+ROW = {
+    "patient": {"name": "John Doe", "age": 28, "sex": "male", "medical_record_number": "1234567890"},
+    "procedure": {"date": "2023-10-27", "location": "Field Surgical Unit Alpha", "procedures_performed": ["Fasciotomy"]},
+    "coding": {"snomed_ct": [], "icd_10": [], "cpt": [{"code": "27892", "description": "Fasciotomy"}]},
+}
+
+
+class StubResponse:
+    status_code = 200
+    headers = {"content-type": "application/json"}
+    content = b"{}"
+    text = "{}"
+
+    def json(self):
+        return {}
+
+
+class StubSession:
+    """Stands in for the authorized requests session; every call succeeds instantly."""
+
+    def request(self, *args, **kwargs):
+        return StubResponse()
+
+    def close(self):
+        pass
+
+
+class SimulatedClient:
+    """Used when google-cloud-bigquery is not installed."""
+
+    def __init__(self, setup_seconds):
+        time.sleep(setup_seconds)
+
+    def dataset(self, dataset_id, project=None):
+        self.dataset_path = f"{project}.{dataset_id}"
+        return self
+
+    def table(self, table_id):
+        return f"{self.dataset_path}.{table_id}"
+
+    def insert_rows_json(self, table_ref, rows, **kwargs):
+        json.dumps(rows)
+        return []
+
+    def close(self):
+        pass
+
+
+def make_factory(simulated_setup_seconds):
+    try:
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import bigquery
+    except ImportError:
+        return (lambda: SimulatedClient(simulated_setup_seconds)), "simulated"
+
+    def factory():
+        return bigquery.Client(project="bench-project", credentials=AnonymousCredentials(), _http=StubSession())
+    return factory, "google-cloud-bigquery"
+
+
+def run(cache_for_request, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        client, table_ref = cache_for_request().get()
+        client.insert_rows_json(table_ref, [ROW])
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(label, timings):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<6} mean {statistics.mean(timings):8.3f} ms  p50 {statistics.median(timings):8.3f} ms  p95 {p95:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--simulated-setup-ms", type=float, default=5.0,
+                        help="client construction cost when google-cloud-bigquery is not installed")
+    args = parser.parse_args()
+
+    factory, backend = make_factory(args.simulated_setup_ms / 1000)
+    print(f"backend: {backend}, requests: {args.requests}")
+
+    cold = run(lambda: BigQueryClientCache("bench-project", "health", "usu_procedures", factory), args.requests)
+    shared = BigQueryClientCache("bench-project", "health", "usu_procedures", factory)
+    shared.get()
+    warm = run(lambda: shared, args.requests)
+
+    summarize("cold", cold)
+    summarize("warm", warm)
+    print(f"speedup {statistics.mean(cold) / statistics.mean(warm):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
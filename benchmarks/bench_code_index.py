@@ -0,0 +1,106 @@
+"""Load-time and lookup-latency benchmark for the local code index.
+
+Builds a synthetic ICD-10-CM-sized table (about 74,000 codes with realistic
+code shapes and multi-word descriptions), writes it as a code file, then
+measures load time and the latency of exact, prefix and description lookups.
+Pass --file to benchmark a real code file instead.
+
+    python benchmarks/bench_code_index.py
+    python benchmarks/bench_code_index.py --file /path/to/icd_10.tsv
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+
+from medical_records.code_index import CodeIndex  # noqa: E402
+
+# Like ICD-10-CM, descriptions mix a few very common words with a long tail of
+# anatomical and clinical terms (the real table has several thousand distinct words).
+COMMON_WORDS = ("of with without right left initial encounter subsequent sequela unspecified other "
+                "fracture injury open closed displaced nondisplaced").split()
+SYLLABLES = ("ab ad an ar ce co cra cu de di duo fe fi ga gas he hu hy il is la li lu ma me my na ne "
+             "neu os pa pe per pha ple pul ra re sa sca spi ste sy ta te tha to tra tu ul va ve").split()
+
+
+def synthetic_rows(count, seed):
+    rng = random.Random(seed)
+    tail = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(6000)})
+    rows = {}
+    while len(rows) < count:
+        code = (rng.choice(string.ascii_uppercase) + f"{rng.randint(0, 99):02d}." +
+                "".join(rng.choice(string.digits + "X") for _ in range(rng.randint(1, 3))) +
+                rng.choice(["", "A", "D", "S"]))
+        words = rng.sample(COMMON_WORDS, rng.randint(2, 4)) + rng.sample(tail, rng.randint(2, 5))
+        rng.shuffle(words)
+        rows[code] = " ".join(words).capitalize()
+    return list(rows.items())
+
+
+def latency(fn, queries):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        fn(query)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="code file to load instead of the synthetic table")
+    parser.add_argument("--codes", type=int, default=74000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        handle = tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False, encoding="utf-8")
+        with handle:
+            for code, description in synthetic_rows(args.codes, args.seed):
+                handle.write(f"{code}\t{description}\n")
+        path = handle.name
+
+    try:
+        start = time.perf_counter()
+        index = CodeIndex.from_file(path)
+        load_seconds = time.perf_counter() - start
+    finally:
+        if args.file is None:
+            os.remove(path)
+    print(f"loaded {len(index):,} codes in {load_seconds * 1000:.0f} ms")
+
+    rng = random.Random(args.seed)
+    rows = [(index._codes[i], index._descriptions[i]) for i in rng.sample(range(len(index)), min(args.queries, len(index)))]
+    exact = [code.lower().replace(".", "") for code, _ in rows]
+    prefixes = [code[:3] for code, _ in rows]
+    # Descriptions as a model might paraphrase them: drop a word and shuffle the rest
+    paraphrased = []
+    for _, description in rows:
+        words = description.split()
+        words.pop(rng.randrange(len(words)))
+        rng.shuffle(words)
+        paraphrased.append(" ".join(words))
+
+    for label, fn, queries in (("exact code", index.get, exact),
+                               ("prefix (20)", index.prefix, prefixes),
+                               ("description", index.search, paraphrased)):
+        p50, p99 = latency(fn, queries)
+        print(f"{label:<12} p50 {p50:9.1f} us   p99 {p99:9.1f} us")
+
+    found = sum(1 for (code, _), query in zip(rows, paraphrased)
+                if any(match["code"] == code for _, match in index.search(query, limit=5)))
+    print(f"description recall@5 on paraphrased queries: {found / len(rows):.1%}")
+
+
+if __name__ == "__main__":
+    main()
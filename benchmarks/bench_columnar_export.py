@@ -0,0 +1,124 @@
+"""Columnar export, load-job payload size and local code statistics.
+
+Generates --records synthetic records with the template report backend,
+converts them the way the insert path does, and reports:
+
+- the payload of streaming inserts (JSON rows, billed with a 1 KB minimum
+  per row) against the single Parquet file a load job sends;
+- the time to build that file and to write the date-partitioned export;
+- the time of code_frequency (top CPT codes by location, and top ICD-10
+  codes over a range of dates) against the same counts in plain Python over the
+  rows already in memory. Reading costs about a millisecond per file, so
+  it grows with the number of date partitions more than with the records.
+
+The statistics must match the plain Python counts; the exit status is 1 if
+they do not. Requires pyarrow.
+
+    python benchmarks/bench_columnar_export.py --records 20000 --format arrow
+"""
+import argparse
+import collections
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+sys.path.insert(0, os.path.join(ROOT, "generate-field-report-function"))
+
+from medical_records.columnar_export import (EXPORT_FORMATS, code_frequency, records_to_table,  # noqa: E402
+                                             write_partitioned, write_table)
+from medical_records.insert_path import to_bq_record  # noqa: E402
+from template_reports import TemplateReportBackend  # noqa: E402
+
+STREAMING_MIN_ROW_BYTES = 1024
+
+
+def expected_frequency(rows: List[Dict[str, Any]], code_system: str, by: Any, top: int, start: Any = None,
+                       end: Any = None) -> Dict[Any, Dict[str, int]]:
+    """Top codes per group counted in plain Python, as {group: {code: count}} (ties at the cut included)."""
+    counts: Dict[Any, collections.Counter] = collections.defaultdict(collections.Counter)
+    for row in rows:
+        date = row["procedure"]["date"]
+        if (start and date < start) or (end and date > end):
+            continue
+        group = row["procedure"][by] if by else None
+        counts[group].update(code["code"] for code in row["coding"][code_system])
+    expected = {}
+    for group, counter in counts.items():
+        ranked = counter.most_common()
+        cutoff = ranked[min(top, len(ranked)) - 1][1]
+        expected[group] = {code: count for code, count in ranked if count >= cutoff}
+    return expected
+
+
+def matches(result: List[Dict[str, Any]], expected: Dict[Any, Dict[str, int]], top: int) -> bool:
+    by_group: Dict[Any, List[Dict[str, Any]]] = collections.defaultdict(list)
+    for row in result:
+        by_group[row["group"]].append(row)
+    return set(by_group) == set(expected) and all(
+        len(rows) == min(top, len(expected[group])) and all(expected[group].get(row["code"]) == row["count"] for row in rows)
+        for group, rows in by_group.items())
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backend = TemplateReportBackend(args.seed)
+    rows = [to_bq_record(backend.generate_example(index)[1]) for index in range(args.records)]
+
+    json_bytes = [len(json.dumps(row).encode("utf-8")) for row in rows]
+    billed = sum(max(size, STREAMING_MIN_ROW_BYTES) for size in json_bytes)
+    table, build_ms = timed(records_to_table, rows)
+    buffer = io.BytesIO()
+    _, encode_ms = timed(write_table, table, buffer, "parquet")
+    print(f"records {len(rows)}")
+    print(f"streaming inserts  {sum(json_bytes) / 1024:10.1f} KB JSON, {billed / 1024:10.1f} KB billed, "
+          f"{len(rows)} rows")
+    print(f"load job           {buffer.tell() / 1024:10.1f} KB Parquet in one file "
+          f"(build {build_ms:.1f} ms, encode {encode_ms:.1f} ms)")
+
+    directory = tempfile.mkdtemp(prefix="bench_columnar_")
+    try:
+        paths, export_ms = timed(write_partitioned, rows, directory, args.format)
+        size = sum(os.path.getsize(path) for path in paths)
+        print(f"export ({args.format})   {size / 1024:10.1f} KB in {len(paths)} date partitions, {export_ms:.1f} ms")
+
+        dates = sorted(row["procedure"]["date"] for row in rows)
+        start, end = dates[len(dates) // 4], dates[len(dates) // 2]
+        queries = {
+            "top cpt by location": ("cpt", "location", None, None),
+            f"top icd_10 {start}..{end}": ("icd_10", None, start, end),
+        }
+        failed = 0
+        for name, (code_system, by, first, last) in queries.items():
+            result, query_ms = timed(code_frequency, directory, code_system, by, args.top, first, last, args.format)
+            expected, python_ms = timed(expected_frequency, rows, code_system, by, args.top, first, last)
+            ok = matches(result, expected, args.top)
+            failed += not ok
+            print(f"{name:<34} code_frequency {query_ms:8.1f} ms  Python over in-memory rows {python_ms:8.1f} ms  "
+                  f"{'ok' if ok else 'MISMATCH'}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
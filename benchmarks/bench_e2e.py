@@ -0,0 +1,444 @@
+"""End-to-end load benchmark for medical_record_assistant and submit_to_bigquery.
+
+Replays dictation sessions in-process against both Cloud Functions: each
+virtual user sends every turn of a session to medical_record_assistant,
+carrying `currentRecord` and `currentPrompt` forward, then submits the final
+record to submit_to_bigquery. The medlm-large prediction client and the
+BigQuery client are replaced by local fakes with configurable latency and
+failure injection, so no Google Cloud calls are made; everything else (prompt
+building, protobuf conversion, JSON extraction, merging, validation, batching,
+retries) runs as deployed.
+
+Reports p50/p95/p99 per stage, throughput and the error rate of each
+function for each concurrency level. The exit status is 1 when either
+function answers more than --max-error-rate of its requests with an error
+status. Save a run with --json and compare later runs against it with
+--baseline to catch regressions before deploying (exit status 1 on
+regression, including a higher error rate).
+
+Requires the functions' dependencies (pip install -r <function>/requirements.txt).
+
+    python benchmarks/bench_e2e.py --concurrency 1,4,16 --iterations 10
+    python benchmarks/bench_e2e.py --model-latency-ms 1500 --model-failure-rate 0.02 --json baseline.json
+    python benchmarks/bench_e2e.py --baseline baseline.json --max-regression 0.2
+    python benchmarks/bench_e2e.py --sessions reports.jsonl --mode dictation
+
+--sessions takes benchmarks/data/sessions.json style sessions (turn mode) or
+the JSONL written by generate-field-report-function/batch_generate.py with
+--ground-truth (dictation mode; the fake model answers with the ground truth).
+"""
+import argparse
+import copy
+import importlib.util
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SESSIONS_PATH = os.path.join(ROOT, "benchmarks", "data", "sessions.json")
+# Differences below this many milliseconds are treated as noise when comparing with a baseline
+REGRESSION_NOISE_MS = 1.0
+# Error rates may rise by this much over the baseline before it counts as a regression
+REGRESSION_NOISE_ERROR_RATE = 0.01
+FUNCTIONS = ("dictation", "bigquery")
+
+
+class FakeServiceError(Exception):
+    """Transient backend error (HTTP 503), retryable like google.api_core.exceptions.ServiceUnavailable."""
+    code = 503
+
+
+class LatencyModel:
+    """Log-normal latency around a median, like real RPC latencies with a long tail."""
+
+    def __init__(self, median_ms: float, sigma: float, rng: random.Random):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.rng = rng
+
+    def sleep(self, extra_ms: float = 0.0) -> None:
+        if self.median_ms > 0:
+            extra_ms += self.median_ms * math.exp(self.rng.gauss(0, self.sigma))
+        if extra_ms > 0:
+            time.sleep(extra_ms / 1000)
+
+
+class FakePredictionClient:
+    """Stands in for aiplatform PredictionServiceClient.
+
+    The completion for the current request is set per thread by the session
+    runner, so concurrent virtual users each get their own answer.
+    """
+
+    def __init__(self, latency: LatencyModel, failure_rate: float, malformed_rate: float, rng: random.Random):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.rng = rng
+        self.expected = threading.local()
+
+    def predict(self, endpoint: str, instances: List[Any], parameters: Any) -> Any:
+        self.latency.sleep()
+        if self.rng.random() < self.failure_rate:
+            raise FakeServiceError("503 Service Unavailable (injected)")
+        completion = getattr(self.expected, "completion", '{"updated_record": {}, "message": ""}')
+        prompt = instances[0].struct_value.fields["content"].string_value
+        cut = getattr(self.expected, "cut", None)
+        if cut and prompt.endswith(cut):
+            # Continuation of a completion cut off at the token limit: the rest of it
+            self.expected.cut = None
+            return SimpleNamespace(predictions=[{"content": completion[len(cut):], "finishReason": "STOP"}])
+        if self.rng.random() < self.malformed_rate:
+            self.expected.cut = completion[:len(completion) // 2]
+            return SimpleNamespace(predictions=[{"content": self.expected.cut, "finishReason": "MAX_TOKENS"}])
+        return SimpleNamespace(predictions=[{"content": completion, "finishReason": "STOP"}])
+
+
+class FakeBigQueryClient:
+    """Stands in for google.cloud.bigquery.Client."""
+
+    def __init__(self, latency: LatencyModel, per_row_ms: float, failure_rate: float, row_error_rate: float,
+                 rng: random.Random):
+        self.latency = latency
+        self.per_row_ms = per_row_ms
+        self.failure_rate = failure_rate
+        self.row_error_rate = row_error_rate
+        self.rng = rng
+
+    def dataset(self, dataset_id: str, project: Optional[str] = None):
+        return SimpleNamespace(table=lambda table_id: f"{project}.{dataset_id}.{table_id}")
+
+    def insert_rows_json(self, table_ref: Any, rows: List[Dict[str, Any]], **kwargs) -> List[Dict[str, Any]]:
+        json.dumps(rows)
+        self.latency.sleep(self.per_row_ms * len(rows))
+        if self.rng.random() < self.failure_rate:
+            raise FakeServiceError("503 Service Unavailable (injected)")
+        return [{"index": i, "errors": [{"reason": "invalid", "message": "injected row error"}]}
+                for i in range(len(rows)) if self.rng.random() < self.row_error_rate]
+
+    def get_table(self, table_ref: Any) -> Any:
+        return table_ref
+
+    def close(self) -> None:
+        pass
+
+
+class StageRecorder:
+    """Thread-safe latency samples per stage, plus counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {}
+        self.counters: Dict[str, int] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds * 1000)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self.samples, self.counters = {}, {}
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    values = sorted(samples)
+    return {"count": len(values), "p50": round(percentile(values, 50), 2), "p95": round(percentile(values, 95), 2),
+            "p99": round(percentile(values, 99), 2)}
+
+
+def error_rates(counters: Dict[str, int]) -> Dict[str, float]:
+    """Share of each function's requests answered with a 4xx or 5xx status, from the status counters."""
+    rates = {}
+    for function in FUNCTIONS:
+        statuses = {name.rsplit("_", 1)[1]: count for name, count in counters.items()
+                    if name.startswith(f"{function}.status_")}
+        total = sum(statuses.values())
+        errors = sum(count for status, count in statuses.items() if int(status) >= 400)
+        rates[function] = round(errors / total, 4) if total else 0.0
+    return rates
+
+
+def load_function(module_name: str, directory: str):
+    """Import a function's main.py under its own module name, with its directory on sys.path."""
+    path = os.path.join(ROOT, directory)
+    sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(path, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def instrument(module: Any, name: str, stage: str, recorder: StageRecorder) -> None:
+    """Replace module.name with a wrapper that records its latency under stage."""
+    fn = getattr(module, name)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            recorder.add(stage, time.perf_counter() - start)
+
+    setattr(module, name, timed)
+
+
+def render_completion(update: Dict[str, Any], message: str = "") -> str:
+    """A completion in the shape medlm-large returns: fenced JSON with the record update."""
+    return "```json\n" + json.dumps({"updated_record": update, "message": message}, indent=2) + "\n```"
+
+
+def load_sessions(path: str, mode: str, limit: int) -> List[Dict[str, Any]]:
+    """Sessions as lists of (userMessage, completion) turns."""
+    sessions = []
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                row = json.loads(line)
+                if "record" not in row:
+                    raise SystemExit(f"{path} has no ground-truth records; generate it with --ground-truth")
+                sessions.append({"name": row["id"], "turns": [(row["dictation"], render_completion(row["record"]))]})
+                if len(sessions) >= limit:
+                    break
+        return sessions
+    with open(path) as f:
+        for session in json.load(f)[:limit]:
+            turns = [(turn["userMessage"], render_completion(turn["update"])) for turn in session["turns"]]
+            if mode == "dictation":
+                merged: Dict[str, Any] = {}
+                for turn in session["turns"]:
+                    for section, fields in turn["update"].items():
+                        for field, value in fields.items():
+                            target = merged.setdefault(section, {})
+                            if isinstance(value, list):
+                                target[field] = target.get(field, []) + value
+                            else:
+                                target[field] = value
+                turns = [(" ".join(turn["userMessage"] for turn in session["turns"]), render_completion(merged))]
+            sessions.append({"name": session["name"], "turns": turns})
+    return sessions
+
+
+class Harness:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.recorder = StageRecorder()
+        rng = random.Random(args.seed)
+        self.model = FakePredictionClient(LatencyModel(args.model_latency_ms, args.latency_sigma, rng),
+                                          args.model_failure_rate, args.malformed_rate, rng)
+        self.bigquery_client = FakeBigQueryClient(LatencyModel(args.bigquery_latency_ms, args.latency_sigma, rng),
+                                                  args.bigquery_row_ms, args.bigquery_failure_rate,
+                                                  args.bigquery_row_error_rate, rng)
+
+        self.dictation = load_function("bench_dictation_main", "medical-dictation-function")
+        self.bigquery = load_function("bench_bigquery_main", "submit-to-bigquery-function")
+        from flask import Flask
+        from medical_records.bigquery_client import BigQueryClientCache
+        self.app = Flask("bench_e2e")
+
+        # Swap the Google clients for the fakes; everything else runs unchanged
+        self.dictation.client = self.model
+        # Both functions share one InsertPath in this process
+        insert_path = self.bigquery.insert_path
+        insert_path.clients = BigQueryClientCache("bench-project", "bench_dataset", "bench_table",
+                                                  factory=lambda: self.bigquery_client)
+
+        record = self.recorder
+        for name in ("create_prompt", "create_dictation_prompt"):
+            instrument(self.dictation, name, "dictation.prompt", record)
+        instrument(self.dictation, "predict_content", "dictation.model", record)
+        instrument(self.dictation, "parse_completion", "dictation.json", record)
+        instrument(self.dictation, "finalize_response", "dictation.merge", record)
+        instrument(self.dictation, "medical_record_assistant", "dictation.request", record)
+        instrument(insert_path, "validate", "bigquery.validate", record)
+        instrument(insert_path, "insert_rows_with_retry", "bigquery.insert", record)
+        instrument(self.bigquery, "submit_to_bigquery", "bigquery.request", record)
+
+    def call(self, handler: Callable, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self.app.test_request_context("/", method="POST", json=payload):
+            from flask import request
+            result = handler(request)
+        response, status = result[0], result[1]
+        return status, response.get_json(silent=True) or {}
+
+    def run_session(self, session: Dict[str, Any], replay: str = "warm-up") -> None:
+        """Replay one session; `replay` names this replay, so its submission is a new row."""
+        record = copy.deepcopy(self.dictation.RECORD_SCHEMA)
+        current_prompt = self.dictation.prompt_generator.get_next_prompt(record)
+        for user_message, completion in session["turns"]:
+            self.model.expected.completion = completion
+            payload = {"userMessage": user_message, "currentRecord": record, "currentPrompt": current_prompt,
+                       "promptMode": self.args.prompt_mode}
+            if self.args.mode == "dictation":
+                payload["mode"] = "dictation"
+            status, body = self.call(self.dictation.medical_record_assistant, payload)
+            self.recorder.count(f"dictation.status_{status}")
+            if status == 200:
+                record, current_prompt = body["updated_record"], body.get("next_prompt")
+
+        # Replays submit identical records. Without a key per replay, every one after the first would be
+        # answered from the receipt cache as a duplicate and the insert would not be measured.
+        status, body = self.call(self.bigquery.submit_to_bigquery,
+                                 {"record": record, "idempotencyKey": f"bench-{session['name']}-{replay}"})
+        self.recorder.count(f"bigquery.status_{status}")
+
+    def run_level(self, sessions: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+        work = sessions * self.args.iterations
+        replays = [f"c{concurrency}-{index}" for index in range(len(work))]
+        self.recorder.reset()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(self.run_session, work, replays))
+        elapsed = time.perf_counter() - start
+        requests = sum(len(session["turns"]) + 1 for session in work)
+        counters = dict(sorted(self.recorder.counters.items()))
+        return {
+            "concurrency": concurrency,
+            "sessions": len(work),
+            "seconds": round(elapsed, 3),
+            "sessions_per_second": round(len(work) / elapsed, 2),
+            "requests_per_second": round(requests / elapsed, 2),
+            "stages": {stage: summarize(values) for stage, values in sorted(self.recorder.samples.items())},
+            "counters": counters,
+            "error_rates": error_rates(counters),
+        }
+
+
+def print_level(result: Dict[str, Any]) -> None:
+    print(f"\nconcurrency {result['concurrency']}: {result['sessions']} sessions in {result['seconds']:.2f}s, "
+          f"{result['sessions_per_second']:.1f} sessions/s, {result['requests_per_second']:.1f} requests/s")
+    print(f"  {'stage':<20}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in result["stages"].items():
+        print(f"  {stage:<20}{stats['count']:>7}{stats['p50']:>10.2f}{stats['p95']:>10.2f}{stats['p99']:>10.2f}")
+    print("  " + ", ".join(f"{name}={value}" for name, value in result["counters"].items()))
+    print("  error rate " + ", ".join(f"{function} {rate:.1%}" for function, rate in result["error_rates"].items()))
+
+
+def find_regressions(results: List[Dict[str, Any]], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Stages whose p95, or levels whose throughput or per-function error rate, got worse than the baseline allows."""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in results:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        concurrency = level["concurrency"]
+        if level["requests_per_second"] < before["requests_per_second"] * (1 - max_regression):
+            regressions.append(f"concurrency {concurrency}: throughput {before['requests_per_second']} -> "
+                               f"{level['requests_per_second']} requests/s")
+        for stage, stats in level["stages"].items():
+            old = before["stages"].get(stage)
+            if old and stats["p95"] > old["p95"] * (1 + max_regression) and stats["p95"] - old["p95"] > REGRESSION_NOISE_MS:
+                regressions.append(f"concurrency {concurrency}: {stage} p95 {old['p95']} -> {stats['p95']} ms")
+        # Older baselines have only the status counters
+        old_rates = before.get("error_rates") or error_rates(before.get("counters", {}))
+        for function, rate in level["error_rates"].items():
+            old_rate = old_rates.get(function, 0.0)
+            if rate - old_rate > REGRESSION_NOISE_ERROR_RATE:
+                regressions.append(f"concurrency {concurrency}: {function} error rate {old_rate:.1%} -> {rate:.1%}")
+    return regressions
+
+
+def find_errors(results: List[Dict[str, Any]], max_error_rate: float) -> List[str]:
+    """Levels where a function answered more than max_error_rate of its requests with an error."""
+    return [f"concurrency {level['concurrency']}: {function} error rate {rate:.1%}"
+            for level in results for function, rate in level["error_rates"].items() if rate > max_error_rate]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", default=SESSIONS_PATH, help="sessions.json or ground-truth JSONL")
+    parser.add_argument("--max-sessions", type=int, default=1000, help="sessions to load from --sessions")
+    parser.add_argument("--mode", choices=["turn", "dictation"], default="turn")
+    parser.add_argument("--prompt-mode", choices=["full", "compact"], default="full")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--iterations", type=int, default=5, help="times each session is replayed per level")
+    parser.add_argument("--model-latency-ms", type=float, default=50.0, help="median fake model latency")
+    parser.add_argument("--model-failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="share of completions cut off at the token limit")
+    parser.add_argument("--bigquery-latency-ms", type=float, default=20.0, help="median fake insert latency")
+    parser.add_argument("--bigquery-row-ms", type=float, default=0.1, help="extra insert latency per row")
+    parser.add_argument("--bigquery-failure-rate", type=float, default=0.0)
+    parser.add_argument("--bigquery-row-error-rate", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="log-normal spread of fake latencies")
+    parser.add_argument("--prediction-cache", action="store_true", help="keep the prediction cache enabled")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown vs the baseline")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="share of error responses allowed per function (raise it when injecting failures)")
+    parser.add_argument("--verbose", action="store_true", help="show the functions' log output")
+    args = parser.parse_args()
+
+    if args.sessions.endswith(".jsonl"):
+        args.mode = "dictation"
+
+    # Configure the functions before they are imported
+    if not args.prediction_cache:
+        os.environ["PREDICTION_CACHE_SIZE"] = "0"
+    os.environ["INSERT_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench_e2e_"), "queue.db")
+    # Every virtual user shares one address and the fakes have no quota; bench_admission.py covers admission control
+    os.environ.setdefault("RATE_LIMIT_PER_MINUTE", "0")
+    os.environ.setdefault("MODEL_MAX_CONCURRENCY", "0")
+
+    harness = Harness(args)
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    sessions = load_sessions(args.sessions, args.mode, args.max_sessions)
+    if not sessions:
+        raise SystemExit(f"No sessions in {args.sessions}")
+
+    # Warm up lazily created clients and code indexes outside the measurements
+    harness.run_session(sessions[0])
+
+    results = []
+    for concurrency in [int(value) for value in args.concurrency.split(",")]:
+        result = harness.run_level(sessions, concurrency)
+        print_level(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "levels": results}, f, indent=2)
+    failed = False
+    errors = find_errors(results, args.max_error_rate)
+    if errors:
+        print(f"\nError rate above {args.max_error_rate:.1%}:")
+        for error in errors:
+            print(f"  {error}")
+        failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            failed = True
+        else:
+            print("\nNo regressions against the baseline.")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Duplicate rows from retries and resubmissions, with failures injected after a write succeeds.
+
+Submits --records synthetic records through the shared InsertPath against a
+fake BigQuery table. The fake honours insertIds the way BigQuery does and,
+when asked to, fails an insert after storing its rows (--fail-after-write), as
+when a response times out after BigQuery accepted the rows. It can also fail
+before storing them (--fail-before-write). On top of that:
+
+- a share of records is resubmitted by hand after the first submission
+  returns (--resubmit-rate);
+- a share is sent by two clients at the same time (--concurrent-rate);
+- records whose receipt is an error are retried once more by the client.
+
+Each mode runs with the insert ids and receipt cache, and once as before
+(no insertIds, no receipt cache) for comparison. Reported per run: rows
+stored, duplicate rows, acknowledged records missing from the table,
+BigQuery calls, and submissions answered from the receipt cache. The exit
+status is 1 if, with insert ids, any mode stores a record twice or loses one
+whose receipt said inserted or queued.
+
+    python benchmarks/bench_idempotency.py --records 200 --fail-after-write 0.2
+    python benchmarks/bench_idempotency.py --modes async --fail-before-write 0.1
+"""
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+sys.path.insert(0, os.path.join(ROOT, "generate-field-report-function"))
+
+from medical_records.insert_path import InsertPath  # noqa: E402
+from medical_records.retry import RetryPolicy  # noqa: E402
+from template_reports import TemplateReportBackend  # noqa: E402
+
+MODES = ("sync", "bulk", "async")
+
+
+class FakeTable:
+    """Stores rows like BigQuery streaming inserts, optionally failing around the write."""
+
+    def __init__(self, rng: random.Random, fail_before: float, fail_after: float, honor_row_ids: bool):
+        self.rng = rng
+        self.fail_before = fail_before
+        self.fail_after = fail_after
+        self.honor_row_ids = honor_row_ids
+        self.lock = threading.Lock()
+        self.rows: List[Dict[str, Any]] = []
+        self.seen_ids: set = set()
+        self.calls = 0
+
+    def dataset(self, dataset_id: str, project: Optional[str] = None):
+        return self
+
+    def table(self, table_id: str) -> str:
+        return table_id
+
+    def insert_rows_json(self, table_ref: Any, rows: List[Dict[str, Any]], row_ids: Optional[List[str]] = None,
+                         **kwargs) -> List[Dict[str, Any]]:
+        with self.lock:
+            self.calls += 1
+            if self.rng.random() < self.fail_before:
+                raise TimeoutError("injected timeout before the write")
+            for index, row in enumerate(rows):
+                row_id = row_ids[index] if row_ids and self.honor_row_ids else None
+                if row_id is not None and row_id in self.seen_ids:
+                    continue  # BigQuery drops rows whose insertId it has seen recently
+                self.seen_ids.add(row_id)
+                self.rows.append(row)
+            if self.rng.random() < self.fail_after:
+                raise TimeoutError("injected timeout after the write succeeded")
+        return []
+
+    def close(self):
+        pass
+
+
+def record_key(record: Dict[str, Any]) -> tuple:
+    return record["patient"]["medical_record_number"], record["procedure"]["date"]
+
+
+def run(args: argparse.Namespace, mode: str, idempotent: bool) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    backend = TemplateReportBackend(args.seed)
+    records = [backend.generate_example(index)[1] for index in range(args.records)]
+    table = FakeTable(random.Random(args.seed + 1), args.fail_before_write, args.fail_after_write, idempotent)
+    directory = tempfile.mkdtemp(prefix="bench_idempotency_")
+    path = InsertPath("bench", "health", "usu_procedures", os.path.join(directory, "queue.db"), lambda: table)
+    path.insert_retry_policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01, deadline=5.0)
+    path.queue_retry_policy = RetryPolicy(base_delay=0.01, max_delay=0.05)
+    if not idempotent:
+        path.receipts.max_entries = 0
+
+    duplicates_answered = 0
+    errors = 0
+    acknowledged: set = set()
+    lock = threading.Lock()
+
+    def submit(batch: List[Dict[str, Any]]) -> None:
+        nonlocal duplicates_answered, errors
+        if mode == "sync":
+            receipts = [path.submit(record) for record in batch]
+        else:
+            receipts = path.submit_many(batch, async_mode=mode == "async")
+        retry = [record for record, receipt in zip(batch, receipts) if receipt["status"] == "error"]
+        if retry:
+            # The client sees an error and tries again
+            receipts += path.submit_many(retry, async_mode=mode == "async")
+        with lock:
+            acknowledged.update(record_key(record) for record, receipt in zip(batch + retry, receipts)
+                                if receipt["status"] in ("inserted", "queued"))
+            duplicates_answered += sum(1 for receipt in receipts if receipt.get("duplicate"))
+            errors += sum(1 for receipt in receipts if receipt["status"] == "error")
+
+    batches: List[List[Dict[str, Any]]] = []
+    size = 1 if mode == "sync" else args.batch_size
+    for start in range(0, len(records), size):
+        batch = records[start:start + size]
+        batches.append(batch)
+        if rng.random() < args.concurrent_rate:
+            batches.append(list(batch))  # the same request from a second client at the same time
+    resubmitted = [[record] for record in records if rng.random() < args.resubmit_rate]
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(submit, batches))
+        # Hand resubmissions come after the first submissions have returned
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(submit, resubmitted))
+        if mode == "async":
+            queue = path.get_queue()
+            deadline = time.monotonic() + 30
+            while queue.depth() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            path._queue_worker.stop(timeout=5)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    elapsed = time.perf_counter() - start
+
+    keys = [record_key(row) for row in table.rows]
+    return {
+        "rows": len(table.rows),
+        "duplicates": len(keys) - len(set(keys)),
+        "missing": len(acknowledged - set(keys)),
+        "calls": table.calls,
+        "answered_from_cache": duplicates_answered,
+        "error_receipts": errors,
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--modes", default=",".join(MODES), help=f"comma-separated: {', '.join(MODES)}")
+    parser.add_argument("--batch-size", type=int, default=20, help="records per bulk or async request")
+    parser.add_argument("--fail-after-write", type=float, default=0.2, help="share of inserts failing after the write")
+    parser.add_argument("--fail-before-write", type=float, default=0.05, help="share of inserts failing before it")
+    parser.add_argument("--resubmit-rate", type=float, default=0.2, help="share of records resubmitted by hand")
+    parser.add_argument("--concurrent-rate", type=float, default=0.1, help="share of requests sent twice at once")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)  # the injected failures are expected
+
+    failed = False
+    for mode in args.modes.split(","):
+        print(f"{mode}")
+        for idempotent in (False, True):
+            result = run(args, mode, idempotent)
+            name = "insert ids + receipts" if idempotent else "before (no insert ids)"
+            print(f"  {name:<24} rows {result['rows']:>5}  duplicates {result['duplicates']:>4}  "
+                  f"missing {result['missing']:>3}  BigQuery calls {result['calls']:>5}  "
+                  f"from cache {result['answered_from_cache']:>4}  error receipts {result['error_receipts']:>3}  "
+                  f"{result['elapsed_s']:.2f} s")
+            if idempotent and (result["duplicates"] or result["missing"]):
+                failed = True
+    if failed:
+        print("\nWith insert ids, a record was stored twice or an acknowledged record was lost")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
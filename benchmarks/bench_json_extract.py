@@ -0,0 +1,95 @@
+"""Compare the tolerant JSON extractor with the previous sanitize -> reparse path.
+
+Runs every completion in benchmarks/data/malformed_completions.jsonl through
+both paths, reports which ones each path accepts, and measures throughput.
+
+    python benchmarks/bench_json_extract.py --iterations 2000
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "medical-dictation-function"))
+
+from json_extract import extract_json_object  # noqa: E402
+
+CORPUS_PATH = os.path.join(ROOT, "benchmarks", "data", "malformed_completions.jsonl")
+
+
+def legacy_sanitize_json_string(json_string):
+    """The sanitize_json_string implementation this extractor replaced."""
+    json_string = json_string.strip().lstrip('﻿')
+    json_string = json_string.strip()
+    json_string = re.sub(r'//.*?$|/\*.*?\*/', '', json_string, flags=re.MULTILINE | re.DOTALL)
+    try:
+        parsed_json = json.loads(json_string)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {str(e)}")
+
+    class CustomJSONEncoder(json.JSONEncoder):
+        def encode(self, obj):
+            if isinstance(obj, str):
+                return json.dumps(obj, ensure_ascii=False)
+            return super().encode(obj)
+
+    return json.dumps(parsed_json, cls=CustomJSONEncoder, ensure_ascii=False, indent=2)
+
+
+def legacy_path(text):
+    return json.loads(legacy_sanitize_json_string(text))
+
+
+def accepts(parse, text):
+    try:
+        return isinstance(parse(text), dict)
+    except ValueError:
+        return False
+
+
+def throughput(parse, texts, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            parse(text)
+    elapsed = time.perf_counter() - start
+    return iterations * len(texts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = [json.loads(line) for line in f]
+
+    print(f"{'case':<40}{'expected':>10}{'legacy':>8}{'new':>6}")
+    mismatches = 0
+    for case in corpus:
+        legacy_ok = accepts(legacy_path, case["completion"])
+        new_ok = accepts(extract_json_object, case["completion"])
+        mismatches += new_ok != case["expect_ok"]
+        print(f"{case['name']:<40}{str(case['expect_ok']):>10}{str(legacy_ok):>8}{str(new_ok):>6}")
+
+    parseable = [case["completion"] for case in corpus if case["expect_ok"]]
+    legacy_total = sum(accepts(legacy_path, text) for text in parseable)
+    new_total = sum(accepts(extract_json_object, text) for text in parseable)
+    print(f"\nparseable completions accepted: legacy {legacy_total}/{len(parseable)}, new {new_total}/{len(parseable)}")
+    if mismatches:
+        print(f"WARNING: {mismatches} case(s) did not match the expected result")
+
+    # Throughput over the completions both paths accept, so the comparison is like for like.
+    common = [case["completion"] for case in corpus
+              if accepts(legacy_path, case["completion"]) and accepts(extract_json_object, case["completion"])]
+    legacy_rate = throughput(legacy_path, common, args.iterations)
+    new_rate = throughput(extract_json_object, common, args.iterations)
+    print(f"throughput on {len(common)} common completions: legacy {legacy_rate:,.0f}/s, new {new_rate:,.0f}/s "
+          f"({new_rate / legacy_rate:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Accuracy and latency of the rule-based pre-extractor.
+
+For each supported field, the extractor is asked to parse messages as if they
+answered the prompt for that field. Three sources are used:
+
+- benchmarks/data/short_answers.jsonl: hand-written answers, with the
+  expected update or null where the model should handle the message.
+- benchmarks/data/sessions.json: every turn of the sample sessions.
+- synthetic field reports: each sentence of --reports template dictations,
+  plus short answers spoken the same way as the dictations.
+
+A fill is correct when every filled field equals the ground truth. A wrong
+fill would bypass the model with a bad value, so the exit status is 1 if
+there are more than --max-wrong. Coverage is the share of answers (or
+session turns) setting the field that were filled without the model; it is
+not shown for report sentences, most of which are about other things.
+
+    python benchmarks/bench_pre_extract.py --reports 200
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "medical-dictation-function"))
+sys.path.insert(0, os.path.join(ROOT, "generate-field-report-function"))
+
+from pre_extract import SUPPORTED_FIELDS, pre_extract  # noqa: E402
+from template_reports import TemplateReportBackend, ordinal, spoken_number  # noqa: E402
+
+SHORT_ANSWERS_PATH = os.path.join(ROOT, "benchmarks", "data", "short_answers.jsonl")
+SESSIONS_PATH = os.path.join(ROOT, "benchmarks", "data", "sessions.json")
+
+# (source, field, message, truth): truth is the known record values, or None if there are none to compare with
+Case = Tuple[str, str, str, Optional[Dict[str, Dict[str, Any]]]]
+
+
+def short_answer_cases() -> Iterator[Case]:
+    with open(SHORT_ANSWERS_PATH) as f:
+        for line in f:
+            case = json.loads(line)
+            yield "short_answers", case["field"], case["userMessage"], case["expected"]
+
+
+def session_cases() -> Iterator[Case]:
+    with open(SESSIONS_PATH) as f:
+        sessions = json.load(f)
+    for session in sessions:
+        for turn in session["turns"]:
+            for field in SUPPORTED_FIELDS:
+                yield "sessions", field, turn["userMessage"], turn.get("update")
+
+
+def report_cases(count: int, seed: int) -> Iterator[Case]:
+    backend = TemplateReportBackend(seed)
+    for index in range(count):
+        dictation, record = backend.generate_example(index)
+        patient, date = record["patient"], datetime.date.fromisoformat(record["procedure"]["date"])
+        answers = {
+            "patient.age": f"{spoken_number(patient['age'])} years old",
+            "patient.sex": patient["sex"],
+            "patient.medical_record_number": ", ".join(spoken_number(int(d)) for d in patient["medical_record_number"]),
+            "procedure.date": f"{date.strftime('%B')} {ordinal(date.day)}, {date.year}",
+        }
+        for field, answer in answers.items():
+            yield "report_answers", field, answer, record
+        for sentence in re.split(r"(?<=[.!?])\s+", dictation):
+            for field in SUPPORTED_FIELDS:
+                yield "report_sentences", field, sentence, record
+
+
+def agrees(update: Dict[str, Dict[str, Any]], truth: Dict[str, Dict[str, Any]]) -> bool:
+    return all(truth.get(section, {}).get(key) == value for section, fields in update.items() for key, value in fields.items())
+
+
+def has_value(field: str, truth: Optional[Dict[str, Dict[str, Any]]]) -> bool:
+    section, key = field.split(".")
+    return bool(truth and truth.get(section, {}).get(key))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reports", type=int, default=100, help="synthetic field reports to include")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-wrong", type=int, default=0, help="wrong fills allowed before exiting with 1")
+    parser.add_argument("--show-wrong", action="store_true", help="print the messages that were filled wrongly")
+    args = parser.parse_args()
+
+    cases: List[Case] = [*short_answer_cases(), *session_cases(), *report_cases(args.reports, args.seed)]
+    stats: Dict[Tuple[str, str], Dict[str, int]] = {}
+    latencies: List[float] = []
+    wrong_cases = []
+    for source, field, message, truth in cases:
+        start = time.perf_counter()
+        update = pre_extract(message, field)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        row = stats.setdefault((source, field), {"cases": 0, "answerable": 0, "filled": 0, "correct": 0, "wrong": 0})
+        row["cases"] += 1
+        # Hand-written cases state the expected outcome; the others are judged against the record
+        answerable = truth is not None if source == "short_answers" else has_value(field, truth)
+        row["answerable"] += answerable
+        if update is None:
+            if source == "short_answers" and truth is not None:
+                wrong_cases.append((source, field, message, "missed", truth))
+            continue
+        row["filled"] += 1
+        correct = update == truth if source == "short_answers" else truth is not None and agrees(update, truth)
+        row["correct" if correct else "wrong"] += 1
+        if not correct:
+            wrong_cases.append((source, field, message, update, truth))
+
+    print(f"{'source':<18}{'field':<32}{'cases':>7}{'filled':>8}{'correct':>9}{'wrong':>7}{'coverage':>10}")
+    for (source, field), row in sorted(stats.items()):
+        coverage = f"{row['correct'] / row['answerable']:.0%}" if row["answerable"] and source != "report_sentences" else "-"
+        print(f"{source:<18}{field:<32}{row['cases']:>7}{row['filled']:>8}{row['correct']:>9}{row['wrong']:>7}"
+              f"{coverage:>10}")
+    latencies.sort()
+    print(f"\nlatency per message  p50 {statistics.median(latencies):.1f} us  "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.1f} us  max {latencies[-1]:.1f} us")
+
+    wrong = sum(row["wrong"] for row in stats.values())
+    missed = sum(1 for case in wrong_cases if case[3] == "missed")
+    print(f"wrong fills {wrong}, expected fills missed {missed}")
+    if args.show_wrong:
+        for source, field, message, update, truth in wrong_cases:
+            print(f"  [{source}] {field}: {message!r} -> {update}")
+    if wrong > args.max_wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compare full and compact prompt sizes over sample dictation sessions.
+
+Replays benchmarks/data/sessions.json turn by turn and builds the prompt for
+each turn in both modes. Tokens are approximated by counting word and
+punctuation runs, which tracks SentencePiece token counts closely enough to
+compare the two modes.
+
+    python benchmarks/bench_prompt_size.py
+"""
+import copy
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "medical-dictation-function"))
+
+from prompts import PROMPT_MODE_COMPACT, PROMPT_MODE_FULL, create_prompt  # noqa: E402
+from medical_records.record_schema import RECORD_SCHEMA, PromptGenerator  # noqa: E402
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+SESSIONS_PATH = os.path.join(ROOT, "benchmarks", "data", "sessions.json")
+
+
+def approx_tokens(text):
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def apply_update(record, update):
+    for section, fields in update.items():
+        record[section].update(fields)
+
+
+def main():
+    with open(SESSIONS_PATH) as f:
+        sessions = json.load(f)
+    prompt_generator = PromptGenerator()
+    totals = {mode: {"bytes": 0, "tokens": 0, "seconds": 0.0} for mode in (PROMPT_MODE_FULL, PROMPT_MODE_COMPACT)}
+
+    print(f"{'session':<24}{'turn':>5}{'full B':>9}{'compact B':>11}{'full tok':>10}{'compact tok':>13}")
+    for session in sessions:
+        record = copy.deepcopy(RECORD_SCHEMA)
+        current_prompt = prompt_generator.get_next_prompt(record)
+        for turn_number, turn in enumerate(session["turns"], 1):
+            row = {}
+            for mode in totals:
+                start = time.perf_counter()
+                prompt = create_prompt(turn["userMessage"], record, current_prompt, mode=mode,
+                                       missing_fields=prompt_generator.missing_fields(record))
+                totals[mode]["seconds"] += time.perf_counter() - start
+                size, tokens = len(prompt.encode("utf-8")), approx_tokens(prompt)
+                totals[mode]["bytes"] += size
+                totals[mode]["tokens"] += tokens
+                row[mode] = (size, tokens)
+            print(f"{session['name']:<24}{turn_number:>5}{row['full'][0]:>9}{row['compact'][0]:>11}"
+                  f"{row['full'][1]:>10}{row['compact'][1]:>13}")
+            apply_update(record, turn["update"])
+            current_prompt = prompt_generator.get_next_prompt(record)
+
+    full, compact = totals[PROMPT_MODE_FULL], totals[PROMPT_MODE_COMPACT]
+    print()
+    print(f"total bytes   full {full['bytes']:>8}  compact {compact['bytes']:>8}  "
+          f"reduction {1 - compact['bytes'] / full['bytes']:.1%}")
+    print(f"total tokens  full {full['tokens']:>8}  compact {compact['tokens']:>8}  "
+          f"reduction {1 - compact['tokens'] / full['tokens']:.1%}")
+    print(f"build time    full {full['seconds'] * 1000:.2f} ms  compact {compact['seconds'] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
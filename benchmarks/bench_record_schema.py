@@ -0,0 +1,111 @@
+"""Benchmark the compiled required-field schema and check it against validate_record.
+
+The previous code split dotted field paths on every call and walked two
+separately maintained field lists (one for prompting, one for completeness).
+This compares that with CompiledSchema.missing_fields, which answers both in
+one pass. It also reports, over randomly blanked records, how many records
+the dictation function marks ready_to_insert that validate_record in
+submit-to-bigquery would reject; tests/test_record_schema.py asserts there
+are none.
+
+    python benchmarks/bench_record_schema.py --records 2000
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+
+from medical_records.record_schema import COMPILED_SCHEMA, REQUIRED_FIELDS  # noqa: E402
+from medical_records.validation import validate_record  # noqa: E402
+
+# The completeness list is_record_complete used before it was unified.
+LEGACY_COMPLETE_FIELDS = [
+    "patient.name", "patient.age", "patient.sex", "procedure.date",
+    "procedure.location", "procedure.procedures_performed", "coding.cpt",
+]
+
+FULL_RECORD = {
+    "patient": {"name": "John Doe", "age": 28, "sex": "male", "medical_record_number": "1234567890"},
+    "procedure": {
+        "date": "2023-10-27", "location": "Field Surgical Unit Alpha",
+        "preoperative_diagnosis": "Gunshot wound to the right lower extremity",
+        "postoperative_diagnosis": "Transection of the superficial femoral artery",
+        "procedures_performed": ["Fasciotomy"], "surgeon": "Captain Jane Smith",
+        "assistant_surgeon": "", "anesthesiologist": "", "estimated_blood_loss": "",
+        "fluids_administered": "", "complications": "", "disposition": "",
+    },
+    "coding": {"snomed_ct": [], "icd_10": [], "cpt": [{"code": "27892", "description": "Decompression fasciotomy"}]},
+}
+
+
+def legacy_is_field_complete(record, field):
+    value = record
+    for key in field.split('.'):
+        value = value.get(key, {})
+    return bool(value)
+
+
+def legacy_turn(record):
+    """What one turn cost before: a next-prompt scan plus a separate completeness scan."""
+    next_field = next((f for f in REQUIRED_FIELDS if not legacy_is_field_complete(record, f)), None)
+    complete = all(legacy_is_field_complete(record, f) for f in LEGACY_COMPLETE_FIELDS)
+    return next_field, complete
+
+
+def compiled_turn(record):
+    missing = COMPILED_SCHEMA.missing_fields(record)
+    return (missing[0] if missing else None), not missing
+
+
+def random_records(count, seed):
+    rng = random.Random(seed)
+    blanks = {"patient": {"name": "", "age": 0, "sex": "", "medical_record_number": ""},
+              "coding": {"cpt": []}}
+    records = []
+    for _ in range(count):
+        record = copy.deepcopy(FULL_RECORD)
+        for path in rng.sample(REQUIRED_FIELDS, rng.randint(0, 3)):
+            section, field = path.split(".")
+            record[section][field] = blanks.get(section, {}).get(field, [] if field == "procedures_performed" else "")
+        records.append(record)
+    return records
+
+
+def time_it(fn, records, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            fn(record)
+    return (time.perf_counter() - start) / (repeat * len(records)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    records = random_records(args.records, args.seed)
+
+    inconsistent = 0
+    for record in records:
+        if COMPILED_SCHEMA.is_complete(record) and not validate_record(record)[0]:
+            inconsistent += 1
+    complete = sum(COMPILED_SCHEMA.is_complete(r) for r in records)
+    print(f"consistency: {complete} of {len(records)} records complete, "
+          f"{inconsistent} complete records rejected by validate_record")
+
+    legacy_us = time_it(legacy_turn, records, args.repeat)
+    compiled_us = time_it(compiled_turn, records, args.repeat)
+    print(f"per turn: legacy {legacy_us:.2f} us, compiled {compiled_us:.2f} us ({legacy_us / compiled_us:.1f}x)")
+    sys.exit(1 if inconsistent else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Coalescing of duplicate in-flight model calls, with a slow fake model.
+
+Simulates the frontend sending each dictation turn more than once (double
+taps, resends after a timeout): --requests distinct prompts, each sent by
+--duplicates threads within --jitter-ms of each other, against a fake model
+that takes --model-latency-ms per call. Runs once with the SingleFlight used
+by medical_record_assistant and once without it. For each run it reports the
+model calls made, the calls coalesced and the latency per request.
+
+Every caller must receive the completion of the call it shared, including
+the same exception when the model fails (--failure-rate). The exit status is
+1 if any caller got a different result.
+
+    python benchmarks/bench_single_flight.py --requests 50 --duplicates 4
+    python benchmarks/bench_single_flight.py --model-latency-ms 800 --jitter-ms 200 --failure-rate 0.1
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "medical-dictation-function"))
+
+from single_flight import SingleFlight  # noqa: E402
+
+
+class FakeModelError(Exception):
+    pass
+
+
+class SlowFakeModel:
+    """Returns a completion unique to each call after a fixed delay, failing some prompts."""
+
+    def __init__(self, latency: float, failing_prompts: set):
+        self.latency = latency
+        self.failing_prompts = failing_prompts
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def predict(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+            call_id = self.calls
+        time.sleep(self.latency)
+        if prompt in self.failing_prompts:
+            raise FakeModelError(f"call {call_id} failed")
+        return f"completion of call {call_id} for {prompt}"
+
+
+def run(args: argparse.Namespace, coalesce: bool) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    prompts = [f"prompt {index}" for index in range(args.requests)]
+    failing = {prompt for prompt in prompts if rng.random() < args.failure_rate}
+    model = SlowFakeModel(args.model_latency_ms / 1000, failing)
+    flight = SingleFlight()
+    coalesced = 0
+    coalesced_lock = threading.Lock()
+
+    # Each prompt is sent `duplicates` times; copies start within `jitter` of the first
+    schedule = [(prompt, index * args.spacing_ms / 1000 + rng.uniform(0, args.jitter_ms / 1000))
+                for index, prompt in enumerate(prompts) for _ in range(args.duplicates)]
+    start = time.perf_counter()
+
+    def count_coalesced():
+        nonlocal coalesced
+        with coalesced_lock:
+            coalesced += 1
+
+    def send(prompt: str, at: float) -> Dict[str, Any]:
+        time.sleep(max(0.0, start + at - time.perf_counter()))
+        sent = time.perf_counter()
+        try:
+            if coalesce:
+                result = flight.do(prompt, lambda: model.predict(prompt), on_join=count_coalesced)
+            else:
+                result = model.predict(prompt)
+            outcome = ("ok", result)
+        except FakeModelError as e:
+            outcome = ("error", id(e) if coalesce else str(e))
+        return {"prompt": prompt, "outcome": outcome, "seconds": time.perf_counter() - sent}
+
+    with ThreadPoolExecutor(max_workers=len(schedule)) as pool:
+        responses = list(pool.map(lambda item: send(*item), schedule))
+    elapsed = time.perf_counter() - start
+
+    # Copies of a prompt that overlapped must have the same outcome
+    mismatches = 0
+    if coalesce:
+        by_prompt: Dict[str, List[Any]] = {}
+        for response in responses:
+            by_prompt.setdefault(response["prompt"], []).append(response["outcome"])
+        overlapping = args.jitter_ms < args.model_latency_ms
+        mismatches = sum(1 for outcomes in by_prompt.values() if overlapping and len(set(outcomes)) > 1)
+
+    latencies = sorted(response["seconds"] * 1000 for response in responses)
+    return {
+        "requests": len(responses),
+        "model_calls": model.calls,
+        "coalesced": coalesced,
+        "errors": sum(1 for response in responses if response["outcome"][0] == "error"),
+        "mismatches": mismatches,
+        "in_flight_after": flight.in_flight(),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50, help="distinct prompts")
+    parser.add_argument("--duplicates", type=int, default=3, help="copies of each prompt")
+    parser.add_argument("--model-latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="spread of the copies of one prompt")
+    parser.add_argument("--spacing-ms", type=float, default=5.0, help="delay between distinct prompts")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of prompts the model fails")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = {"without coalescing": run(args, coalesce=False), "with coalescing": run(args, coalesce=True)}
+    for name, result in results.items():
+        print(f"{name}")
+        print(f"  requests {result['requests']}  model calls {result['model_calls']}  "
+              f"coalesced {result['coalesced']}  errors {result['errors']}")
+        print(f"  latency p50 {result['p50_ms']:.1f} ms  p95 {result['p95_ms']:.1f} ms  "
+              f"elapsed {result['elapsed_s']:.2f} s")
+
+    coalesced = results["with coalescing"]
+    if coalesced["mismatches"] or coalesced["in_flight_after"]:
+        print(f"\n{coalesced['mismatches']} prompts whose copies got different results; "
+              f"{coalesced['in_flight_after']} calls left in flight")
+        sys.exit(1)
+    if coalesced["model_calls"] + coalesced["coalesced"] != coalesced["requests"]:
+        print("\nModel calls and coalesced calls do not add up to the requests sent")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
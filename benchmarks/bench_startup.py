@@ -0,0 +1,176 @@
+"""Cold-start benchmark for the three Cloud Functions.
+
+Each run starts a fresh Python process, the way a new Cloud Functions
+instance does. The process imports the function's main.py and then sends it
+a first request and a second one. Reported per function:
+
+- import time
+- which heavy SDKs were already imported after startup
+- latency of the first and second request
+
+The requests are a CORS preflight and, where the function validates its
+input, an invalid request. Neither needs Google Cloud credentials, and
+neither should load a model or BigQuery client.
+
+Save a run with --json and compare later runs against it with --baseline
+(exit status 1 on regression). --importtime N prints the N slowest imports
+of each function (python -X importtime).
+
+Requires the functions' dependencies (pip install -r <function>/requirements.txt).
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --warm-up blocking
+    python benchmarks/bench_startup.py --json startup.json
+    python benchmarks/bench_startup.py --baseline startup.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (directory, handler, requests sent after import: name -> (method, JSON body))
+FUNCTIONS = {
+    "medical-dictation": ("medical-dictation-function", "medical_record_assistant", {
+        "preflight": ("OPTIONS", None),
+        "invalid": ("POST", {"userMessage": "", "currentRecord": {}}),
+    }),
+    "generate-field-report": ("generate-field-report-function", "generate_field_report_http", {
+        "preflight": ("OPTIONS", None),
+    }),
+    "submit-to-bigquery": ("submit-to-bigquery-function", "submit_to_bigquery", {
+        "preflight": ("OPTIONS", None),
+        "invalid": ("POST", {}),
+    }),
+}
+
+# Modules whose presence after import means an SDK was loaded eagerly
+HEAVY_MODULES = ("google.cloud.aiplatform", "vertexai", "google.cloud.bigquery", "google.protobuf", "cryptography")
+
+# Differences below this many milliseconds are treated as noise when comparing with a baseline
+REGRESSION_NOISE_MS = 5.0
+
+CHILD = r"""
+import importlib.util, json, os, sys, time
+directory, handler_name, requests = json.loads(sys.argv[1])
+sys.path.insert(0, directory)
+os.chdir(directory)
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("main", os.path.join(directory, "main.py"))
+main = importlib.util.module_from_spec(spec)
+sys.modules["main"] = main
+spec.loader.exec_module(main)
+result = {"import_ms": (time.perf_counter() - start) * 1000,
+          "modules": sorted(name for name in sys.modules if name.partition(".")[0] in ("google", "vertexai", "cryptography"))}
+from flask import Flask, request
+app = Flask("bench_startup")
+handler = getattr(main, handler_name)
+for name, (method, body) in requests.items():
+    for attempt in ("first", "second"):
+        with app.test_request_context("/", method=method, json=body):
+            start = time.perf_counter()
+            handler(request)
+            result[f"{name}_{attempt}_ms"] = (time.perf_counter() - start) * 1000
+print(json.dumps(result))
+"""
+
+
+def run_once(function: str, env: Dict[str, str]) -> Dict[str, Any]:
+    directory, handler, requests = FUNCTIONS[function]
+    argument = json.dumps([os.path.join(ROOT, directory), handler, requests])
+    completed = subprocess.run([sys.executable, "-c", CHILD, argument], env=env,
+                               capture_output=True, text=True, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{function} failed to start:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(function: str, env: Dict[str, str], top: int) -> List[str]:
+    """The `top` imports with the highest cumulative time, from python -X importtime."""
+    directory, handler, requests = FUNCTIONS[function]
+    argument = json.dumps([os.path.join(ROOT, directory), handler, {}])
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILD, argument], env=env,
+                               capture_output=True, text=True, check=False)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative), name.strip()))
+    rows.sort(reverse=True)
+    return [f"{cumulative / 1000:8.1f} ms  {name}" for cumulative, name in rows[:top]]
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    for key in runs[0]:
+        if key.endswith("_ms"):
+            values = [run[key] for run in runs]
+            summary[key] = {"median": statistics.median(values), "max": max(values)}
+    summary["heavy_modules"] = [module for module in HEAVY_MODULES
+                                if any(name == module or name.startswith(module + ".") for name in runs[0]["modules"])]
+    return summary
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Timings whose median got worse than the baseline allows."""
+    regressions = []
+    for function, summary in results["functions"].items():
+        before = baseline["functions"].get(function, {})
+        for key, stats in summary.items():
+            old = before.get(key)
+            if not key.endswith("_ms") or not old:
+                continue
+            if stats["median"] > old["median"] * (1 + max_regression) and stats["median"] - old["median"] > REGRESSION_NOISE_MS:
+                regressions.append(f"{function} {key[:-3]}: median {old['median']:.1f} -> {stats['median']:.1f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--functions", default=",".join(FUNCTIONS), help="comma-separated functions to start")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per function")
+    parser.add_argument("--warm-up", choices=["off", "background", "blocking"], default="off",
+                        help="WARM_UP mode for the started functions")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="print the N slowest imports")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed slowdown vs the baseline")
+    args = parser.parse_args()
+
+    # Otherwise the functions' default configuration, as deployed
+    env = {**os.environ, "WARM_UP": args.warm_up, "PYTHONDONTWRITEBYTECODE": "1"}
+    results: Dict[str, Any] = {"warm_up": args.warm_up, "runs": args.runs, "functions": {}}
+    for function in args.functions.split(","):
+        summary = summarize([run_once(function, env) for _ in range(args.runs)])
+        results["functions"][function] = summary
+        print(f"{function}")
+        for key, stats in summary.items():
+            if key.endswith("_ms"):
+                print(f"  {key[:-3]:<18} median {stats['median']:8.1f} ms  max {stats['max']:8.1f} ms")
+        print(f"  heavy SDKs loaded at startup: {', '.join(summary['heavy_modules']) or 'none'}")
+        if args.importtime:
+            print("  slowest imports (cumulative):")
+            for line in slowest_imports(function, env, args.importtime):
+                print(f"    {line}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\nRegressions against the baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Truncation detection, salvage and the per-field output token budget.
+
+Each turn of benchmarks/data/sessions.json is replayed with the prompt the
+assistant would have shown before it (the first missing required field).
+The turn's expected completion is then:
+
+- budgeted: the maxOutputTokens chosen by token_budget.turn_budget, against
+  an estimate of the tokens the completion needs (--chars-per-token), and
+  against the fixed 1024 used before;
+- cut every --step characters, as if the model hit its output token limit.
+  Every cut must be detected as unterminated, and salvage must keep every
+  field that was complete before the cut and never return a value that
+  differs from the completion's.
+
+The exit status is 1 if a cut is missed or a salvaged value is wrong.
+
+    python benchmarks/bench_truncation.py --step 1
+"""
+import argparse
+import copy
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "medical-dictation-function"))
+
+from json_extract import is_unterminated, salvage_json_object  # noqa: E402
+from medical_records.record_schema import COMPILED_SCHEMA, RECORD_SCHEMA  # noqa: E402
+from token_budget import field_type, turn_budget  # noqa: E402
+
+SESSIONS_PATH = os.path.join(ROOT, "benchmarks", "data", "sessions.json")
+FIXED_BUDGET = 1024
+
+
+def session_turns() -> List[Tuple[str, str, Dict[str, Any]]]:
+    """(prompted field, user message, update) for every turn, replaying each session's record."""
+    with open(SESSIONS_PATH) as f:
+        sessions = json.load(f)
+    turns = []
+    for session in sessions:
+        record = copy.deepcopy(RECORD_SCHEMA)
+        for index, turn in enumerate(session["turns"]):
+            missing = COMPILED_SCHEMA.missing_fields(record)
+            # The opening turn answers no prompt
+            field = missing[0] if index and missing else ""
+            turns.append((field, turn["userMessage"], turn["update"]))
+            for section, data in turn["update"].items():
+                record[section].update(data)
+    return turns
+
+
+def completion_for(update: Dict[str, Any]) -> str:
+    return json.dumps({"updated_record": update, "message": "Updated the record."}, indent=2)
+
+
+def is_part_of(salvaged: Any, truth: Any) -> bool:
+    """True if every value in `salvaged` equals the one in `truth`; lists and objects may be cut short."""
+    if isinstance(salvaged, dict):
+        return isinstance(truth, dict) and all(key in truth and is_part_of(value, truth[key])
+                                               for key, value in salvaged.items())
+    if isinstance(salvaged, list):
+        return (isinstance(truth, list) and len(salvaged) <= len(truth)
+                and all(is_part_of(a, b) for a, b in zip(salvaged, truth)))
+    return salvaged == truth
+
+
+def field_ends(update: Dict[str, Any]) -> Dict[Tuple[str, str], int]:
+    """Offset in completion_for(update) just past the value of each field."""
+    ends = {}
+    partial: Dict[str, Dict[str, Any]] = {}
+    for section, data in update.items():
+        partial[section] = {}
+        for key, value in data.items():
+            partial[section][key] = value
+            # The completion of the update so far, minus its closing brackets, is a prefix of the full one
+            ends[(section, key)] = len(json.dumps({"updated_record": partial}, indent=2).rstrip("}\n "))
+    return ends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--step", type=int, default=3, help="characters between cuts")
+    parser.add_argument("--chars-per-token", type=float, default=3.5, help="for estimating completion tokens")
+    args = parser.parse_args()
+
+    turns = session_turns()
+    print(f"{'prompted field':<34}{'type':<11}{'message':>8}{'needs':>7}{'budget':>8}{'fixed':>7}")
+    over_budget = 0
+    budgets, needs = [], []
+    for field, message, update in turns:
+        need = math.ceil(len(completion_for(update)) / args.chars_per_token)
+        budget = turn_budget(field or None, message, FIXED_BUDGET)
+        over_budget += need > budget
+        budgets.append(budget)
+        needs.append(need)
+        print(f"{field or '(opening turn)':<34}{field_type(field) or '-':<11}{len(message):>8}{need:>7}{budget:>8}"
+              f"{FIXED_BUDGET:>7}")
+    print(f"\nturns {len(turns)}  budget mean {statistics.mean(budgets):.0f} tokens (fixed {FIXED_BUDGET})  "
+          f"estimated need mean {statistics.mean(needs):.0f}  over budget {over_budget}")
+
+    cuts = missed = wrong = lost = 0
+    latencies: List[float] = []
+    for _, _, update in turns:
+        text = completion_for(update)
+        truth = json.loads(text)
+        for cut in range(1, len(text), args.step):
+            partial = text[:cut]
+            cuts += 1
+            if not is_unterminated(partial):
+                missed += 1
+                continue
+            start = time.perf_counter()
+            salvaged = salvage_json_object(partial)
+            latencies.append((time.perf_counter() - start) * 1e6)
+            if not is_part_of(salvaged, truth):
+                wrong += 1
+                continue
+            record = salvaged.get("updated_record", {})
+            # A number is only known to be complete once the character after it arrives
+            lost += sum(1 for (section, key), end in field_ends(update).items()
+                        if end < cut and record.get(section, {}).get(key) != update[section][key])
+
+    latencies.sort()
+    print(f"cuts {cuts}  undetected {missed}  wrong values {wrong}  complete fields lost {lost}")
+    print(f"salvage latency p50 {statistics.median(latencies):.1f} us  "
+          f"p95 {latencies[int(0.95 * (len(latencies) - 1))]:.1f} us")
+    if missed or wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,12 @@ let currentRecord = {
     }
 };
 let chatHistory = [];
+// Server-side session holding the record; after the first turn only the new utterance is sent
+let sessionId = null;
+// Messages at least this long (e.g. a full field report) are sent as a whole dictation
+const DICTATION_MODE_MIN_CHARS = 400;
+// false shows a submit button for finished records; true or 'async' lets the dictation function insert them
+const AUTO_SUBMIT = false;
 let isListening = false;
 let recognition;
 
@@ -120,7 +126,7 @@ async function sendChatMessage() {
         showLoadingSpinner();
         
         try {
-            const response = await callCloudFunction(message);
+            const response = await callCloudFunctionStreaming(message, handleStreamedField);
             console.log('Cloud function response:', response);
 
             if (response && typeof response === 'object') {
@@ -129,14 +135,24 @@ async function sendChatMessage() {
                     chatHistory.push({ role: 'assistant', content: response.message });
                 }
                 
-                if (response.updated_record) {
+                if (response.sessionId) {
+                    sessionId = response.sessionId;
+                }
+
+                if (response.patch) {
+                    applyRecordPatch(currentRecord, response.patch);
+                    updateProgressBars();
+                    updateCompletionBoxes();
+                } else if (response.updated_record) {
                     updateCurrentRecord(response.updated_record);
                     console.log('Updated record:', currentRecord);
                     updateProgressBars();
                     updateCompletionBoxes();
                 }
                 
-                if (response.ready_to_insert) {
+                if (response.insert_receipt) {
+                    handleInsertReceipt(response.insert_receipt);
+                } else if (response.ready_to_insert) {
                     console.log('Record is complete and ready to insert');
                     addSubmitButton();
                 }
@@ -156,6 +172,15 @@ async function sendChatMessage() {
     }
 }
 
+function handleStreamedField(section, field, value) {
+    // Show each field as soon as the model has finished generating it
+    if (currentRecord.hasOwnProperty(section)) {
+        currentRecord[section][field] = value;
+        updateProgressBars();
+        updateCompletionBoxes();
+    }
+}
+
 function updateCurrentRecord(updatedRecord) {
     // Merge the updated record with the current record
     for (const section in updatedRecord) {
@@ -168,6 +193,45 @@ function updateCurrentRecord(updatedRecord) {
     }
 }
 
+function applyRecordPatch(record, patch) {
+    // Apply the JSON patch (RFC 6902 add/replace/remove on object members) returned in session mode
+    for (const operation of patch) {
+        const keys = operation.path.split('/').slice(1).map(key => key.replace(/~1/g, '/').replace(/~0/g, '~'));
+        const last = keys.pop();
+        let target = record;
+        for (const key of keys) {
+            if (typeof target[key] !== 'object' || target[key] === null) target[key] = {};
+            target = target[key];
+        }
+        if (operation.op === 'remove') {
+            delete target[last];
+        } else {
+            target[last] = operation.value;
+        }
+    }
+}
+
+function buildDictationPayload(userMessage) {
+    // With a session the server already has the record, so only the utterance is sent
+    const payload = sessionId
+        ? { userMessage: userMessage, sessionId: sessionId }
+        : { userMessage: userMessage, currentRecord: currentRecord, session: true };
+    if (AUTO_SUBMIT) {
+        payload.autoSubmit = AUTO_SUBMIT;
+    }
+    return payload;
+}
+
+function handleInsertReceipt(receipt) {
+    // The dictation function already submitted the finished record
+    if (receipt.status === 'inserted' || receipt.status === 'queued') {
+        sessionId = null;
+        return;
+    }
+    addMessageToChat('bot', `Automatic submission failed: ${receipt.error || receipt.status}`);
+    addSubmitButton();
+}
+
 function addMessageToChat(sender, message) {
     const messageElement = document.createElement('div');
     messageElement.className = `mb-4 ${sender === 'user' ? 'text-right' : 'text-left'}`;
@@ -204,33 +268,73 @@ function addSubmitButton() {
     }
 }
 
-async function callCloudFunction(userMessage) {
+async function callCloudFunctionStreaming(userMessage, onField) {
     const cloudFunctionUrl = 'https://us-central1-wz-data-catalog-demo.cloudfunctions.net/medical-dictation-function';
 
     const payload = {
-        userMessage: userMessage,
-        currentRecord: currentRecord,
-        chatHistory: chatHistory
+        ...buildDictationPayload(userMessage),
+        stream: true,
+        mode: userMessage.length >= DICTATION_MODE_MIN_CHARS ? 'dictation' : 'turn'
     };
-    
-    try {
-        const response = await fetch(cloudFunctionUrl, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify(payload),
-        });
 
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+    const response = await fetch(cloudFunctionUrl, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(payload),
+    });
+
+    if (response.status === 409 && sessionId) {
+        // The session expired or lives on another instance: start a new one from the local record
+        const error = await response.json().catch(() => ({}));
+        if (error.sessionExpired) {
+            sessionId = null;
+            return callCloudFunctionStreaming(userMessage, onField);
         }
+    }
+
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
 
+    // Fall back to a regular JSON body if streaming is unavailable
+    if (!response.body || !(response.headers.get('Content-Type') || '').includes('text/event-stream')) {
         return await response.json();
-    } catch (error) {
-        console.error('Error calling cloud function:', error);
-        throw error;
     }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let eventName = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            const parsed = data ? JSON.parse(data) : {};
+
+            if (eventName === 'field') {
+                onField(parsed.section, parsed.field, parsed.value);
+            } else if (eventName === 'done') {
+                return parsed;
+            } else if (eventName === 'error') {
+                throw new Error(parsed.error || 'Streaming error');
+            }
+        }
+    }
+    throw new Error('Stream ended before the response was complete');
 }
 
 function toggleSignIn() {
@@ -349,6 +453,7 @@ async function submitToBigQuery() {
         addMessageToChat('bot', result.message || 'Record submitted successfully to BigQuery');
         
         // Reset the current record and update UI
+        sessionId = null;
         currentRecord = JSON.parse(JSON.stringify(currentRecord));
         updateProgressBars();
         updateCompletionBoxes();
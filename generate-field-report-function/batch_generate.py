@@ -0,0 +1,158 @@
+"""Generate a synthetic dataset of field reports as JSONL, for load testing.
+
+    python batch_generate.py --count 5000 --output reports.jsonl --ground-truth
+    python batch_generate.py --count 5000 --output reports.jsonl --backend vertex --concurrency 8
+
+Each line is {"id", "index", "backend", "seed", "dictation"} plus "record"
+(the structured RECORD_SCHEMA record the report was written from) with
+--ground-truth. The output file is the checkpoint: rerunning the same command
+skips reports already written and only generates the missing ones.
+
+The default "template" backend is deterministic and works offline: report N
+with a given --seed is always the same. The "vertex" backend calls Gemini like
+the deployed function; with --ground-truth it asks the model to dictate a
+template-generated record, so every report still has a known answer.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Set
+
+from template_reports import TemplateReportBackend
+
+logger = logging.getLogger("batch_generate")
+
+GROUND_TRUTH_INSTRUCTION = (
+    "generate a field report for the following patient and procedure. Dictate every detail given below, "
+    "spelling out numbers as they would be spoken, and do not add other patients or procedures.\n"
+)
+
+
+def load_checkpoint(path: str, backend: str, seed: int) -> Set[int]:
+    """Indices already written to `path`; drops a partially written last line."""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            logger.warning(f"Dropping incomplete last line of {path}")
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        if row.get("backend") != backend or row.get("seed") != seed:
+            raise SystemExit(f"{path} was written with backend={row.get('backend')} seed={row.get('seed')}; "
+                             f"use the same options or a new output file")
+        done.add(row["index"])
+    return done
+
+
+def make_generator(backend: str, seed: int, ground_truth: bool) -> Callable[[int], Dict[str, Any]]:
+    """Return a function that builds the output row for report `index`."""
+    templates = TemplateReportBackend(seed)
+    vertex = None
+    if backend == "vertex":
+        import main
+        vertex = main.report_backend
+
+    def generate(index: int) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"id": f"{backend}-{seed}-{index:06d}", "index": index, "backend": backend, "seed": seed}
+        dictation, record = templates.generate_example(index)
+        if vertex is not None:
+            if ground_truth:
+                details = {"patient": record["patient"], "procedure": record["procedure"]}
+                dictation = vertex.generate(GROUND_TRUTH_INSTRUCTION + json.dumps(details, indent=2))
+            else:
+                dictation = vertex.generate()
+        row["dictation"] = dictation
+        if ground_truth:
+            row["record"] = record
+        return row
+
+    return generate
+
+
+def with_retries(generate: Callable[[int], Dict[str, Any]], retries: int) -> Callable[[int], Optional[Dict[str, Any]]]:
+    def run(index: int) -> Optional[Dict[str, Any]]:
+        for attempt in range(retries + 1):
+            try:
+                return generate(index)
+            except Exception as e:
+                logger.warning(f"Report {index} failed (attempt {attempt + 1}/{retries + 1}): {str(e)}")
+                if attempt < retries:
+                    time.sleep(min(2 ** attempt, 30))
+        return None
+    return run
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    done = load_checkpoint(args.output, args.backend, args.seed)
+    pending = [index for index in range(args.count) if index not in done]
+    logger.info(f"{len(done)} reports already in {args.output}, {len(pending)} to generate")
+    if not pending:
+        return 0
+
+    generate = with_retries(make_generator(args.backend, args.seed, args.ground_truth), args.retries)
+    written = failed = 0
+    started = time.monotonic()
+    queue = iter(pending)
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(args.concurrency) as executor:
+        # Keep a bounded number of reports in flight so memory stays flat for large counts.
+        in_flight = set()
+        for index in queue:
+            in_flight.add(executor.submit(generate, index))
+            if len(in_flight) < args.concurrency * 2:
+                continue
+            finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            written, failed = _write(finished, out, written, failed, args.checkpoint_every)
+        finished, _ = wait(in_flight)
+        written, failed = _write(finished, out, written, failed, args.checkpoint_every)
+        out.flush()
+        os.fsync(out.fileno())
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Wrote {written} reports in {elapsed:.1f}s ({written / elapsed:.1f}/s), {failed} failed")
+    if failed:
+        logger.warning("Rerun the same command to retry the failed reports")
+    return 1 if failed else 0
+
+
+def _write(finished, out, written: int, failed: int, checkpoint_every: int):
+    for future in finished:
+        row = future.result()
+        if row is None:
+            failed += 1
+            continue
+        out.write(json.dumps(row) + "\n")
+        written += 1
+        if written % checkpoint_every == 0:
+            out.flush()
+            os.fsync(out.fileno())
+            logger.info(f"{written} reports written")
+    return written, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, required=True, help="total number of reports in the dataset")
+    parser.add_argument("--output", required=True, help="JSONL file to write (and resume from)")
+    parser.add_argument("--backend", choices=["template", "vertex"], default="template")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=4, help="reports generated at the same time")
+    parser.add_argument("--ground-truth", action="store_true", help="include the structured record for each report")
+    parser.add_argument("--retries", type=int, default=3, help="retries per report before giving up")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="fsync the output every N reports")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    sys.exit(run_batch(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,26 @@
 import functions_framework
 from flask import jsonify
-import base64
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part, SafetySetting
-import json
+import logging
+import os
+import time
+from medical_records import telemetry
+from medical_records.telemetry import MODEL_SECONDS, OUTPUT_BYTES, metrics
+from medical_records.warmup import start_warm_up
+from report_pool import ReportPool, VertexReportBackend
+
+logger = logging.getLogger(__name__)
 
 # Constants
 PROJECT_ID = "<redacted>"
 LOCATION = "us-central1"
 MODEL_NAME = "gemini-1.5-flash-001"
 
+# Pre-generated report pool, off by default since every pooled report is a billed model call.
+# Set REPORT_POOL_HIGH_WATERMARK above 0 to enable it; it starts filling on the first request.
+REPORT_POOL_LOW_WATERMARK = int(os.environ.get("REPORT_POOL_LOW_WATERMARK", "1"))
+REPORT_POOL_HIGH_WATERMARK = int(os.environ.get("REPORT_POOL_HIGH_WATERMARK", "0"))
+REPORT_POOL_WORKERS = int(os.environ.get("REPORT_POOL_WORKERS", "2"))
+
 textsi_1 = """Generate random military physician field reports based on procedures performed. It should read like a spoken dictation with awkward (yet natural) oral wordings. Provide variation in the procedures that would fit into these CPT Category 1 codes:
 Evaluation and Management (99202–99499)
 Anesthesia (00100–01999)
@@ -56,45 +67,57 @@ generation_config = {
     "top_p": 0.95,
 }
 
-safety_settings = [
-    SafetySetting(
-        category=SafetySetting.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-        threshold=SafetySetting.HarmBlockThreshold.OFF
-    ),
-    SafetySetting(
-        category=SafetySetting.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-        threshold=SafetySetting.HarmBlockThreshold.OFF
-    ),
-    SafetySetting(
-        category=SafetySetting.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-        threshold=SafetySetting.HarmBlockThreshold.OFF
-    ),
-    SafetySetting(
-        category=SafetySetting.HarmCategory.HARM_CATEGORY_HARASSMENT,
-        threshold=SafetySetting.HarmBlockThreshold.OFF
-    ),
-]
+# Harm category -> block threshold. VertexReportBackend turns these into SafetySetting
+# objects when it creates the model, so the Vertex AI SDK is not imported at startup.
+safety_settings = {
+    "HARM_CATEGORY_HATE_SPEECH": "OFF",
+    "HARM_CATEGORY_DANGEROUS_CONTENT": "OFF",
+    "HARM_CATEGORY_SEXUALLY_EXPLICIT": "OFF",
+    "HARM_CATEGORY_HARASSMENT": "OFF",
+}
+
+# The model backend is created once per instance and shared by every request thread
+# (it creates the model under a lock). Any object with a thread-safe
+# generate() -> str method can replace it, e.g. a local fake for testing.
+report_backend = VertexReportBackend(PROJECT_ID, LOCATION, MODEL_NAME, [textsi_1],
+                                     generation_config, safety_settings)
+
+FIELD_REPORTS = metrics.counter("field_reports_total", "Field reports served, by source (pool or generated).")
 
 def generate_field_report():
-    vertexai.init(project=PROJECT_ID, location=LOCATION)
-    model = GenerativeModel(
-        MODEL_NAME,
-        system_instruction=[textsi_1]
-    )
-    responses = model.generate_content(
-        ["""generate a field report"""],
-        generation_config=generation_config,
-        safety_settings=safety_settings,
-        stream=True,
-    )
-
-    full_response = ""
-    for response in responses:
-        full_response += response.text
-
-    return full_response
+    start = time.perf_counter()
+    field_report = report_backend.generate()
+    metrics.observe(MODEL_SECONDS, time.perf_counter() - start, call="field_report")
+    metrics.observe(OUTPUT_BYTES, len(field_report.encode("utf-8")), call="field_report")
+    return field_report
+
+report_pool = None
+if REPORT_POOL_HIGH_WATERMARK > 0:
+    report_pool = ReportPool(generate_field_report, low_watermark=min(REPORT_POOL_LOW_WATERMARK, REPORT_POOL_HIGH_WATERMARK),
+                             high_watermark=REPORT_POOL_HIGH_WATERMARK, workers=REPORT_POOL_WORKERS)
+
+def warm_up() -> None:
+    """Import the Vertex AI SDK and create the model that the first on-demand report would otherwise create."""
+    report_backend.get_model()
+
+# Optional warm-up at instance start (WARM_UP: off, background or blocking). A pool
+# refill loads the model too, but only once the first request has started it.
+start_warm_up(warm_up)
+
+def get_field_report():
+    """Return (report, source): a pre-generated report if one is ready, otherwise a new one."""
+    if report_pool is not None:
+        field_report = report_pool.get()
+        if field_report is not None:
+            metrics.inc(FIELD_REPORTS, source="pool")
+            return field_report, "pool"
+    with telemetry.span("model"):
+        field_report = generate_field_report()
+    metrics.inc(FIELD_REPORTS, source="generated")
+    return field_report, "generated"
 
 @functions_framework.http
+@telemetry.instrument_handler("generate_field_report")
 def generate_field_report_http(request):
     """HTTP Cloud Function for generating a field report."""
     # Set CORS headers for the preflight request
@@ -115,9 +138,10 @@ def generate_field_report_http(request):
     }
 
     try:
-        field_report = generate_field_report()
-        return jsonify({"fieldReport": field_report}), 200, headers
+        field_report, source = get_field_report()
+        return jsonify({"fieldReport": field_report, "source": source}), 200, headers
     except Exception as e:
+        logger.error(f"Error generating field report: {str(e)}")
         return jsonify({"error": str(e)}), 500, headers
 
 if __name__ == "__main__":
@@ -130,4 +154,8 @@ if __name__ == "__main__":
     def local_generate_field_report():
         return generate_field_report_http(request)
 
+    @app.route('/metrics', methods=['GET'])
+    def local_metrics():
+        return telemetry.metrics_response(request)
+
     app.run(host='localhost', port=8080, debug=True)
\ No newline at end of file
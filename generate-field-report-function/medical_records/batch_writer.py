@@ -0,0 +1,129 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Defaults stay well below the streaming insert limits (10 MB / request,
+# 500 rows recommended per request).
+DEFAULT_MAX_ROWS = 500
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 0.05
+
+InsertFn = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+
+
+class PendingRow:
+    """A row waiting in the buffer, resolved with its insert errors once flushed."""
+    __slots__ = ("row", "size", "errors", "done")
+
+    def __init__(self, row: Dict[str, Any], size: int):
+        self.row = row
+        self.size = size
+        self.errors: Optional[List[Dict[str, Any]]] = None
+        self.done = threading.Event()
+
+    @property
+    def ok(self) -> bool:
+        return self.done.is_set() and not self.errors
+
+
+class BatchWriter:
+    """Process-wide buffer that coalesces rows into multi-row inserts.
+
+    The buffer is flushed when it holds `max_rows` rows, `max_bytes` of encoded
+    JSON, or when its oldest row is older than `max_age` seconds. There is no
+    background thread: callers waiting on their rows flush the buffer themselves
+    once the age limit passes, so no work is left running after a response.
+
+    `insert_fn` receives the list of rows and must return errors in the same
+    shape as `bigquery.Client.insert_rows_json`, i.e. a list of
+    `{"index": i, "errors": [...]}` entries. Those indexes are mapped back to
+    the caller that submitted each row.
+    """
+
+    def __init__(self, insert_fn: InsertFn, max_rows: int = DEFAULT_MAX_ROWS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age: float = DEFAULT_MAX_AGE_SECONDS):
+        self.insert_fn = insert_fn
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._buffer: List[PendingRow] = []
+        self._buffer_bytes = 0
+        self._oldest = 0.0
+
+    def submit(self, rows: List[Dict[str, Any]]) -> List[PendingRow]:
+        """Add rows to the buffer, flushing inline if a size limit is reached."""
+        pending = [PendingRow(row, len(json.dumps(row))) for row in rows]
+        batches = []
+        with self._lock:
+            for item in pending:
+                if self._buffer and (len(self._buffer) >= self.max_rows
+                                     or self._buffer_bytes + item.size > self.max_bytes):
+                    batches.append(self._take_locked())
+                if not self._buffer:
+                    self._oldest = time.monotonic()
+                self._buffer.append(item)
+                self._buffer_bytes += item.size
+            if len(self._buffer) >= self.max_rows or self._buffer_bytes >= self.max_bytes:
+                batches.append(self._take_locked())
+        for batch in batches:
+            self._write(batch)
+        return pending
+
+    def flush(self) -> None:
+        """Write everything currently in the buffer."""
+        with self._lock:
+            batch = self._take_locked()
+        if batch:
+            self._write(batch)
+
+    def wait(self, pending: List[PendingRow], timeout: Optional[float] = None) -> bool:
+        """Block until every pending row is written, flushing once the buffer is old enough."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for item in pending:
+            while not item.done.is_set():
+                with self._lock:
+                    age_left = self._oldest + self.max_age - time.monotonic() if self._buffer else 0.0
+                if age_left <= 0:
+                    self.flush()
+                    # Another thread may be writing the batch holding this row.
+                    wait_for = self.max_age
+                else:
+                    wait_for = age_left
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait_for = min(wait_for, remaining)
+                item.done.wait(wait_for)
+        return True
+
+    def write(self, rows: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Optional[List[Dict[str, Any]]]]:
+        """Submit rows and wait for them; returns the per-row errors (None on success)."""
+        pending = self.submit(rows)
+        if not self.wait(pending, timeout):
+            logger.error("Timed out waiting for buffered rows to be written.")
+        return [item.errors if item.done.is_set() else [{"reason": "timeout", "message": "Row was not written in time"}]
+                for item in pending]
+
+    def _take_locked(self) -> List[PendingRow]:
+        batch = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        return batch
+
+    def _write(self, batch: List[PendingRow]) -> None:
+        try:
+            errors = self.insert_fn([item.row for item in batch]) or []
+        except Exception as e:
+            logger.error(f"Batch insert of {len(batch)} rows failed: {str(e)}")
+            errors = [{"index": i, "errors": [{"reason": "insertFailed", "message": str(e)}]}
+                      for i in range(len(batch))]
+        errors_by_index = {error["index"]: error.get("errors", []) for error in errors}
+        for i, item in enumerate(batch):
+            item.errors = errors_by_index.get(i)
+            item.done.set()
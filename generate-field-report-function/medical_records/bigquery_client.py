@@ -0,0 +1,81 @@
+import logging
+import os
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# HTTP connections the client keeps open (BIGQUERY_POOL_SIZE, 0 for the requests default of 10).
+# Inserts, load jobs and health checks running at once beyond this open and drop extra connections.
+BIGQUERY_POOL_SIZE = int(os.environ.get("BIGQUERY_POOL_SIZE", "0"))
+
+
+def default_client_factory() -> Any:
+    """Build a BigQuery client using application default credentials."""
+    from google.cloud import bigquery
+    client = bigquery.Client()
+    if BIGQUERY_POOL_SIZE > 0:
+        from requests.adapters import HTTPAdapter
+        client._http.mount("https://", HTTPAdapter(pool_connections=BIGQUERY_POOL_SIZE, pool_maxsize=BIGQUERY_POOL_SIZE))
+    return client
+
+
+class BigQueryClientCache:
+    """Lazily created, process-wide BigQuery client and table reference.
+
+    The client (and its HTTP session) is safe to share between threads, so it is
+    built once on first use and reused by every request and retry. Call `reset()`
+    when credentials rotate; the next `get()` rebuilds the client.
+    """
+
+    def __init__(self, project_id: str, dataset_id: str, table_id: str,
+                 factory: Callable[[], Any] = default_client_factory):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._client: Optional[Any] = None
+        self._table_ref: Optional[Any] = None
+
+    def get(self) -> Tuple[Any, Any]:
+        """Return the shared (client, table_ref), creating them on first use."""
+        client, table_ref = self._client, self._table_ref
+        if client is not None:
+            return client, table_ref
+        with self._lock:
+            if self._client is None:
+                logger.info("Creating BigQuery client.")
+                client = self.factory()
+                self._table_ref = client.dataset(self.dataset_id, project=self.project_id).table(self.table_id)
+                self._client = client
+            return self._client, self._table_ref
+
+    def reset(self) -> None:
+        """Drop the cached client so the next call rebuilds it with fresh credentials."""
+        with self._lock:
+            client, self._client, self._table_ref = self._client, None, None
+        if client is not None:
+            logger.info("Resetting BigQuery client.")
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Error closing BigQuery client: {str(e)}")
+
+    def check_health(self) -> bool:
+        """Verify the cached client can reach the table, resetting it if it cannot."""
+        try:
+            client, table_ref = self.get()
+            client.get_table(table_ref)
+            return True
+        except Exception as e:
+            logger.error(f"BigQuery health check failed: {str(e)}")
+            self.reset()
+            return False
+
+
+def is_auth_error(error: Exception) -> bool:
+    """Return True for errors that suggest the cached credentials are stale."""
+    if getattr(error, "code", None) == 401:
+        return True
+    return type(error).__name__ in ("RefreshError", "DefaultCredentialsError", "Unauthenticated")
@@ -0,0 +1,244 @@
+import datetime
+import io
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from medical_records.record_schema import RECORD_SCHEMA
+
+# pyarrow is optional: only export, load jobs and local statistics need it, and it
+# is imported on first use so that functions which never export do not pay for it.
+EXPORT_FORMATS = ("parquet", "arrow")
+FILE_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+DATASET_FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+# Files are laid out Hive-style: <root>/procedure_date=2023-10-27/part-....parquet
+PARTITION_KEY = "procedure_date"
+UNDATED_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+PARQUET_COMPRESSION = "zstd"
+
+
+def _column_kind(section: str, field: str, default: Any) -> str:
+    if section == "coding":
+        return "codes"
+    if field == "date":
+        return "date"
+    if isinstance(default, int):
+        return "int"
+    if isinstance(default, list):
+        return "strings"
+    return "string"
+
+
+# (section, field) -> kind, in the column order of create-table.sql
+COLUMN_KINDS: Dict[str, Dict[str, str]] = {
+    section: {field: _column_kind(section, field, default) for field, default in fields.items()}
+    for section, fields in RECORD_SCHEMA.items()
+}
+
+
+def import_pyarrow():
+    """Import pyarrow, with an install hint when it is missing."""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Columnar export needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def arrow_schema():
+    """Arrow schema of the usu_procedures table, nested like its BigQuery STRUCT and ARRAY columns."""
+    pa = import_pyarrow()
+    code_list = pa.list_(pa.struct([("code", pa.string()), ("description", pa.string())]))
+    types = {"string": pa.string(), "int": pa.int64(), "date": pa.date32(), "strings": pa.list_(pa.string()),
+             "codes": code_list}
+    return pa.schema([(section, pa.struct([(field, types[kind]) for field, kind in fields.items()]))
+                      for section, fields in COLUMN_KINDS.items()])
+
+
+def parse_date(value: Any) -> Optional[datetime.date]:
+    try:
+        return datetime.date.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def parse_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _convert(kind: str, value: Any) -> Any:
+    if kind == "codes":
+        return [{"code": str(code.get("code", "")), "description": str(code.get("description", ""))}
+                for code in value or [] if isinstance(code, dict)]
+    if kind == "strings":
+        return [str(item) for item in value] if isinstance(value, list) else []
+    if value is None or value == "":
+        return None
+    if kind == "date":
+        return parse_date(value)
+    if kind == "int":
+        # A dictated age such as "twenty-eight" is left empty rather than failing the whole export
+        return parse_int(value)
+    return str(value)
+
+
+def to_arrow_row(bq_record: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a BigQuery row (see insert_path.to_bq_record) to the types of arrow_schema()."""
+    return {section: {field: _convert(kind, (bq_record.get(section) or {}).get(field))
+                      for field, kind in fields.items()}
+            for section, fields in COLUMN_KINDS.items()}
+
+
+def records_to_table(bq_records: Iterable[Dict[str, Any]]):
+    """An Arrow table of BigQuery rows."""
+    pa = import_pyarrow()
+    return pa.Table.from_pylist([to_arrow_row(record) for record in bq_records], schema=arrow_schema())
+
+
+def write_table(table: Any, sink: Any, export_format: str = "parquet") -> None:
+    """Write an Arrow table to a path or file object as Parquet or as an Arrow IPC file."""
+    if export_format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, sink, compression=PARQUET_COMPRESSION)
+    elif export_format == "arrow":
+        import pyarrow.feather as feather
+        feather.write_feather(table, sink, compression=PARQUET_COMPRESSION)
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
+
+
+def write_partitioned(bq_records: Iterable[Dict[str, Any]], root: str, export_format: str = "parquet") -> List[str]:
+    """Write rows under `root`, one new file per procedure date, and return the file paths.
+
+    Each file is written under a temporary name and renamed into place, so
+    readers never see a partial file. Rows without a valid date go to the
+    __HIVE_DEFAULT_PARTITION__ directory.
+    """
+    import_pyarrow()
+    by_date: Dict[str, List[Dict[str, Any]]] = {}
+    for record in bq_records:
+        date = parse_date((record.get("procedure") or {}).get("date"))
+        by_date.setdefault(date.isoformat() if date else UNDATED_PARTITION, []).append(record)
+
+    paths = []
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    for date, records in sorted(by_date.items()):
+        directory = os.path.join(root, f"{PARTITION_KEY}={date}")
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{stamp}-{uuid.uuid4().hex[:8]}{FILE_EXTENSIONS[export_format]}"
+        temporary = os.path.join(directory, f".{name}.tmp")
+        write_table(records_to_table(records), temporary, export_format)
+        os.replace(temporary, os.path.join(directory, name))
+        paths.append(os.path.join(directory, name))
+    return paths
+
+
+def load_job_config():
+    """BigQuery load job settings for Parquet files of arrow_schema() appended to the table."""
+    from google.cloud import bigquery
+    job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                        write_disposition=bigquery.WriteDisposition.WRITE_APPEND)
+    # Read list<struct> columns as ARRAY<STRUCT> rather than as a wrapper record
+    parquet_options = bigquery.ParquetOptions()
+    parquet_options.enable_list_inference = True
+    job_config.parquet_options = parquet_options
+    return job_config
+
+
+def load_table(client: Any, table_ref: Any, table: Any, timeout: Optional[float] = None,
+               job_id: Optional[str] = None) -> Dict[str, Any]:
+    """Append an Arrow table to a BigQuery table with one load job; returns the job id and rows loaded.
+
+    A load job is free and all-or-nothing, unlike streaming inserts, which are
+    billed per row and can fail row by row. Raises if the job fails. With a
+    `job_id`, a job that already exists under that id (created by an earlier
+    attempt whose response was lost) is waited for instead of loading again.
+    """
+    buffer = io.BytesIO()
+    write_table(table, buffer, "parquet")
+    buffer.seek(0)
+    try:
+        job = client.load_table_from_file(buffer, table_ref, job_id=job_id, job_config=load_job_config())
+    except Exception as e:
+        # google.api_core.exceptions.Conflict: the job id is taken
+        if job_id is None or getattr(e, "code", None) != 409:
+            raise
+        job = client.get_job(job_id)
+    job.result(timeout=timeout)
+    return {"job_id": job.job_id, "rows": job.output_rows}
+
+
+def read_table(root: str, columns: Any = None, start_date: Optional[str] = None, end_date: Optional[str] = None,
+               export_format: str = "parquet"):
+    """Read exported rows, skipping the partitions outside [start_date, end_date] (YYYY-MM-DD, inclusive).
+
+    `columns` may map output names to nested fields, e.g. {"cpt": ("coding", "cpt")};
+    only those columns are read from the files.
+    """
+    pa = import_pyarrow()
+    import pyarrow.dataset as ds
+    partitioning = ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor="hive")
+    dataset = ds.dataset(root, format=DATASET_FORMATS[export_format], partitioning=partitioning,
+                         schema=arrow_schema().append(pa.field(PARTITION_KEY, pa.string())))
+    row_filter = None
+    # ISO dates sort as strings; the undated partition is outside any range
+    if start_date:
+        row_filter = ds.field(PARTITION_KEY) >= start_date
+    if end_date:
+        upper = ds.field(PARTITION_KEY) <= end_date
+        row_filter = upper if row_filter is None else row_filter & upper
+    if isinstance(columns, dict):
+        columns = {name: ds.field(*path) if isinstance(path, tuple) else ds.field(path)
+                   for name, path in columns.items()}
+    return dataset.to_table(columns=columns, filter=row_filter)
+
+
+def code_frequency(root: str, code_system: str = "cpt", by: Optional[str] = "location", top: int = 10,
+                   start_date: Optional[str] = None, end_date: Optional[str] = None,
+                   export_format: str = "parquet") -> List[Dict[str, Any]]:
+    """Most frequent codes of one code system per value of a procedure field, from exported files.
+
+    Returns up to `top` rows per group, most frequent first:
+    {"group": "Field Surgical Unit Alpha", "code": "27892", "description": "...", "count": 12}.
+    With `by=None` there is a single group, None.
+    """
+    pa = import_pyarrow()
+    import pyarrow.compute as pc
+    if code_system not in COLUMN_KINDS["coding"]:
+        raise ValueError(f"Unknown code system: {code_system}")
+    if by is not None and COLUMN_KINDS["procedure"].get(by) not in ("string", "date"):
+        raise ValueError(f"Cannot group by procedure field: {by}")
+
+    columns = {"codes": ("coding", code_system)}
+    if by is not None:
+        columns["group"] = ("procedure", by)
+    table = read_table(root, columns, start_date, end_date, export_format)
+
+    # One row per (record, code), then count per (group, code, description)
+    codes = table.column("codes").combine_chunks()
+    flat = pc.list_flatten(codes)
+    parents = pc.list_parent_indices(codes)
+    groups = pc.take(table.column("group"), parents) if by is not None else pa.nulls(len(flat), pa.string())
+    exploded = pa.table({"group": groups, "code": flat.field("code"), "description": flat.field("description"),
+                         "n": flat.field("code")})
+    counts = exploded.group_by(["group", "code", "description"]).aggregate([("n", "count")])
+
+    # The same code can appear with more than one description; report it once, with the commonest
+    merged: Dict[Any, Dict[Any, Dict[str, Any]]] = {}
+    for row in counts.to_pylist():
+        entry = merged.setdefault(row["group"], {}).setdefault(row["code"], {"count": 0, "best": 0})
+        entry["count"] += row["n_count"]
+        if row["n_count"] > entry["best"]:
+            entry["best"], entry["description"] = row["n_count"], row["description"]
+
+    result = []
+    for group in sorted(merged, key=lambda value: (value is None, str(value))):
+        ranked = sorted(merged[group].items(), key=lambda item: (-item[1]["count"], item[0]))
+        result += [{"group": group.isoformat() if isinstance(group, datetime.date) else group, "code": code,
+                    "description": entry["description"], "count": entry["count"]}
+                   for code, entry in ranked[:top]]
+    return result
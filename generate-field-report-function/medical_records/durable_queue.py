@@ -0,0 +1,177 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS insert_queue (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS insert_queue_available ON insert_queue (status, available_at);
+"""
+
+
+class DurableQueue:
+    """Append-and-lease queue of records stored in a local SQLite file.
+
+    Records survive process restarts: a claimed record is only leased for
+    `lease_seconds`, so a record claimed by a process that dies is picked up
+    again once the lease expires. Records that keep failing are moved to the
+    'dead' status after `max_attempts` instead of being dropped.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        if path != ":memory:":
+            # The queue holds patient records; keep it private to this user.
+            os.chmod(path, 0o600)
+
+    def enqueue(self, payloads: List[Dict[str, Any]]) -> List[int]:
+        """Durably store payloads and return their queue ids."""
+        now = time.time()
+        ids = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for payload in payloads:
+                    cursor = self._conn.execute(
+                        "INSERT INTO insert_queue (payload, available_at, created_at) VALUES (?, ?, ?)",
+                        (json.dumps(payload), now, now))
+                    ids.append(cursor.lastrowid)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def claim(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """Lease up to `limit` available records."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, payload FROM insert_queue WHERE status = 'pending' AND available_at <= ? "
+                    "ORDER BY id LIMIT ?", (now, limit)).fetchall()
+                self._conn.executemany(
+                    "UPDATE insert_queue SET available_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    [(now + self.lease_seconds, row_id) for row_id, _ in rows])
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids: List[int]) -> None:
+        """Remove records that were written successfully."""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM insert_queue WHERE id = ?", [(row_id,) for row_id in ids])
+
+    def release(self, row_id: int, delay: float, error: str, retryable: bool = True) -> None:
+        """Make a failed record available again after `delay`, or dead-letter it."""
+        with self._lock:
+            attempts = self._conn.execute("SELECT attempts FROM insert_queue WHERE id = ?", (row_id,)).fetchone()
+            dead = not retryable or (attempts is not None and attempts[0] >= self.max_attempts)
+            self._conn.execute(
+                "UPDATE insert_queue SET status = ?, available_at = ?, last_error = ? WHERE id = ?",
+                ('dead' if dead else 'pending', time.time() + delay, error, row_id))
+        if dead:
+            logger.error(f"Queued record {row_id} moved to dead letter: {error}")
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM insert_queue WHERE status = 'pending'").fetchone()[0]
+
+
+class QueueWorker:
+    """Background thread that drains a DurableQueue through a row writer.
+
+    `write_rows` takes a list of rows and returns per-row errors (None on
+    success), like BatchWriter.write.
+    """
+
+    def __init__(self, queue: DurableQueue,
+                 write_rows: Callable[[List[Dict[str, Any]]], List[Optional[List[Dict[str, Any]]]]],
+                 backoff: Callable[[int], float], is_retryable_row_error: Callable[[Any], bool],
+                 batch_size: int = 100, poll_interval: float = 0.5):
+        self.queue = queue
+        self.write_rows = write_rows
+        self.backoff = backoff
+        self.is_retryable_row_error = is_retryable_row_error
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._failures = 0
+
+    def start(self) -> None:
+        """Start the worker thread if it is not already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="bigquery-queue-worker", daemon=True)
+                self._thread.start()
+
+    def notify(self) -> None:
+        """Wake the worker after new records were enqueued."""
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def drain_once(self) -> int:
+        """Write one batch of queued records; returns how many were claimed."""
+        claimed = self.queue.claim(self.batch_size)
+        if not claimed:
+            return 0
+        try:
+            results = self.write_rows([payload for _, payload in claimed])
+        except Exception as e:
+            results = [[{"reason": "insertFailed", "message": str(e)}]] * len(claimed)
+        succeeded = [row_id for (row_id, _), errors in zip(claimed, results) if not errors]
+        self.queue.ack(succeeded)
+        failed = [(row_id, errors) for (row_id, _), errors in zip(claimed, results) if errors]
+        for row_id, errors in failed:
+            self.queue.release(row_id, self.backoff(self._failures), json.dumps(errors),
+                               retryable=self.is_retryable_row_error(errors))
+        self._failures = self._failures + 1 if failed else 0
+        return len(claimed)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.drain_once():
+                    continue
+            except Exception as e:
+                logger.error(f"Queue worker error: {str(e)}")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
@@ -0,0 +1,88 @@
+import atexit
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Large enough that a busy day's partition gets a few files rather than one per request
+DEFAULT_MAX_ROWS = 1000
+DEFAULT_MAX_AGE_SECONDS = 60.0
+
+WriteFn = Callable[[List[Dict[str, Any]]], Any]
+
+
+class ExportBuffer:
+    """Process-wide buffer that exports records in batches from a background thread.
+
+    Requests only add records. The worker passes everything buffered to
+    `write_fn` once it holds `max_rows` records or its oldest record is
+    `max_age` seconds old, so each date partition gets one file per batch
+    instead of one per request. The buffer is in memory and is flushed at
+    interpreter exit; records in it when an instance is killed outright are
+    not exported (they are already in BigQuery).
+    """
+
+    def __init__(self, write_fn: WriteFn, max_rows: int = DEFAULT_MAX_ROWS,
+                 max_age: float = DEFAULT_MAX_AGE_SECONDS):
+        self.write_fn = write_fn
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._oldest = 0.0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    def add(self, records: List[Dict[str, Any]]) -> None:
+        """Buffer records for the worker to export."""
+        if not records:
+            return
+        with self._lock:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(records)
+            full = len(self._buffer) >= self.max_rows
+        self.start()
+        if full:
+            self._wake.set()
+
+    def start(self) -> None:
+        """Start the worker thread if it is not already running."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="export-worker", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def flush(self) -> int:
+        """Export everything currently buffered; returns how many records were taken."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            try:
+                self.write_fn(batch)
+            except Exception as e:
+                # The records are in BigQuery; a failed local export is logged and dropped
+                logger.error(f"Export of {len(batch)} records failed: {str(e)}")
+        return len(batch)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            with self._lock:
+                count = len(self._buffer)
+                age_left = self._oldest + self.max_age - time.monotonic() if count else self.max_age
+            if count and (count >= self.max_rows or age_left <= 0):
+                self.flush()
+                continue
+            self._wake.wait(age_left)
+            self._wake.clear()
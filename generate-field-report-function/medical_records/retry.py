@@ -0,0 +1,75 @@
+import logging
+import random
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying; everything else (400, 403, 404, ...) fails fast.
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    "ConnectionError", "ConnectionResetError", "Timeout", "TimeoutError", "ReadTimeout",
+    "ServiceUnavailable", "TooManyRequests", "InternalServerError", "BadGateway",
+    "GatewayTimeout", "DeadlineExceeded", "RetryError", "TransportError",
+}
+# Row-level reasons returned by insert_rows_json that are transient.
+RETRYABLE_ROW_REASONS = {"backendError", "internalError", "timeout", "rateLimitExceeded", "insertFailed"}
+
+
+class RetryPolicy:
+    """Capped exponential backoff with full jitter and a total deadline budget."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 2.0,
+                 deadline: float = 5.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retrying after the given (zero-based) attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def is_retryable(error: Exception) -> bool:
+    """Classify an exception as transient (retry) or permanent (fail fast)."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES
+
+
+def is_retryable_row_error(row_errors: Any) -> bool:
+    """Return True if every error reported for a row is transient."""
+    reasons = [error.get("reason") for error in row_errors or [] if isinstance(error, dict)]
+    return bool(reasons) and all(reason in RETRYABLE_ROW_REASONS for reason in reasons)
+
+
+def call_with_retry(fn: Callable[[], Any], policy: RetryPolicy,
+                    on_error: Optional[Callable[[Exception, int], None]] = None,
+                    sleep: Callable[[float], None] = time.sleep) -> Any:
+    """Call fn, retrying transient errors until attempts or the deadline run out.
+
+    The last error is re-raised when the call cannot be retried any further.
+    """
+    deadline = time.monotonic() + policy.deadline
+    for attempt in range(policy.max_attempts):
+        try:
+            return fn()
+        except Exception as e:
+            logger.error(f"Attempt {attempt + 1} failed: {str(e)}")
+            if on_error is not None:
+                on_error(e, attempt)
+            if not is_retryable(e):
+                logger.error("Error is not retryable.")
+                raise
+            if attempt == policy.max_attempts - 1:
+                logger.error("Max retries reached.")
+                raise
+            delay = policy.backoff(attempt)
+            if time.monotonic() + delay >= deadline:
+                logger.error("Retry deadline exceeded.")
+                raise
+            sleep(delay)
@@ -0,0 +1,213 @@
+import bisect
+import contextlib
+import functools
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Only metric names, stage names and numbers are recorded here. Never pass
+# record values, prompts or completions as labels: they contain PHI.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style, one series per label set."""
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            # One count per bucket, then +Inf count and sum
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        result = {}
+        for labels, series in self._series.items():
+            counts = series[:-1]
+            result[_format_labels(labels) or "total"] = {
+                "count": int(sum(counts)), "sum": round(series[-1], 6),
+                "buckets": {str(bound): int(sum(counts[:i + 1])) for i, bound in enumerate(self.buckets)},
+            }
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            cumulative = 0.0
+            for bound, count in zip(list(self.buckets) + ["+Inf"], series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', str(bound)),))} {int(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {int(cumulative)}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float, labels: Labels) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {_format_labels(labels) or "total": value for labels, value in self._values.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_format_labels(labels)} {value}" for labels, value in sorted(self._values.items())]
+        return lines
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Process-wide histograms and counters, rendered as Prometheus text or JSON."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help_text, buckets)
+            return self._metrics[name]
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, help_text)
+            return self._metrics[name]
+
+    def observe(self, histogram: Histogram, value: float, **labels: str) -> None:
+        with self._lock:
+            histogram.observe(value, tuple(sorted(labels.items())))
+
+    def inc(self, counter: Counter, amount: float = 1, **labels: str) -> None:
+        with self._lock:
+            counter.inc(amount, tuple(sorted(labels.items())))
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            lines: List[str] = []
+            for name in sorted(self._metrics):
+                lines += self._metrics[name].render()
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: metric.snapshot() for name, metric in sorted(self._metrics.items())}
+
+
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram("request_duration_seconds", "Handler latency by function and status.")
+STAGE_SECONDS = metrics.histogram("stage_duration_seconds", "Latency of each request stage.")
+MODEL_SECONDS = metrics.histogram("model_latency_seconds", "Model call latency.")
+PROMPT_BYTES = metrics.histogram("prompt_bytes", "Size of prompts sent to the model.", BYTES_BUCKETS)
+OUTPUT_BYTES = metrics.histogram("output_bytes", "Size of model completions.", BYTES_BUCKETS)
+JSON_REPAIR_ATTEMPTS = metrics.histogram(
+    "json_repair_attempts", "Candidate objects tried when extracting JSON from a completion.", COUNT_BUCKETS)
+BIGQUERY_RETRIES = metrics.histogram("bigquery_insert_retries", "Retries per BigQuery insert call.", COUNT_BUCKETS)
+
+
+class RequestTiming:
+    """Durations of the stages of one request, for the Server-Timing header."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+
+    def server_timing(self) -> str:
+        """Server-Timing header value; repeated stages (e.g. one model call per chunk) are summed."""
+        totals: Dict[str, float] = {}
+        for stage, seconds in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        totals["total"] = time.perf_counter() - self.start
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+_local = threading.local()
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return getattr(_local, "timing", None)
+
+
+@contextlib.contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a block as a request stage, in the stage histogram and the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.observe(STAGE_SECONDS, elapsed, stage=stage)
+        timing = current_timing()
+        if timing is not None:
+            timing.add(stage, elapsed)
+
+
+def instrument_handler(function_name: str) -> Callable:
+    """Decorate an HTTP handler to time the request and add Server-Timing to its response."""
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(request):
+            timing = RequestTiming()
+            previous, _local.timing = current_timing(), timing
+            status = 500
+            try:
+                result = handler(request)
+                status = _status_of(result)
+                return _with_server_timing(result, timing.server_timing())
+            finally:
+                _local.timing = previous
+                metrics.observe(REQUEST_SECONDS, time.perf_counter() - timing.start,
+                                function=function_name, status=str(status))
+        return wrapper
+    return decorator
+
+
+def _status_of(result: Any) -> int:
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        return result[1]
+    return getattr(result, "status_code", 200)
+
+
+def _with_server_timing(result: Any, value: str) -> Any:
+    timing_headers = {"Server-Timing": value, "Timing-Allow-Origin": "*"}
+    if isinstance(result, tuple) and len(result) == 3 and isinstance(result[2], dict):
+        return result[0], result[1], {**result[2], **timing_headers}
+    if hasattr(result, "headers"):
+        # Streaming responses report only the time to the first byte
+        result.headers.update(timing_headers)
+    return result
+
+
+def metrics_response(request) -> Tuple[str, int, Dict[str, str]]:
+    """Body for a /metrics route: Prometheus text, or JSON with ?format=json."""
+    if request.args.get("format") == "json":
+        return json.dumps(metrics.snapshot()), 200, {"Content-Type": "application/json"}
+    return metrics.render_prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4"}
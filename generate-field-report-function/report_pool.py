@@ -0,0 +1,141 @@
+import collections
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class VertexReportBackend:
+    """Generates field reports with a Gemini model, initializing Vertex AI once per process.
+
+    `safety_settings` maps harm category names to block threshold names, e.g.
+    {"HARM_CATEGORY_HARASSMENT": "OFF"}; the SDK objects are built with the model.
+    """
+
+    def __init__(self, project: str, location: str, model_name: str, system_instruction: List[str],
+                 generation_config: Dict[str, Any], safety_settings: Dict[str, str]):
+        self.project = project
+        self.location = location
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+        self.generation_config = generation_config
+        self.safety_settings = safety_settings
+        self._lock = threading.Lock()
+        self._model = None
+        self._safety_settings: List[Any] = []
+
+    def get_model(self):
+        """Return the shared GenerativeModel, creating it on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import vertexai
+                    from vertexai.generative_models import GenerativeModel, SafetySetting
+                    vertexai.init(project=self.project, location=self.location)
+                    self._safety_settings = [
+                        SafetySetting(category=SafetySetting.HarmCategory[category],
+                                      threshold=SafetySetting.HarmBlockThreshold[threshold])
+                        for category, threshold in self.safety_settings.items()
+                    ]
+                    self._model = GenerativeModel(self.model_name, system_instruction=self.system_instruction)
+        return self._model
+
+    def generate(self, instruction: str = "generate a field report") -> str:
+        responses = self.get_model().generate_content(
+            [instruction],
+            generation_config=self.generation_config,
+            safety_settings=self._safety_settings,
+            stream=True,
+        )
+
+        full_response = ""
+        for response in responses:
+            full_response += response.text
+
+        return full_response
+
+
+class ReportPool:
+    """Pool of pre-generated reports, refilled in the background.
+
+    When the pool drops below `low_watermark`, up to `workers` background threads
+    generate reports until it holds `high_watermark`. `get()` never waits for
+    generation: it returns None when the pool is empty so the caller can fall
+    back to generating on demand.
+    """
+
+    def __init__(self, generate: Callable[[], str], low_watermark: int = 2, high_watermark: int = 5,
+                 workers: int = 2, error_backoff: float = 5.0):
+        if not 0 <= low_watermark <= high_watermark:
+            raise ValueError("Expected 0 <= low_watermark <= high_watermark")
+        self.generate = generate
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.workers = workers
+        self.error_backoff = error_backoff
+        self._lock = threading.Lock()
+        self._reports: Deque[str] = collections.deque()
+        self._in_flight = 0
+        self._active_workers = 0
+        self._retry_after = 0.0
+        self.stats = {"served_from_pool": 0, "pool_empty": 0, "generated": 0, "errors": 0}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._reports)
+
+    def get(self) -> Optional[str]:
+        """Take a ready report, or None if the pool is empty; starts a refill when running low."""
+        with self._lock:
+            report = self._reports.popleft() if self._reports else None
+            self.stats["served_from_pool" if report is not None else "pool_empty"] += 1
+        self.refill()
+        return report
+
+    def refill(self) -> None:
+        """Start background workers if the pool is below its low watermark."""
+        with self._lock:
+            if len(self._reports) + self._in_flight >= self.low_watermark and self._reports:
+                return
+            if time.monotonic() < self._retry_after:
+                return
+            to_start = max(self.workers - self._active_workers, 0)
+            self._active_workers += to_start
+        for _ in range(to_start):
+            threading.Thread(target=self._work, name="report-pool", daemon=True).start()
+
+    def wait_until_filled(self, count: Optional[int] = None, timeout: float = 60.0) -> bool:
+        """Block until the pool holds `count` reports (default: the high watermark)."""
+        target = self.high_watermark if count is None else count
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if len(self) >= target:
+                return True
+            time.sleep(0.01)
+        return len(self) >= target
+
+    def _work(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    if len(self._reports) + self._in_flight >= self.high_watermark:
+                        return
+                    self._in_flight += 1
+                try:
+                    report = self.generate()
+                except Exception as e:
+                    logger.error(f"Error pre-generating field report: {str(e)}")
+                    with self._lock:
+                        self._in_flight -= 1
+                        self.stats["errors"] += 1
+                        self._retry_after = time.monotonic() + self.error_backoff
+                    return
+                with self._lock:
+                    self._in_flight -= 1
+                    self._reports.append(report)
+                    self.stats["generated"] += 1
+        finally:
+            with self._lock:
+                self._active_workers -= 1
@@ -0,0 +1,245 @@
+import copy
+import datetime
+import random
+from typing import Any, Dict, List, Tuple
+
+from medical_records.record_schema import RECORD_SCHEMA
+
+FIRST_NAMES = {
+    "male": ["John", "Michael", "Carlos", "David", "James", "Andre", "Kevin", "Luis", "Ryan", "Marcus"],
+    "female": ["Jane", "Maria", "Emily", "Aisha", "Sarah", "Keisha", "Laura", "Nicole", "Rachel", "Ana"],
+}
+LAST_NAMES = ["Doe", "Smith", "Garcia", "Nguyen", "Johnson", "Brown", "Lee", "Martinez", "Walker", "Patel",
+              "Kim", "Robinson", "Hughes", "Ortiz", "Reed"]
+ENLISTED_RANKS = ["Private", "Specialist", "Corporal", "Sergeant", "Staff Sergeant", "Lance Corporal"]
+OFFICER_RANKS = ["Captain", "Major", "Lieutenant Commander", "Lieutenant Colonel"]
+LOCATIONS = ["Field Surgical Unit Alpha, Operating Room One", "Forward Surgical Team Bravo, Operating Room Two",
+             "Role 2 Medical Treatment Facility, Operating Room One", "Combat Support Hospital, Operating Room Three",
+             "Forward Resuscitative Surgical Team Charlie, Tent Two"]
+FILLERS = ["Uh, ", "Um, ", "Okay, so, ", "Let's see, ", "", "", ""]
+DISPOSITIONS = ["transferred to a higher level of care for postoperative monitoring",
+                "admitted to the ward for observation", "prepared for aeromedical evacuation"]
+
+# Each scenario lists codes from the bundled code index sample. "{side}" is
+# replaced with "right" or "left", and "{n}" with the matching ICD-10 laterality digit.
+# "{pronoun}" and "{possessive}" in the indication follow the patient's sex.
+SCENARIOS: List[Dict[str, Any]] = [
+    {
+        "preoperative": "Gunshot wound to the {side} lower extremity with suspected vascular injury",
+        "postoperative": "Gunshot wound to the {side} lower extremity with complete transection of the superficial femoral artery",
+        "procedures": ["Exploration of {side} thigh", "Superficial femoral artery repair with interposition saphenous vein graft",
+                       "{Side} lower extremity fasciotomy"],
+        "indication": "{pronoun} had diminished distal pulses and we were concerned about compartment syndrome",
+        "cpt": [("35256", "Repair blood vessel with vein graft, lower extremity"),
+                ("27892", "Decompression fasciotomy, leg, anterior and/or lateral compartments, with debridement")],
+        "icd_10": [("S71.13{n}A", "Puncture wound without foreign body, {side} thigh, initial encounter"),
+                   ("S75.02{n}A", "Major laceration of femoral artery, {side} leg, initial encounter"),
+                   ("Y36.430A", "War operations involving firearm discharge and other forms of conventional warfare, military personnel, initial encounter")],
+        "snomed_ct": [("397193006", "Repair of femoral artery"), ("81121007", "Fasciotomy")],
+        "blood_loss": (500, 1200),
+    },
+    {
+        "preoperative": "Penetrating chest trauma with suspected tension pneumothorax",
+        "postoperative": "Traumatic tension pneumothorax, {side} chest",
+        "procedures": ["Needle decompression", "{Side} tube thoracostomy"],
+        "indication": "{pronoun} was hypotensive with absent breath sounds on the {side} and tracheal deviation",
+        "cpt": [("32554", "Thoracentesis, needle or catheter, aspiration of the pleural space, without imaging guidance"),
+                ("32551", "Tube thoracostomy, open, includes connection to drainage system")],
+        "icd_10": [("S27.0XXA", "Traumatic pneumothorax, initial encounter")],
+        "snomed_ct": [("264957007", "Insertion of pleural tube drain")],
+        "blood_loss": (50, 300),
+    },
+    {
+        "preoperative": "Blast injury to the {side} lower leg with mangled extremity",
+        "postoperative": "Non-salvageable crush injury of the {side} lower leg",
+        "procedures": ["{Side} below knee amputation", "Debridement of muscle and fascia"],
+        "indication": "an IED blast left the {side} lower leg mangled with no distal perfusion",
+        "cpt": [("27880", "Amputation, leg, through tibia and fibula"),
+                ("11044", "Debridement, muscle and/or fascia, first 20 sq cm or less")],
+        "icd_10": [("S87.8{n}XA", "Crushing injury of {side} lower leg, initial encounter"),
+                   ("Y36.230A", "War operations involving explosion of improvised explosive device [IED], military personnel, initial encounter")],
+        "snomed_ct": [("79733001", "Below knee amputation"), ("36777000", "Debridement")],
+        "blood_loss": (600, 1500),
+    },
+    {
+        "preoperative": "Penetrating abdominal trauma with hemodynamic instability",
+        "postoperative": "Major laceration of the liver",
+        "procedures": ["Exploratory laparotomy", "Suture repair of liver laceration"],
+        "indication": "{pronoun} had a distended abdomen and was in hypovolemic shock",
+        "cpt": [("49000", "Exploratory laparotomy, exploratory celiotomy with or without biopsy"),
+                ("47350", "Management of liver hemorrhage, simple suture of liver wound or injury")],
+        "icd_10": [("S36.116A", "Major laceration of liver, initial encounter"), ("R57.1", "Hypovolemic shock")],
+        "snomed_ct": [("70871006", "Exploratory laparotomy")],
+        "blood_loss": (800, 2000),
+    },
+    {
+        "preoperative": "Blunt abdominal trauma with suspected splenic injury",
+        "postoperative": "Laceration of the spleen",
+        "procedures": ["Exploratory laparotomy", "Total splenectomy"],
+        "indication": "{pronoun} had left upper quadrant tenderness and falling blood pressure after a vehicle rollover",
+        "cpt": [("49000", "Exploratory laparotomy, exploratory celiotomy with or without biopsy"),
+                ("38100", "Splenectomy, total")],
+        "icd_10": [("S36.030A", "Superficial (capsular) laceration of spleen, initial encounter")],
+        "snomed_ct": [("70871006", "Exploratory laparotomy"), ("234319005", "Splenectomy")],
+        "blood_loss": (400, 1200),
+    },
+    {
+        "preoperative": "Acute appendicitis",
+        "postoperative": "Acute appendicitis without perforation",
+        "procedures": ["Open appendectomy"],
+        "indication": "{pronoun} had right lower quadrant pain, fever and rebound tenderness for a day",
+        "cpt": [("44950", "Appendectomy")],
+        "icd_10": [("K35.80", "Unspecified acute appendicitis")],
+        "snomed_ct": [("80146002", "Appendectomy")],
+        "blood_loss": (20, 100),
+    },
+    {
+        "preoperative": "Open fracture of the {side} tibia",
+        "postoperative": "Fracture of the shaft of the {side} tibia with soft tissue injury",
+        "procedures": ["Irrigation and debridement", "Application of uniplanar external fixator, {side} tibia"],
+        "indication": "{pronoun} had an obvious deformity of the {side} lower leg with an open wound",
+        "cpt": [("11044", "Debridement, muscle and/or fascia, first 20 sq cm or less"),
+                ("20690", "Application of a uniplanar external fixation system")],
+        "icd_10": [("S82.20{n}A", "Unspecified fracture of shaft of {side} tibia, initial encounter for closed fracture"),
+                   ("S81.81{n}A", "Laceration without foreign body, {side} lower leg, initial encounter")],
+        "snomed_ct": [("36777000", "Debridement")],
+        "blood_loss": (100, 400),
+    },
+    {
+        "preoperative": "Closed head injury with declining level of consciousness",
+        "postoperative": "Acute traumatic subdural hematoma",
+        "procedures": ["{Side} craniotomy for evacuation of subdural hematoma"],
+        "indication": "{possessive} GCS dropped from fourteen to nine with a blown {side} pupil",
+        "cpt": [("61312", "Craniectomy or craniotomy for evacuation of hematoma, supratentorial, extradural or subdural")],
+        "icd_10": [("S06.5XAA", "Traumatic subdural hemorrhage with loss of consciousness status unknown, initial encounter")],
+        "snomed_ct": [],
+        "blood_loss": (200, 600),
+    },
+]
+
+ONES = ["zero", "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+        "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen"]
+TENS = ["", "", "twenty", "thirty", "forty", "fifty", "sixty", "seventy", "eighty", "ninety"]
+
+
+def spoken_number(n: int) -> str:
+    """Spell out 0-99 the way it would be dictated ("twenty-eight")."""
+    if n < 20:
+        return ONES[n]
+    tens, ones = divmod(n, 10)
+    return TENS[tens] + (f"-{ONES[ones]}" if ones else "")
+
+
+def ordinal(n: int) -> str:
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def _lower_first(text: str) -> str:
+    return text[:1].lower() + text[1:]
+
+
+def _format(value: str, side: str, sex: str = "male") -> str:
+    return value.format(side=side, Side=side.capitalize(), n="1" if side == "right" else "2",
+                        pronoun="he" if sex == "male" else "she", possessive="his" if sex == "male" else "her")
+
+
+def _codes(pairs: List[Tuple[str, str]], side: str) -> List[Dict[str, str]]:
+    return [{"code": _format(code, side), "description": _format(description, side)} for code, description in pairs]
+
+
+class TemplateReportBackend:
+    """Deterministic offline field report generator.
+
+    Report `index` under a given `seed` is always the same, so interrupted
+    batch runs can be resumed and load tests replayed without Vertex AI. Each
+    report comes with the structured record it was rendered from, which serves
+    as ground truth for extraction. Exposes the same `generate()` method as
+    VertexReportBackend.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+        self._count = 0
+
+    def generate(self) -> str:
+        dictation, _ = self.generate_example(self._count)
+        self._count += 1
+        return dictation
+
+    def generate_example(self, index: int) -> Tuple[str, Dict[str, Any]]:
+        """Return (dictation, record) for report number `index`."""
+        rng = random.Random(f"{self.seed}:{index}")
+        record, indication = self._generate_record(rng)
+        return self._render(record, indication, rng), record
+
+    def _generate_record(self, rng: random.Random) -> Tuple[Dict[str, Any], str]:
+        scenario = rng.choice(SCENARIOS)
+        side = rng.choice(["right", "left"])
+        sex = rng.choice(["male", "male", "male", "female"])
+        date = datetime.date(2023, 1, 1) + datetime.timedelta(days=rng.randrange(730))
+        surgeon, assistant = rng.sample(LAST_NAMES, 2)
+        low, high = scenario["blood_loss"]
+        blood_loss = rng.randrange(low, high, 50 if high > 100 else 10)
+
+        record = copy.deepcopy(RECORD_SCHEMA)
+        record["patient"].update({
+            "name": f"{rng.choice(FIRST_NAMES[sex])} {rng.choice(LAST_NAMES)}",
+            "age": rng.randint(18, 45),
+            "sex": sex,
+            "medical_record_number": "".join(rng.choice("0123456789") for _ in range(10)),
+        })
+        record["procedure"].update({
+            "date": date.isoformat(),
+            "location": rng.choice(LOCATIONS),
+            "preoperative_diagnosis": _format(scenario["preoperative"], side),
+            "postoperative_diagnosis": _format(scenario["postoperative"], side),
+            "procedures_performed": [_format(procedure, side) for procedure in scenario["procedures"]],
+            "surgeon": f"{rng.choice(OFFICER_RANKS)} {rng.choice(FIRST_NAMES['male'] + FIRST_NAMES['female'])} {surgeon}",
+            "assistant_surgeon": f"{rng.choice(OFFICER_RANKS)} {rng.choice(FIRST_NAMES['male'])} {assistant}",
+            "anesthesiologist": f"Major {rng.choice(FIRST_NAMES['female'])} {rng.choice(LAST_NAMES)}, CRNA",
+            "estimated_blood_loss": f"{blood_loss} mL",
+            "fluids_administered": f"{rng.randint(1, 4)} liters of lactated Ringer's solution",
+            "complications": rng.choice(["None", "None", "None", "Transient hypotension on induction"]),
+            "disposition": rng.choice(DISPOSITIONS).capitalize(),
+        })
+        record["coding"] = {
+            "snomed_ct": _codes(scenario["snomed_ct"], side),
+            "icd_10": _codes(scenario["icd_10"], side),
+            "cpt": _codes(scenario["cpt"], side),
+        }
+        return record, _format(scenario["indication"], side, sex)
+
+    def _render(self, record: Dict[str, Any], indication: str, rng: random.Random) -> str:
+        """Render a record as a spoken dictation with natural fillers and spelled-out numbers."""
+        patient, procedure = record["patient"], record["procedure"]
+        date = datetime.date.fromisoformat(procedure["date"])
+        pronoun = "he" if patient["sex"] == "male" else "she"
+
+        def spoken(text: str) -> str:
+            filler = rng.choice(FILLERS)
+            return filler + _lower_first(text) if filler else text[:1].upper() + text[1:]
+
+        mrn = ", ".join(spoken_number(int(digit)) for digit in patient["medical_record_number"])
+        procedures = [_lower_first(name) for name in procedure["procedures_performed"]]
+        procedure_list = procedures[0] if len(procedures) == 1 else ", ".join(procedures[:-1]) + f" and {procedures[-1]}"
+
+        paragraphs = [
+            f"This is {procedure['surgeon']}, dictating an operative report for {rng.choice(ENLISTED_RANKS)} "
+            f"{patient['name']}. " + spoken(f"{pronoun} is {spoken_number(patient['age'])} years old, "
+                                            f"{patient['sex']}.") + f" Medical record number is {mrn}.",
+            spoken(f"The date of the procedure was {date.strftime('%B')} {ordinal(date.day)}, {date.year}.")
+            + f" This was performed at {procedure['location']}.",
+            f"{procedure['assistant_surgeon']} was the Assistant Surgeon, and {procedure['anesthesiologist']}, "
+            f"was the Anesthesiologist.",
+            f"Preoperative diagnosis: {procedure['preoperative_diagnosis']}. "
+            + spoken(f"Postoperative diagnosis: {procedure['postoperative_diagnosis']}."),
+            f"The procedure we performed was {procedure_list}.",
+            "Now, for the indications... " + spoken(f"{indication}."),
+            f"Estimated blood loss was approximately {procedure['estimated_blood_loss'].replace(' mL', ' milliliters')}. "
+            f"We gave {procedure['fluids_administered']}.",
+            spoken(f"Complications: {procedure['complications'].lower()}.")
+            + f" The patient was {_lower_first(procedure['disposition'])}.",
+            f"Okay, that concludes this operative report. Dictated by {procedure['surgeon']}.",
+        ]
+        return "\n\n".join(paragraphs)
@@ -0,0 +1,122 @@
+import contextlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+DEFAULT_MAX_CLIENTS = 10000
+
+
+class Overloaded(Exception):
+    """A request was turned away; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Too many requests ({reason}), retry after {retry_after:.0f} s")
+        self.reason = reason
+        # Whole seconds, as sent in the Retry-After header
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Per-client rate limit: `rate` requests per second on average, bursts of up to `burst`.
+
+    Buckets are kept for the `max_clients` most recently seen clients; a client
+    evicted from the table starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = DEFAULT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    def acquire(self, client: str, cost: float = 1.0) -> None:
+        """Take `cost` tokens from the client's bucket, or raise Overloaded with the time until they refill."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = None
+            else:
+                retry_after = (cost - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        if retry_after is not None:
+            raise Overloaded("rate_limited", retry_after)
+
+
+class ConcurrencyLimiter:
+    """At most `max_concurrency` calls at once, with up to `max_queue` callers waiting for a slot.
+
+    A caller that finds the queue full, or waits longer than `queue_timeout`,
+    gets Overloaded right away instead of piling onto the backend. Its
+    Retry-After is the expected time for the calls ahead of it to finish,
+    from a moving average of how long calls hold a slot.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self._average_hold = 1.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    def retry_after(self) -> float:
+        """Seconds until the calls running and queued now are expected to have finished."""
+        return self._average_hold * (self.waiting + 1) / self.max_concurrency
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """Take a slot, waiting at most `timeout` (default queue_timeout); returns the seconds waited."""
+        start = time.monotonic()
+        deadline = start + (self.queue_timeout if timeout is None else timeout)
+        with self._condition:
+            if self.active >= self.max_concurrency:
+                if self.waiting >= self.max_queue:
+                    raise Overloaded("queue_full", self.retry_after())
+                self.waiting += 1
+                try:
+                    while self.active >= self.max_concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise Overloaded("queue_timeout", self.retry_after())
+                        self._condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        return time.monotonic() - start
+
+    def release(self, held: float) -> None:
+        with self._condition:
+            self.active -= 1
+            self._average_hold += 0.2 * (held - self._average_hold)
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[float]:
+        """Hold a slot for the duration of the block; yields the seconds spent waiting for it."""
+        if not self.enabled:
+            yield 0.0
+            return
+        waited = self.acquire(timeout)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
@@ -0,0 +1,159 @@
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+# One token per match: a complete string literal, a comment, a structural
+# character, or a run of anything else (whitespace, numbers, literals).
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|//[^\n]*|/\*.*?(?:\*/|$)|[{}\[\],]|[^"/{}\[\],]+|[/"]', re.DOTALL)
+_MAX_START_ATTEMPTS = 5
+
+
+class _Unterminated(Exception):
+    """The text ended before the object was closed."""
+
+
+class TruncatedJSONError(json.JSONDecodeError):
+    """The completion ended before its JSON object was closed, e.g. at the output token limit."""
+
+
+def extract_json_object(text: str) -> Dict[str, Any]:
+    """Extract the first JSON object from an LLM completion and return it as a dict.
+
+    Tolerates a BOM, Markdown fences and prose around the object, // and /* */
+    comments and trailing commas, without touching the contents of strings.
+    The object is scanned once and parsed once. Raises json.JSONDecodeError when
+    no complete object can be found (for example, a truncated completion).
+    """
+    return find_json_object(text)[0]
+
+
+def find_json_object(text: str) -> Tuple[Dict[str, Any], int]:
+    """Like extract_json_object, also returning how many candidate objects were tried."""
+    start = text.find("{")
+    attempts = 0
+    error = json.JSONDecodeError("No JSON object found", text, 0)
+    while start != -1 and attempts < _MAX_START_ATTEMPTS:
+        attempts += 1
+        try:
+            return _parse_from(text, start), attempts
+        except _Unterminated as e:
+            # Retrying from a nested brace would return a fragment of the object.
+            raise TruncatedJSONError(str(e), text, start) from None
+        except json.JSONDecodeError as e:
+            error = e
+        # Balanced but invalid, e.g. braces in prose before the object; try the next one.
+        start = text.find("{", start + 1)
+    raise error
+
+
+def is_unterminated(text: str) -> bool:
+    """True if the first JSON object in the text is cut off before it closes.
+
+    Only counts brackets and quotes, without parsing, so it is cheap enough to
+    run on every completion; parsing is left to find_json_object.
+    """
+    start = text.find("{")
+    if start == -1:
+        return False
+    depth = 0
+    for match in _TOKEN.finditer(text, start):
+        token = match.group()
+        if token == '"':
+            return True  # a string with no closing quote
+        if token in "{[":
+            depth += 1
+        elif token in "}]":
+            depth -= 1
+            if depth == 0:
+                return False
+    return True
+
+
+def salvage_json_object(text: str) -> Dict[str, Any]:
+    """Recover the complete part of a truncated JSON object.
+
+    The object is cut after its last complete member or array element and the
+    brackets still open there are closed, so every value that was fully
+    generated is kept and the one that was cut off is dropped. Tolerates the
+    same noise as extract_json_object. Raises json.JSONDecodeError when the
+    text has no object.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise json.JSONDecodeError("No JSON object found", text, 0)
+    parts: List[str] = []
+    stack: List[str] = []
+    # (number of parts, brackets open) at the last point where everything before was complete
+    safe: Tuple[int, List[str]] = (0, [])
+    pending_comma = False
+    expect_value = False
+    for match in _TOKEN.finditer(text, start):
+        token = match.group()
+        first = token[0]
+        if first == "/" and len(token) > 1:
+            continue  # comment
+        if token == '"':
+            break  # a string with no closing quote: the rest of the text is inside it
+        if first == ",":
+            if not pending_comma:
+                safe = (len(parts), list(stack))
+            pending_comma = True
+            expect_value = bool(stack) and stack[-1] == "["
+            continue
+        if not token.strip():
+            continue
+        if pending_comma:
+            pending_comma = False
+            if first not in "}]":
+                parts.append(",")
+        parts.append(token)
+        if first in "{[":
+            stack.append(first)
+            expect_value = first == "["
+            safe = (len(parts), list(stack))
+        elif first in "}]":
+            stack.pop()
+            if not stack:
+                return json.loads("".join(parts))
+            expect_value = False
+            safe = (len(parts), list(stack))
+        elif first == '"' and expect_value:
+            expect_value = False  # a complete string value
+            safe = (len(parts), list(stack))
+        else:
+            # Keys, and runs such as ": " before a value or a number that may be cut short
+            expect_value = token.strip().endswith(":")
+    length, open_brackets = safe
+    closing = "".join("}" if bracket == "{" else "]" for bracket in reversed(open_brackets))
+    return json.loads("".join(parts[:length]) + closing)
+
+
+def _parse_from(text: str, start: int) -> Dict[str, Any]:
+    parts = []
+    depth = 0
+    pending_comma = False
+    for match in _TOKEN.finditer(text, start):
+        token = match.group()
+        first = token[0]
+        if first == "/" and len(token) > 1:
+            continue  # comment
+        if first == ",":
+            pending_comma = True
+            continue
+        if not token.strip():
+            continue
+        if pending_comma:
+            pending_comma = False
+            if first not in "}]":
+                parts.append(",")  # drop trailing commas only
+        parts.append(token)
+        if first in "{[":
+            depth += 1
+        elif first in "}]":
+            depth -= 1
+            if depth == 0:
+                result = json.loads("".join(parts))
+                if not isinstance(result, dict):
+                    raise json.JSONDecodeError("Expected a JSON object", text, start)
+                return result
+    raise _Unterminated("Unterminated JSON object")
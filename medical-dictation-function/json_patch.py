@@ -0,0 +1,52 @@
+import copy
+from typing import Any, Dict, List
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(token: str) -> str:
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+def make_patch(before: Dict[str, Any], after: Dict[str, Any], path: str = "") -> List[Dict[str, Any]]:
+    """RFC 6902 operations that turn `before` into `after`.
+
+    Objects are compared key by key; lists and scalars are replaced whole, since
+    code lists are small and rarely change in place.
+    """
+    operations: List[Dict[str, Any]] = []
+    for key, value in after.items():
+        pointer = f"{path}/{_escape(key)}"
+        if key not in before:
+            operations.append({"op": "add", "path": pointer, "value": value})
+        elif isinstance(value, dict) and isinstance(before[key], dict):
+            operations.extend(make_patch(before[key], value, pointer))
+        elif value != before[key]:
+            operations.append({"op": "replace", "path": pointer, "value": value})
+    for key in before:
+        if key not in after:
+            operations.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+    return operations
+
+
+def apply_patch(document: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply add/replace/remove operations on object members and return a new document.
+
+    The server-side counterpart of applyRecordPatch in the frontend, used to
+    check that make_patch round-trips.
+    """
+    result = copy.deepcopy(document)
+    for operation in operations:
+        *parents, key = [_unescape(token) for token in operation["path"].split("/")[1:]]
+        target = result
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        if operation["op"] == "remove":
+            target.pop(key, None)
+        elif operation["op"] in ("add", "replace"):
+            target[key] = copy.deepcopy(operation["value"])
+        else:
+            raise ValueError(f"Unsupported patch operation: {operation['op']}")
+    return result
@@ -1,158 +1,137 @@
 import functions_framework
 from flask import jsonify, Response
-from flask_cors import CORS
+import copy
 import json
 import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import traceback
-from google.cloud import aiplatform
-from google.cloud.aiplatform.gapic.schema import predict
-from google.protobuf import json_format
-from google.protobuf.struct_pb2 import Value
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from datetime import datetime
-import re
+
+from admission import ConcurrencyLimiter, Overloaded, TokenBucket
+from json_extract import TruncatedJSONError, find_json_object, is_unterminated, salvage_json_object
+from json_patch import make_patch
+from medical_records import telemetry
+from medical_records.code_index import default_code_indexes
+from medical_records.idempotency import CACHEABLE_STATUSES
+from medical_records.insert_path import ASYNC_UNAVAILABLE_MESSAGE, shared_insert_path
+from medical_records.record_schema import COMPILED_SCHEMA, RECORD_SCHEMA, PromptGenerator
+from medical_records.telemetry import JSON_REPAIR_ATTEMPTS, MODEL_SECONDS, OUTPUT_BYTES, PROMPT_BYTES, metrics
+from medical_records.warmup import start_warm_up
+from pre_extract import SUPPORTED_FIELDS, pre_extract
+from prediction_cache import PredictionCache, cache_key
+from prompts import (CODE_SYSTEMS, chunk_transcript, create_coding_prompt, create_dictation_prompt,
+                     create_narrative_prompt, create_prompt, PROMPT_MODES)
+from session_store import create_session_store, new_session_id
+from single_flight import SingleFlight
+from streaming_json import IncrementalFieldParser
+from token_budget import turn_budget
 
 # Constants
 PROJECT_ID = "<redacted>"
+LOCATION = "us-central1"
 DATASET_ID = "health"
 TABLE_ID = "usu_procedures"
+# Default prompt mode ("full" or "compact"); requests can override it with "promptMode"
+PROMPT_MODE = os.environ.get("PROMPT_MODE", "full")
+# "dictation" mode extracts every field from a full transcript in as few model calls as possible
+MAX_DICTATION_CHARS = 50000
+DICTATION_MAX_OUTPUT_TOKENS = 2048
+# "fanout" pipeline: narrative fields first, then one small concurrent call per code system
+NARRATIVE_MAX_OUTPUT_TOKENS = 512
+CODING_MAX_OUTPUT_TOKENS = 256
+# "autoSubmit": true inserts a finished record directly; "async" queues it (INSERT_QUEUE_PATH)
+AUTO_SUBMIT_MODES = (True, "async")
+# Short answers to the prompts for age, sex, MRN and date are parsed locally when unambiguous
+PRE_EXTRACT = os.environ.get("PRE_EXTRACT", "true").lower() != "false"
+# Unset (the default), "autoSubmit": "async" is refused: there is no durable queue
+INSERT_QUEUE_PATH = os.environ.get("INSERT_QUEUE_PATH")
+# A completion cut off at maxOutputTokens is continued this many times, then salvaged
+MAX_CONTINUATIONS = int(os.environ.get("MAX_CONTINUATIONS", "1"))
+TRUNCATION_FINISH_REASONS = ("MAX_TOKENS", "LENGTH")
+TRUNCATED_MESSAGE = ("Part of the response was cut off. The fields that were complete have been saved; "
+                     "please repeat anything that is missing.")
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize AI Platform client
-client_options = {"api_endpoint": "us-central1-aiplatform.googleapis.com"}
-client = aiplatform.gapic.PredictionServiceClient(client_options=client_options)
-
-# JSON schema for BigQuery record
-RECORD_SCHEMA: Dict[str, Any] = {
-    "patient": {
-        "name": "",
-        "age": 0,
-        "sex": "",
-        "medical_record_number": ""
-    },
-    "procedure": {
-        "date": "",
-        "location": "",
-        "preoperative_diagnosis": "",
-        "postoperative_diagnosis": "",
-        "procedures_performed": [],
-        "surgeon": "",
-        "assistant_surgeon": "",
-        "anesthesiologist": "",
-        "estimated_blood_loss": "",
-        "fluids_administered": "",
-        "complications": "",
-        "disposition": ""
-    },
-    "coding": {
-        "snomed_ct": [],
-        "icd_10": [],
-        "cpt": []
-    }
-}
+# Module state below is shared by every request thread: functions-framework serves a
+# deployed function with gunicorn threads, and scripts/serve.py with SERVER_THREADS.
+# The clients are created once under a lock and are safe to share; the caches, the
+# in-flight calls, sessions, code indexes, insert path and metrics lock internally;
+# prompt_generator and GENERATION_PARAMETERS are read-only. Records belong to one
+# request: copy module-level templates such as RECORD_SCHEMA before changing them.
 
-class PromptGenerator:
-    def __init__(self):
-        self.required_fields = [
-            "patient.name",
-            "patient.age",
-            "patient.sex",
-            "patient.medical_record_number",
-            "procedure.date",
-            "procedure.location",
-            "procedure.preoperative_diagnosis",
-            "procedure.postoperative_diagnosis",
-            "procedure.procedures_performed",
-            "procedure.surgeon",
-            "coding.cpt"
-        ]
-
-    def get_next_prompt(self, current_record: Dict[str, Any]) -> Optional[Dict[str, str]]:
-        for field in self.required_fields:
-            if not self.is_field_complete(current_record, field):
-                # Format the field name for better readability
-                formatted_field = field.replace('.', ' ').replace('_', ' ').title()
-                return {"field": field, "prompt": f"Please provide the {formatted_field}:"}
-        return None
-
-    @staticmethod
-    def is_field_complete(record: Dict[str, Any], field: str) -> bool:
-        keys = field.split('.')
-        value = record
-        for key in keys:
-            value = value.get(key, {})
-        return bool(value)
+# AI Platform client, created on first use by get_prediction_client(). Importing the
+# SDK takes most of the cold start, and preflight and invalid requests never need it.
+client_options = {"api_endpoint": "us-central1-aiplatform.googleapis.com"}
+client = None
+_client_lock = threading.Lock()
 
 prompt_generator = PromptGenerator()
 
-def create_prompt(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]]) -> str:
-    return f"""
-    ## SYSTEM INSTRUCTIONS
-    Purpose: This LLM is designed to assist in updating specific fields of a medical record based on user input, including generating appropriate SNOMED CT and ICD-10 codes for diagnoses and procedures.
-
-    Input: The LLM will accept free-text input related to a specific field in the medical record.
-
-    Output: The LLM will generate a JSON object containing only the fields that were updated based on the user's input, including SNOMED CT and ICD-10 codes when relevant medical information is provided.
-
-    Special Instructions:
-    1. When procedures or diagnoses are mentioned, update the 'procedure.procedures_performed' field and generate appropriate codes in the 'coding' section.
-    2. Do not insert codes directly into the 'procedure' section fields. All codes should be placed in the 'coding' section.
-    3. For CPT, SNOMED CT, and ICD-10 codes, provide both the code and its description in the following format:
-       {{"code": "12345", "description": "Description of the procedure or diagnosis"}}
-    4. For dates, always format them as strings in YYYY-MM-DD format (e.g., "2024-10-02" for October 2, 2024).
-    5. Pay special attention to preoperative and postoperative diagnoses, procedures performed, and any mentioned complications or conditions.
-    6. Focus on filling the missing required fields for BigQuery insertion.
-    7. Do not use comments in the JSON response.
-    8. Ensure all property names are enclosed in double quotes.
-    9. Maintain proper JSON structure, especially for arrays and nested objects.
-    10. For 'preoperative_diagnosis' and 'postoperative_diagnosis', provide a single string value, not an array.
-
-    Current Record State:
-    {json.dumps(current_record, indent=2)}
-
-    Current Prompt:
-    {json.dumps(current_prompt, indent=2)}
-
-    ## USER MESSAGE
-    {user_message}
-
-    ## ASSISTANT RESPONSE
-    Based on the user's input, please update the relevant fields in the record, including generating appropriate SNOMED CT and ICD-10 codes for any mentioned diagnoses or procedures. Focus on filling the missing required fields. Do not add or modify any information that was not explicitly provided by the user. Your response should be a valid JSON object with the following structure:
-    {{
-        "updated_record": {{
-            "patient": {{
-                "field_name": "value"
-            }},
-            "procedure": {{
-                "field_name": "value",
-                "preoperative_diagnosis": "Single string diagnosis",
-                "postoperative_diagnosis": "Single string diagnosis",
-                "procedures_performed": [
-                    "Procedure 1",
-                    "Procedure 2"
-                ]
-            }},
-            "coding": {{
-                "cpt": [
-                    {{"code": "12345", "description": "Description of procedure 1"}},
-                    {{"code": "67890", "description": "Description of procedure 2"}}
-                ],
-                "snomed_ct": [
-                    {{"code": "123456789", "description": "SNOMED CT description 1"}},
-                    {{"code": "987654321", "description": "SNOMED CT description 2"}}
-                ],
-                "icd_10": [
-                    {{"code": "A12.3", "description": "ICD-10 description 1"}},
-                    {{"code": "B45.6", "description": "ICD-10 description 2"}}
-                ]
-            }}
-        }},
-        "message": "Your response message here"
-    }}
-    """
+MODEL_ENDPOINT = "projects/<redacted>/locations/us-central1/publishers/google/models/medlm-large"
+GENERATION_PARAMETERS: Dict[str, Any] = {
+    "candidateCount": 1,
+    "maxOutputTokens": 1024,
+    "temperature": 0,
+    "topP": 0.8,
+    "topK": 40
+}
+
+# temperature is 0, so identical prompts give identical completions and can be cached.
+# Entries hold PHI: they stay in memory unless PREDICTION_CACHE_MEMORY_ONLY is "false"
+# and PREDICTION_CACHE_KEY (a Fernet key) is set, in which case disk entries are encrypted.
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get("PREDICTION_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("PREDICTION_CACHE_TTL_SECONDS", "3600")),
+    disk_dir=os.environ.get("PREDICTION_CACHE_DIR"),
+    max_disk_bytes=int(os.environ.get("PREDICTION_CACHE_MAX_DISK_MB", "50")) * 1024 * 1024,
+    encryption_key=os.environ.get("PREDICTION_CACHE_KEY"),
+    memory_only=os.environ.get("PREDICTION_CACHE_MEMORY_ONLY", "true").lower() != "false",
+)
+
+# Identical prompts in flight at the same time (a double-tap, a resend after a client
+# timeout) share one model call. Keyed like the cache, so the streaming and
+# non-streaming paths join each other's calls.
+in_flight_predictions = SingleFlight()
+COALESCED_CALLS = metrics.counter("coalesced_model_calls_total",
+                                  "Model calls avoided by joining an identical call already in flight.")
+TRUNCATED_COMPLETIONS = metrics.counter("truncated_completions_total",
+                                       "Completions cut off before their JSON closed, by how they were recovered.")
+PRE_EXTRACTED_TURNS = metrics.counter("pre_extracted_turns_total",
+                                      "Turns for rule-supported fields, by field and whether rules or the model answered.")
+
+# Local CPT / ICD-10 / SNOMED CT index (CODE_INDEX_DIR, CODE_VALIDATION)
+code_indexes = default_code_indexes()
+
+# Same validation, batch writer and durable queue as submit-to-bigquery, used for autoSubmit
+insert_path = shared_insert_path(PROJECT_ID, DATASET_ID, TABLE_ID, INSERT_QUEUE_PATH)
+
+# Server-side dictation sessions (SESSION_STORE, SESSION_STORE_PATH, SESSION_TTL_SECONDS, SESSION_MAX_ENTRIES)
+session_store = create_session_store()
+
+# Admission control for model calls. Each client (session, or address without one) gets
+# RATE_LIMIT_PER_MINUTE requests with bursts of RATE_LIMIT_BURST, and at most
+# MODEL_MAX_CONCURRENCY Vertex calls run at once, with up to MODEL_QUEUE_SIZE more waiting
+# MODEL_QUEUE_TIMEOUT_SECONDS for a slot. Anything beyond gets 429 with Retry-After
+# instead of exhausting the quota. 0 disables the rate limit or the concurrency limit.
+rate_limiter = TokenBucket(rate=float(os.environ.get("RATE_LIMIT_PER_MINUTE", "60")) / 60,
+                           burst=float(os.environ.get("RATE_LIMIT_BURST", "10")))
+model_slots = ConcurrencyLimiter(max_concurrency=int(os.environ.get("MODEL_MAX_CONCURRENCY", "16")),
+                                 max_queue=int(os.environ.get("MODEL_QUEUE_SIZE", "32")),
+                                 queue_timeout=float(os.environ.get("MODEL_QUEUE_TIMEOUT_SECONDS", "10")))
+ADMISSION_REJECTIONS = metrics.counter("admission_rejections_total",
+                                       "Requests turned away with 429, by reason (rate_limited, queue_full, queue_timeout).")
+ADMISSION_WAIT_SECONDS = metrics.histogram("admission_wait_seconds", "Time model calls waited for a concurrency slot.")
+
+# Bounded pool shared by all requests for the per-code-system calls of the fan-out pipeline
+coding_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CODING_MAX_WORKERS", "6")),
+                                     thread_name_prefix="coding")
 
 def merge_user_input(current_record: Dict[str, Any], user_input: Dict[str, Any]) -> Dict[str, Any]:
     """Merge user input with the current record, updating only provided fields."""
@@ -161,6 +140,13 @@ def merge_user_input(current_record: Dict[str, Any], user_input: Dict[str, Any])
             if section == "coding":
                 for coding_type, codes in data.items():
                     if coding_type in current_record[section]:
+                        # Check codes against the local code index (CODE_VALIDATION)
+                        codes, rejected = code_indexes.review(coding_type, codes if isinstance(codes, list) else [])
+                        if rejected:
+                            logger.warning(f"Rejected {len(rejected)} unknown {coding_type} code(s).")
+                        flagged = sum(1 for code in codes if code.get('needs_review'))
+                        if flagged:
+                            logger.warning(f"Corrected {flagged} {coding_type} code(s), pending review.")
                         # Merge new codes with existing ones, avoiding duplicates
                         existing_codes = {code['code']: code for code in current_record[section][coding_type]}
                         for new_code in codes:
@@ -179,48 +165,187 @@ def merge_user_input(current_record: Dict[str, Any], user_input: Dict[str, Any])
                             current_record[section][field] = value
     return current_record
 
-def generate_content(prompt: str) -> str:
-    """Generate content using the medlm-large model."""
+def get_prediction_client():
+    """Return the process-wide PredictionServiceClient, importing the AI Platform SDK on first use."""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from google.cloud import aiplatform
+                client = aiplatform.gapic.PredictionServiceClient(client_options=client_options)
+    return client
+
+def generate_content(prompt: str, max_output_tokens: Optional[int] = None) -> str:
+    """Generate content using the medlm-large model, serving repeated prompts from the cache."""
+    parameters_dict = GENERATION_PARAMETERS
+    if max_output_tokens is not None:
+        parameters_dict = {**GENERATION_PARAMETERS, "maxOutputTokens": max_output_tokens}
+    with telemetry.span("model"):
+        return prediction_cache.get_or_compute(prompt, parameters_dict, lambda: predict_coalesced(prompt, parameters_dict))
+
+def predict_coalesced(prompt: str, parameters_dict: Dict[str, Any]) -> str:
+    """Call the model, or wait for an identical call already in flight and share its completion."""
+    return in_flight_predictions.do(cache_key(prompt, parameters_dict),
+                                    lambda: complete_prediction(prompt, parameters_dict),
+                                    on_join=lambda: metrics.inc(COALESCED_CALLS, call="predict"))
+
+def complete_prediction(prompt: str, parameters_dict: Dict[str, Any]) -> str:
+    """Call the model, continuing a completion that hit the output token limit mid-JSON.
+
+    The continuation prompt is the original prompt followed by the partial
+    completion, so the text model picks up where it stopped. Whatever is still
+    unterminated after MAX_CONTINUATIONS is salvaged by parse_completion.
+    """
+    text, finish_reason = predict_content(prompt, parameters_dict)
+    for _ in range(MAX_CONTINUATIONS):
+        if finish_reason is not None and finish_reason not in TRUNCATION_FINISH_REASONS:
+            break  # stopped for another reason (e.g. safety); more tokens will not close it
+        if not is_unterminated(text):
+            break
+        metrics.inc(TRUNCATED_COMPLETIONS, call="predict", recovery="continuation")
+        more, finish_reason = predict_content(prompt + text, parameters_dict)
+        text += more
+    return text
+
+def finish_reason_of(response: Any, prediction: Dict[str, Any], max_output_tokens: int) -> Optional[str]:
+    """Why generation stopped, e.g. "MAX_TOKENS", or None if the response does not say."""
+    reason = prediction.get("finishReason") or prediction.get("finish_reason")
+    if reason:
+        return str(reason).upper()
+    try:
+        output_tokens = response.metadata["tokenMetadata"]["outputTokenCount"]["totalTokens"]
+    except (AttributeError, KeyError, TypeError):
+        return None
+    return "MAX_TOKENS" if output_tokens >= max_output_tokens else "STOP"
+
+def predict_content(prompt: str, parameters_dict: Dict[str, Any] = GENERATION_PARAMETERS) -> Tuple[str, Optional[str]]:
+    """Call the medlm-large model; returns the completion and its finish reason (see finish_reason_of)."""
+    from google.protobuf import json_format
+    from google.protobuf.struct_pb2 import Value
     logger.info("Generating content using the medlm-large model.")
+    metrics.observe(PROMPT_BYTES, len(prompt.encode("utf-8")), call="predict")
     instance_dict = {"content": prompt}
     instance = json_format.ParseDict(instance_dict, Value())
     instances = [instance]
-    parameters_dict = {
-        "candidateCount": 1,
-        "maxOutputTokens": 1024,
-        "temperature": 0,
-        "topP": 0.8,
-        "topK": 40
-    }
     parameters = json_format.ParseDict(parameters_dict, Value())
-    response = client.predict(
-        endpoint="projects/<redacted>/locations/us-central1/publishers/google/models/medlm-large",
-        instances=instances,
-        parameters=parameters
-    )
+    with model_slots.slot() as waited:
+        metrics.observe(ADMISSION_WAIT_SECONDS, waited, call="predict")
+        start = time.perf_counter()
+        response = get_prediction_client().predict(
+            endpoint=MODEL_ENDPOINT,
+            instances=instances,
+            parameters=parameters
+        )
+    metrics.observe(MODEL_SECONDS, time.perf_counter() - start, call="predict")
     predictions = response.predictions
-    for prediction in predictions:
-        return dict(prediction)["content"]
+    # candidateCount is 1, so there is a single prediction
+    prediction = dict(predictions[0])
+    content = prediction["content"]
+    metrics.observe(OUTPUT_BYTES, len(content.encode("utf-8")), call="predict")
+    return content, finish_reason_of(response, prediction, parameters_dict["maxOutputTokens"])
+
+_streaming_model = None
+_streaming_model_lock = threading.Lock()
+
+def get_streaming_model():
+    """Return the medlm-large text model used for streaming predictions."""
+    global _streaming_model
+    if _streaming_model is None:
+        with _streaming_model_lock:
+            if _streaming_model is None:
+                import vertexai
+                from vertexai.language_models import TextGenerationModel
+                vertexai.init(project=PROJECT_ID, location=LOCATION)
+                _streaming_model = TextGenerationModel.from_pretrained("medlm-large")
+    return _streaming_model
+
+def stream_content(prompt: str, max_output_tokens: Optional[int] = None) -> Iterator[str]:
+    """Stream content from the medlm-large model.
+
+    Cached completions, and completions of an identical call already in flight,
+    are replayed as a single chunk. Truncated completions are not continued;
+    parse_completion salvages their complete fields.
+    """
+    parameters_dict = GENERATION_PARAMETERS
+    if max_output_tokens is not None:
+        parameters_dict = {**GENERATION_PARAMETERS, "maxOutputTokens": max_output_tokens}
+    key = cache_key(prompt, parameters_dict)
+    cached = prediction_cache.get(key) if prediction_cache.enabled else None
+    if cached is not None:
+        yield cached
+        return
+    call, is_leader = in_flight_predictions.begin(key)
+    if not is_leader:
+        metrics.inc(COALESCED_CALLS, call="stream")
+        yield call.wait()
+        return
+    logger.info("Streaming content from the medlm-large model.")
+    metrics.observe(PROMPT_BYTES, len(prompt.encode("utf-8")), call="stream")
+    chunks = []
+    completion, error = None, None
+    try:
+        # The slot is held until the stream ends or the client disconnects
+        with model_slots.slot() as waited:
+            metrics.observe(ADMISSION_WAIT_SECONDS, waited, call="stream")
+            start = time.perf_counter()
+            responses = get_streaming_model().predict_streaming(
+                prompt,
+                max_output_tokens=parameters_dict["maxOutputTokens"],
+                temperature=parameters_dict["temperature"],
+                top_p=parameters_dict["topP"],
+                top_k=parameters_dict["topK"]
+            )
+            for response in responses:
+                chunks.append(response.text)
+                yield response.text
+        completion = "".join(chunks)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if completion is None and error is None:
+            # The client disconnected mid-stream; followers must not wait for the rest
+            error = RuntimeError("The identical request being waited for was cancelled")
+        in_flight_predictions.finish(key, call, completion, error)
+    metrics.observe(MODEL_SECONDS, time.perf_counter() - start, call="stream")
+    metrics.observe(OUTPUT_BYTES, len(completion.encode("utf-8")), call="stream")
+    if prediction_cache.enabled:
+        prediction_cache.put(key, completion)
+
+def parse_completion(response_text: str) -> Dict[str, Any]:
+    """Extract the JSON object from a completion, recording how many candidates it took.
+
+    A completion cut off before its object closed is salvaged instead: every
+    complete field is kept and the result is marked `"truncated": true`.
+    """
+    with telemetry.span("json"):
+        try:
+            response_json, attempts = find_json_object(response_text)
+        except TruncatedJSONError:
+            metrics.inc(TRUNCATED_COMPLETIONS, call="parse", recovery="salvage")
+            return salvage_completion(response_text)
+        except json.JSONDecodeError:
+            metrics.observe(JSON_REPAIR_ATTEMPTS, 0, outcome="failed")
+            raise
+        metrics.observe(JSON_REPAIR_ATTEMPTS, attempts, outcome="ok")
+        return response_json
+
+def salvage_completion(response_text: str) -> Dict[str, Any]:
+    """The complete fields of a truncated completion, marked `"truncated": true`."""
+    response_json = salvage_json_object(response_text)
+    updated_record = response_json.get("updated_record")
+    if isinstance(updated_record, dict) and isinstance(updated_record.get("coding"), dict):
+        # A code cut off before its description is as incomplete as a cut-off string
+        updated_record["coding"] = {
+            coding_type: [code for code in codes if isinstance(code, dict) and code.get("code") and code.get("description")]
+            for coding_type, codes in updated_record["coding"].items() if isinstance(codes, list)
+        }
+    response_json["truncated"] = True
+    return response_json
 
 def is_record_complete(record: Dict[str, Any]) -> bool:
     """Check if the record is complete based on required fields."""
-    required_fields = [
-        "patient.name",
-        "patient.age",
-        "patient.sex",
-        "procedure.date",
-        "procedure.location",
-        "procedure.procedures_performed",
-        "coding.cpt"
-    ]
-    for field in required_fields:
-        keys = field.split('.')
-        value = record
-        for key in keys:
-            value = value.get(key, {})
-        if not value:
-            return False
-    return True
+    return COMPILED_SCHEMA.is_complete(record)
 
 def validate_date(date_string: str) -> bool:
     """Validate if a string is in YYYY-MM-DD format."""
@@ -239,38 +364,8 @@ def validate_input(user_message: str, current_record: Dict[str, Any]) -> Tuple[b
     # Add more validation as needed
     return True, ""
 
-import re
-
-def sanitize_json_string(json_string: str) -> str:
-    """Sanitize the JSON string to ensure it's valid."""
-    # Remove any potential Unicode BOM
-    json_string = json_string.strip().lstrip('\ufeff')
-    
-    # Remove any leading/trailing whitespace
-    json_string = json_string.strip()
-    
-    # Remove any comments (single-line or multi-line)
-    json_string = re.sub(r'//.*?$|/\*.*?\*/', '', json_string, flags=re.MULTILINE | re.DOTALL)
-    
-    # Parse the JSON string
-    try:
-        parsed_json = json.loads(json_string)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON: {str(e)}")
-    
-    # Custom JSON encoder to handle escaping
-    class CustomJSONEncoder(json.JSONEncoder):
-        def encode(self, obj):
-            if isinstance(obj, str):
-                return json.dumps(obj, ensure_ascii=False)
-            return super().encode(obj)
-    
-    # Re-serialize the JSON with proper escaping
-    sanitized_json = json.dumps(parsed_json, cls=CustomJSONEncoder, ensure_ascii=False, indent=2)
-    
-    return sanitized_json
-
 @functions_framework.http
+@telemetry.instrument_handler("medical_record_assistant")
 def medical_record_assistant(request):
     """HTTP Cloud Function for medical record creation using medlm-large model."""
     # Handle CORS preflight request
@@ -278,7 +373,7 @@ def medical_record_assistant(request):
         headers = {
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Allow-Headers': 'Content-Type, Accept',
             'Access-Control-Max-Age': '3600'
         }
         return ('', 204, headers)
@@ -295,61 +390,403 @@ def medical_record_assistant(request):
 
     # Extract required data from request
     user_message: str = request_json.get('userMessage')
-    current_record: Dict[str, Any] = request_json.get('currentRecord', RECORD_SCHEMA)
+    # A copy: merging into the module-level template would leak one request's record into the next
+    current_record: Dict[str, Any] = (request_json['currentRecord'] if 'currentRecord' in request_json
+                                      else copy.deepcopy(RECORD_SCHEMA))
     current_prompt: Optional[Dict[str, str]] = request_json.get('currentPrompt')
+    prompt_mode: str = request_json.get('promptMode', PROMPT_MODE)
+    mode: str = request_json.get('mode', 'turn')
+    pipeline: str = request_json.get('pipeline', 'single')
+    auto_submit: Any = request_json.get('autoSubmit', False)
+
+    # Session mode: the record is kept server-side and the response carries a JSON patch instead
+    session: Optional[Dict[str, Any]] = None
+    if request_json.get('sessionId') or request_json.get('session') is True:
+        session = load_session(request_json)
+        if session is None:
+            return jsonify({"error": "Unknown or expired session", "sessionExpired": True}), 409, headers
+        current_record, current_prompt = session["record"], session.get("current_prompt")
 
     # Validate input
     is_valid, error_message = validate_input(user_message, current_record)
     if not is_valid:
         return jsonify({"error": error_message}), 400, headers
+    if prompt_mode not in PROMPT_MODES:
+        return jsonify({"error": f"Invalid prompt mode: {prompt_mode}"}), 400, headers
+    if auto_submit not in AUTO_SUBMIT_MODES and auto_submit not in (False, None):
+        return jsonify({"error": f"Invalid autoSubmit value: {auto_submit}"}), 400, headers
+    if auto_submit == "async" and not insert_path.async_enabled:
+        return jsonify({"error": ASYNC_UNAVAILABLE_MESSAGE}), 501, headers
+    if auto_submit and already_submitted(current_record, session):
+        # A correction after the record was submitted would otherwise insert a second row
+        auto_submit = False
+
+    # Per-client rate limit, before any model call is made
+    try:
+        rate_limiter.acquire(client_key(request, session))
+    except Overloaded as e:
+        return overloaded_response(e, headers)
+
+    # Whole-dictation mode: the user message is a complete transcript
+    if mode == 'dictation':
+        if len(user_message) > MAX_DICTATION_CHARS:
+            return jsonify({"error": f"Dictation exceeds the maximum length of {MAX_DICTATION_CHARS} characters"}), 400, headers
+        try:
+            return reply(process_dictation(user_message, current_record), headers, session, auto_submit)
+        except Overloaded as e:
+            return overloaded_response(e, headers)
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding JSON: {str(e)}")
+            return jsonify({"error": f"Error decoding JSON response: {str(e)}"}), 500, headers
+        except Exception as e:
+            logger.error(f"Error processing dictation: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return jsonify({"error": "An unexpected error occurred. Please try again later."}), 500, headers
+
+    streaming = request_json.get('stream') is True or 'text/event-stream' in request.headers.get('Accept', '')
+    stream_headers = {**headers, 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    # Answers the rules can parse confidently skip the model; anything else falls through to it
+    update = rule_based_update(user_message, current_prompt)
+    if update is not None:
+        completion = {"updated_record": update, "message": f"Recorded the {describe_fields(update)}."}
+        if streaming:
+            return Response(stream_medical_record_assistant(iter([json.dumps(completion)]), current_record, session, auto_submit),
+                            mimetype='text/event-stream', headers=stream_headers)
+        return reply(finalize_response(current_record, completion), headers, session, auto_submit)
+
+    # Fan-out pipeline: narrative fields, then CPT / ICD-10 / SNOMED CT codes concurrently
+    if pipeline == 'fanout':
+        try:
+            return reply(run_fanout_pipeline(user_message, current_record, current_prompt), headers, session, auto_submit)
+        except Overloaded as e:
+            return overloaded_response(e, headers)
+        except json.JSONDecodeError as e:
+            logger.error(f"Error decoding JSON: {str(e)}")
+            return jsonify({"error": f"Error decoding JSON response: {str(e)}"}), 500, headers
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            return jsonify({"error": "An unexpected error occurred. Please try again later."}), 500, headers
 
     # Prepare the input for the main medlm-large query
-    main_prompt = create_prompt(user_message, current_record, current_prompt)
+    with telemetry.span("prompt"):
+        main_prompt = create_prompt(user_message, current_record, current_prompt, mode=prompt_mode,
+                                    missing_fields=prompt_generator.missing_fields(current_record))
+    # Short answers to short fields ask for fewer output tokens
+    max_output_tokens = turn_budget(current_prompt.get('field') if isinstance(current_prompt, dict) else None,
+                                    user_message, GENERATION_PARAMETERS["maxOutputTokens"])
+
+    if streaming:
+        return Response(stream_medical_record_assistant(stream_content(main_prompt, max_output_tokens), current_record,
+                                                        session, auto_submit),
+                        mimetype='text/event-stream', headers=stream_headers)
 
     # Generate content using medlm-large
     try:
-        response_text = generate_content(main_prompt)
-        sanitized_response = sanitize_json_string(response_text)
-        response_json = json.loads(sanitized_response)
-        
-        if isinstance(response_json, dict) and "updated_record" in response_json:
-            updated_record = merge_user_input(current_record, response_json["updated_record"])
-            
-            record_complete = is_record_complete(updated_record)
-            next_prompt = prompt_generator.get_next_prompt(updated_record)
-            
-            response_json['updated_record'] = updated_record
-            response_json['next_prompt'] = next_prompt
-            response_json['ready_to_insert'] = record_complete
-
-            # Provide a message to confirm submission when the record is complete
-            if record_complete:
-                response_json['message'] = "The record is complete. You can now submit it to BigQuery or continue adding more information."
-            else:
-                response_json['message'] = response_json.get('message', '').strip()
-        else:
-            raise ValueError("Invalid response structure from medlm-large model")
-        
-        return jsonify(response_json), 200, headers
+        response_text = generate_content(main_prompt, max_output_tokens=max_output_tokens)
+        response_json = parse_completion(response_text)
+        return reply(finalize_response(current_record, response_json), headers, session, auto_submit)
+    except Overloaded as e:
+        return overloaded_response(e, headers)
     except json.JSONDecodeError as e:
         logger.error(f"Error decoding JSON: {str(e)}")
-        logger.error(f"Raw response: {response_text}")
-        logger.error(f"Sanitized response: {sanitized_response}")
+        # The completion contains PHI, so only its size is logged
+        logger.error(f"Raw response length: {len(response_text)} characters")
         return jsonify({"error": f"Error decoding JSON response: {str(e)}"}), 500, headers
     except Exception as e:
         logger.error(f"Error generating response: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({"error": "An unexpected error occurred. Please try again later."}), 500, headers
 
+def client_key(request, session: Optional[Dict[str, Any]]) -> str:
+    """Rate-limit key: a session found in the store, otherwise the client's address.
+
+    A session id the store does not know, or a session created by this request,
+    is not a key: any client could send a fresh one with every request.
+    """
+    if session is not None and session.get("version") is not None:
+        return f"session:{session['id']}"
+    # Google's front end appends the address the connection came from; earlier entries are
+    # whatever the client sent, so only the last one can be trusted
+    forwarded = request.headers.get('X-Forwarded-For', '').split(',')[-1].strip()
+    return f"address:{forwarded or request.remote_addr}"
+
+def overloaded_response(error: Overloaded, headers: Dict[str, str]):
+    """429 Too Many Requests with Retry-After, readable by the browser through CORS."""
+    metrics.inc(ADMISSION_REJECTIONS, reason=error.reason)
+    logger.warning(f"Request turned away: {error.reason}, retry after {error.retry_after} s")
+    return (jsonify({"error": "Too many requests. Please try again shortly.", "retryAfter": error.retry_after}), 429,
+            {**headers, 'Retry-After': str(error.retry_after), 'Access-Control-Expose-Headers': 'Retry-After'})
+
+def rule_based_update(user_message: str, current_prompt: Optional[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    """Record update parsed locally from a short answer to the current prompt, or None to ask the model."""
+    field = current_prompt.get('field') if isinstance(current_prompt, dict) else None
+    if not PRE_EXTRACT or field not in SUPPORTED_FIELDS:
+        return None
+    with telemetry.span("rules"):
+        update = pre_extract(user_message, field)
+    metrics.inc(PRE_EXTRACTED_TURNS, field=field, outcome="rules" if update is not None else "model")
+    return update
+
+def describe_fields(update: Dict[str, Dict[str, Any]]) -> str:
+    """"patient age and sex" for {"patient": {"age": ..., "sex": ...}}."""
+    names = [f"{section} {field}".replace('_', ' ') for section, fields in update.items() for field in fields]
+    return names[0] if len(names) == 1 else ", ".join(names[:-1]) + f" and {names[-1]}"
+
+class SessionConflict(Exception):
+    """The session was updated by another request after this one loaded it."""
+
+def seed_record(record: Any) -> Dict[str, Any]:
+    """A full RECORD_SCHEMA record with the sections of the given (possibly partial) record laid over it."""
+    seeded = copy.deepcopy(RECORD_SCHEMA)
+    if isinstance(record, dict):
+        for section, data in record.items():
+            if isinstance(seeded.get(section), dict) and isinstance(data, dict):
+                seeded[section].update(copy.deepcopy(data))
+    return seeded
+
+def load_session(request_json: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the stored session, or a new one seeded from the request's record.
+
+    Returns None for an unknown or expired session id when the request does not
+    include `currentRecord` to start over from.
+    """
+    session_id = request_json.get('sessionId')
+    state = session_store.get(session_id) if session_id else None
+    if state is None:
+        if session_id and 'currentRecord' not in request_json:
+            return None
+        state = {"record": seed_record(request_json.get('currentRecord')),
+                 "current_prompt": request_json.get('currentPrompt'), "version": None}
+        session_id = new_session_id()
+    state["id"] = session_id
+    state["base_record"] = copy.deepcopy(state["record"])
+    return state
+
+def save_session(session: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Store the updated record in the session and replace it in the response with a JSON patch."""
+    record = result.pop('updated_record')
+    state = {"record": record, "current_prompt": result.get('next_prompt')}
+    # Remember a successful autoSubmit so later turns do not submit the record again
+    receipt = result.get('insert_receipt')
+    if receipt is None or receipt.get("status") not in CACHEABLE_STATUSES:
+        receipt = session.get("insert_receipt")
+    if receipt:
+        state["insert_receipt"] = receipt
+    if not session_store.save(session["id"], state, session["version"]):
+        # A duplicate of this request (coalesced onto the same model call) may have stored
+        # the same update first; that is not a conflict.
+        stored = session_store.get(session["id"])
+        if stored is None or stored["record"] != record or stored.get("current_prompt") != state["current_prompt"]:
+            raise SessionConflict("The session was updated by another request. Please retry.")
+    result['sessionId'] = session["id"]
+    result['patch'] = make_patch(session["base_record"], record)
+    return result
+
+def already_submitted(current_record: Dict[str, Any], session: Optional[Dict[str, Any]]) -> bool:
+    """Whether autoSubmit has already sent this record.
+
+    A session remembers its submission. Without one, a record that was complete
+    before this turn was submitted on the turn that completed it.
+    """
+    if session is not None:
+        return bool(session.get("insert_receipt"))
+    return is_record_complete(current_record)
+
+def submit_if_ready(result: Dict[str, Any], auto_submit: Any) -> Dict[str, Any]:
+    """With autoSubmit, send a finished record to BigQuery and add the insert receipt to the response."""
+    if auto_submit in AUTO_SUBMIT_MODES and result.get('ready_to_insert'):
+        try:
+            receipt = insert_path.submit(result['updated_record'], async_mode=auto_submit == "async")
+        except Exception as e:
+            logger.error(f"Error submitting record to BigQuery: {str(e)}")
+            receipt = {"status": "error", "error": "Failed to insert record into BigQuery"}
+        result['insert_receipt'] = receipt
+        if receipt["status"] == "inserted":
+            result['message'] = "The record is complete and has been submitted to BigQuery."
+        elif receipt["status"] == "queued":
+            result['message'] = "The record is complete and has been queued for submission to BigQuery."
+    return result
+
+def reply(result: Dict[str, Any], headers: Dict[str, str], session: Optional[Dict[str, Any]] = None,
+          auto_submit: Any = False):
+    """JSON response for a finished turn, as a session patch when the request uses a session."""
+    result = submit_if_ready(result, auto_submit)
+    if session is None:
+        return jsonify(result), 200, headers
+    try:
+        return jsonify(save_session(session, result)), 200, headers
+    except SessionConflict as e:
+        return jsonify({"error": str(e), "sessionConflict": True}), 409, headers
+
+def process_dictation(transcript: str, current_record: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract every field from a full dictation, one model call per transcript chunk.
+
+    Each chunk's result is merged into the record with merge_user_input before the
+    next chunk is sent, so later chunks see what earlier ones already filled.
+    """
+    chunks = chunk_transcript(transcript)
+    messages = []
+    truncated = False
+    for number, chunk in enumerate(chunks, 1):
+        with telemetry.span("prompt"):
+            prompt = create_dictation_prompt(chunk, current_record, COMPILED_SCHEMA.missing_fields(current_record),
+                                             chunk_number=number, chunk_count=len(chunks))
+        response_json = parse_completion(generate_content(prompt, max_output_tokens=DICTATION_MAX_OUTPUT_TOKENS))
+        if isinstance(response_json.get("updated_record"), dict):
+            merge_user_input(current_record, response_json["updated_record"])
+        if response_json.get("message"):
+            messages.append(str(response_json["message"]).strip())
+        truncated = truncated or bool(response_json.get("truncated"))
+
+    result = finalize_response(current_record, {"updated_record": {}, "message": " ".join(messages),
+                                                "truncated": truncated})
+    result['model_calls'] = len(chunks)
+    return result
+
+def generate_codes(code_system: str, procedure: Dict[str, Any]) -> Tuple[List[Dict[str, str]], float]:
+    """Ask the model for one code system's codes; returns the codes and the call latency in ms."""
+    start = time.perf_counter()
+    response_text = generate_content(create_coding_prompt(code_system, procedure),
+                                     max_output_tokens=CODING_MAX_OUTPUT_TOKENS)
+    codes = parse_completion(response_text).get("codes", [])
+    valid_codes = [code for code in codes if isinstance(code, dict) and code.get("code") and code.get("description")]
+    return valid_codes, (time.perf_counter() - start) * 1000
+
+def run_fanout_pipeline(user_message: str, current_record: Dict[str, Any],
+                        current_prompt: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    """Fill narrative fields with one call, then request each affected code system concurrently.
+
+    Each call has a small output budget, so long code lists no longer truncate a
+    single large response. Only code systems whose source fields changed this turn
+    are requested. Per-stage latency is returned in `metadata.stage_latency_ms`.
+    """
+    stage_latency: Dict[str, float] = {}
+    errors: Dict[str, str] = {}
+
+    start = time.perf_counter()
+    with telemetry.span("prompt"):
+        narrative_prompt = create_narrative_prompt(user_message, current_record, current_prompt,
+                                                   COMPILED_SCHEMA.missing_fields(current_record))
+    narrative = parse_completion(generate_content(narrative_prompt, max_output_tokens=NARRATIVE_MAX_OUTPUT_TOKENS))
+    stage_latency["narrative"] = round((time.perf_counter() - start) * 1000, 1)
+
+    updated = narrative.get("updated_record") if isinstance(narrative.get("updated_record"), dict) else {}
+    procedure_before = dict(current_record.get("procedure", {}))
+    merge_user_input(current_record, {section: data for section, data in updated.items() if section != "coding"})
+    procedure = current_record.get("procedure", {})
+    changed = {field for field, value in procedure.items() if value and value != procedure_before.get(field)}
+
+    start = time.perf_counter()
+    futures = {code_system: coding_executor.submit(generate_codes, code_system, procedure)
+               for code_system, spec in CODE_SYSTEMS.items() if changed.intersection(spec["sources"])}
+    coding: Dict[str, List[Dict[str, str]]] = {}
+    for code_system, future in futures.items():
+        try:
+            coding[code_system], latency = future.result()
+            stage_latency[f"coding.{code_system}"] = round(latency, 1)
+        except Exception as e:
+            logger.error(f"Error generating {code_system} codes: {str(e)}")
+            errors[code_system] = "Code generation failed"
+    if futures:
+        stage_latency["coding"] = round((time.perf_counter() - start) * 1000, 1)
+    merge_user_input(current_record, {"coding": coding})
+
+    result = finalize_response(current_record, {"updated_record": {}, "message": narrative.get("message", ""),
+                                                "truncated": bool(narrative.get("truncated"))})
+    result["metadata"] = {"pipeline": "fanout", "model_calls": 1 + len(futures), "stage_latency_ms": stage_latency}
+    if errors:
+        result["metadata"]["errors"] = errors
+    return result
+
+def finalize_response(current_record: Dict[str, Any], response_json: Any) -> Dict[str, Any]:
+    """Merge the model's update into the record and add the next prompt and completion state."""
+    if isinstance(response_json, dict) and response_json.pop("truncated", False):
+        # Salvaged from a truncated completion: keep what was complete, even if that is nothing
+        response_json.setdefault("updated_record", {})
+        response_json["message"] = f"{response_json.get('message', '')} {TRUNCATED_MESSAGE}".strip()
+        response_json["truncated"] = True
+    if not (isinstance(response_json, dict) and "updated_record" in response_json):
+        raise ValueError("Invalid response structure from medlm-large model")
+
+    with telemetry.span("merge"):
+        updated_record = merge_user_input(current_record, response_json["updated_record"])
+
+    # One pass over the required fields answers both completeness and the next prompt
+    missing_fields = COMPILED_SCHEMA.missing_fields(updated_record)
+    record_complete = not missing_fields
+    next_prompt = prompt_generator.get_next_prompt(updated_record, missing_fields)
+
+    response_json['updated_record'] = updated_record
+    response_json['missing_fields'] = missing_fields
+    response_json['next_prompt'] = next_prompt
+    response_json['ready_to_insert'] = record_complete
+
+    # Provide a message to confirm submission when the record is complete
+    if record_complete:
+        response_json['message'] = "The record is complete. You can now submit it to BigQuery or continue adding more information."
+    else:
+        response_json['message'] = response_json.get('message', '').strip()
+    return response_json
+
+def sse_event(event: str, data: Any) -> str:
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_medical_record_assistant(chunks: Iterator[str], current_record: Dict[str, Any],
+                                    session: Optional[Dict[str, Any]] = None, auto_submit: Any = False) -> Iterator[str]:
+    """Stream record fields as server-sent events as soon as the completion `chunks` finish each one.
+
+    Emits a `field` event per completed `updated_record` field, then a `done` event
+    with the same body as the non-streaming response, or an `error` event.
+    """
+    parser = IncrementalFieldParser()
+    try:
+        for chunk in chunks:
+            for section, field, value in parser.feed(chunk):
+                merge_user_input(current_record, {section: {field: value}})
+                if field in current_record.get(section, {}):
+                    yield sse_event("field", {"section": section, "field": field,
+                                              "value": current_record[section][field]})
+        response_json = parse_completion(parser.text)
+        result = submit_if_ready(finalize_response(current_record, response_json), auto_submit)
+        yield sse_event("done", save_session(session, result) if session is not None else result)
+    except SessionConflict as e:
+        yield sse_event("error", {"error": str(e), "sessionConflict": True})
+    except Overloaded as e:
+        # The 200 and its headers are already sent, so Retry-After goes in the event
+        metrics.inc(ADMISSION_REJECTIONS, reason=e.reason)
+        yield sse_event("error", {"error": "Too many requests. Please try again shortly.", "retryAfter": e.retry_after})
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        yield sse_event("error", {"error": "An unexpected error occurred. Please try again later."})
+
+def warm_up() -> None:
+    """Load the model SDKs, clients and code indexes that requests would otherwise load on first use."""
+    get_prediction_client()
+    get_streaming_model()
+    for code_system in CODE_SYSTEMS:
+        code_indexes.get(code_system)
+
+# Optional warm-up at instance start (WARM_UP: off, background or blocking)
+start_warm_up(warm_up)
+
 if __name__ == "__main__":
     # This is used when running locally only. When deploying to Google Cloud Functions,
     # a webserver will be used to run the function.
     from flask import Flask, request
+    from flask_cors import CORS
     app = Flask(__name__)
     CORS(app)  # Enable CORS for all routes when running locally
     
     @app.route('/', methods=['POST'])
     def local_medical_record_assistant():
         return medical_record_assistant(request)
+
+    @app.route('/metrics', methods=['GET'])
+    def local_metrics():
+        return telemetry.metrics_response(request)
     
     app.run(host='localhost', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,207 @@
+import bisect
+import logging
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CODE_SYSTEMS = ("cpt", "icd_10", "snomed_ct")
+BUNDLED_CODE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "codes")
+
+# "fill": add the canonical description to codes found in the index, keep unknown codes as they are.
+# "correct": also substitute unknown codes whose description matches an indexed one, flagged for
+# review; needs a full code table in CODE_INDEX_DIR. "enforce": reject codes that are not in the
+# index. "off": no lookups.
+CODE_VALIDATION_MODES = ("off", "fill", "correct", "enforce")
+DESCRIPTION_MATCH_THRESHOLD = 0.6
+# Upper bound on posting entries scanned per description search
+CANDIDATE_POSTINGS_BUDGET = 10000
+
+_NON_ALNUM = re.compile(r"[^0-9A-Z]")
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def normalize_code(code: Any) -> str:
+    """Upper-case a code and drop punctuation, so "s75.011a" and "S75011A" match."""
+    return _NON_ALNUM.sub("", str(code).upper())
+
+
+def _trigrams(text: str) -> List[str]:
+    grams = set()
+    for word in _WORDS.findall(text.lower()):
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return list(grams)
+
+
+def iter_code_file(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (code, description) rows from a code file."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                code, _, description = line.rstrip("\n").partition("\t")
+                yield code, description
+
+
+class CodeIndex:
+    """Read-only index of one code system, built from a `code<TAB>description` file.
+
+    Codes are kept in a sorted list of normalized keys with parallel lists of
+    display codes and descriptions, so exact and prefix lookups are binary
+    searches. Descriptions are indexed by word trigrams, stored as compact
+    arrays of row numbers, for fuzzy lookup by description text.
+    """
+
+    def __init__(self, rows: List[Tuple[str, str]]):
+        rows = sorted(((normalize_code(code), code.strip(), description.strip()) for code, description in rows),
+                      key=lambda row: row[0])
+        self._keys = [row[0] for row in rows]
+        self._codes = [row[1] for row in rows]
+        self._descriptions = [row[2] for row in rows]
+        postings: Dict[str, List[int]] = {}
+        for row_number, description in enumerate(self._descriptions):
+            for gram in _trigrams(description):
+                postings.setdefault(gram, []).append(row_number)
+        self._trigrams = {gram: array("I", rows_with_gram) for gram, rows_with_gram in postings.items()}
+
+    @classmethod
+    def from_file(cls, path: str) -> "CodeIndex":
+        return cls(list(iter_code_file(path)))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, code: Any) -> Optional[Dict[str, str]]:
+        """Exact lookup by code, ignoring case and punctuation."""
+        key = normalize_code(code)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return {"code": self._codes[i], "description": self._descriptions[i]}
+        return None
+
+    def prefix(self, prefix: Any, limit: int = 20) -> List[Dict[str, str]]:
+        """Codes starting with prefix, in code order (for autocomplete)."""
+        key = normalize_code(prefix)
+        start = bisect.bisect_left(self._keys, key)
+        results = []
+        for i in range(start, min(start + limit, len(self._keys))):
+            if not self._keys[i].startswith(key):
+                break
+            results.append({"code": self._codes[i], "description": self._descriptions[i]})
+        return results
+
+    def search(self, text: str, limit: int = 5) -> List[Tuple[float, Dict[str, str]]]:
+        """Rank codes by trigram similarity (Dice coefficient) of their description to text.
+
+        Candidates are gathered from the query's rarest trigrams only, since
+        grams like " in" or "ter" match most of the table, then rescored exactly.
+        """
+        grams = _trigrams(text)
+        if not grams:
+            return []
+        postings = sorted((self._trigrams[gram] for gram in grams if gram in self._trigrams), key=len)
+        hits: Counter = Counter()
+        budget = CANDIDATE_POSTINGS_BUDGET
+        for rows in postings:
+            if hits and len(rows) > budget:
+                break
+            hits.update(rows)
+            budget -= len(rows)
+        query = set(grams)
+        scored = []
+        for row, _ in hits.most_common(limit * 10):
+            description_grams = _trigrams(self._descriptions[row])
+            shared = len(query.intersection(description_grams))
+            scored.append((2 * shared / (len(query) + len(description_grams)), row))
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [(round(score, 3), {"code": self._codes[row], "description": self._descriptions[row]})
+                for score, row in scored[:limit]]
+
+
+class CodeIndexSet:
+    """Lazily loaded indexes for each code system found in a directory (`<system>.tsv`)."""
+
+    def __init__(self, directory: str = BUNDLED_CODE_DIR, mode: str = "fill"):
+        if mode not in CODE_VALIDATION_MODES:
+            raise ValueError(f"Invalid code validation mode: {mode}")
+        if mode == "correct" and os.path.abspath(directory) == BUNDLED_CODE_DIR:
+            # A near miss in the bundled sample is usually a different code, not a typo
+            raise ValueError("Code validation mode correct needs a full code table in CODE_INDEX_DIR")
+        self.directory = directory
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._indexes: Dict[str, Optional[CodeIndex]] = {}
+
+    def get(self, code_system: str) -> Optional[CodeIndex]:
+        """Return the index for a code system, or None if no file is available for it."""
+        if code_system in self._indexes:
+            return self._indexes[code_system]
+        with self._lock:
+            if code_system not in self._indexes:
+                path = os.path.join(self.directory, f"{code_system}.tsv")
+                index = None
+                if code_system in CODE_SYSTEMS and os.path.exists(path):
+                    index = CodeIndex.from_file(path)
+                    logger.info(f"Loaded {len(index)} {code_system} codes from {path}")
+                self._indexes[code_system] = index
+            return self._indexes[code_system]
+
+    def review(self, code_system: str, codes: List[Any]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+        """Check model-generated codes against the index.
+
+        Known codes get their canonical code and description. In "correct" mode,
+        an unknown code whose description closely matches an indexed description
+        is replaced by that code, keeping the original in "original_code" and
+        flagged with "needs_review". Other unknown codes are kept as they are,
+        except in "enforce" mode, where they are rejected. Returns (accepted, rejected).
+        """
+        index = self.get(code_system) if self.mode != "off" else None
+        accepted: List[Dict[str, Any]] = []
+        rejected: List[Any] = []
+        for entry in codes:
+            if not isinstance(entry, dict) or not entry.get("code"):
+                rejected.append(entry)
+                continue
+            if index is None or entry.get("needs_review"):
+                accepted.append(entry)
+                continue
+            match = index.get(entry["code"])
+            if match is not None:
+                accepted.append(match)
+                continue
+            if self.mode == "correct" and entry.get("description"):
+                candidates = index.search(entry["description"], limit=1)
+                if candidates and candidates[0][0] >= DESCRIPTION_MATCH_THRESHOLD:
+                    accepted.append({**candidates[0][1], "original_code": entry["code"], "needs_review": True})
+                    continue
+            if self.mode == "enforce":
+                rejected.append(entry)
+            else:
+                accepted.append(entry)
+        return accepted, rejected
+
+    def unknown_codes(self, code_system: str, codes: List[Any]) -> List[str]:
+        """Codes that are not in the index (empty when validation is off or no index exists)."""
+        index = self.get(code_system) if self.mode != "off" else None
+        if index is None:
+            return []
+        return [str(entry.get("code")) for entry in codes
+                if isinstance(entry, dict) and index.get(entry.get("code", "")) is None]
+
+
+_default_indexes: Optional[CodeIndexSet] = None
+_default_lock = threading.Lock()
+
+
+def default_code_indexes() -> CodeIndexSet:
+    """Process-wide index set configured by CODE_INDEX_DIR and CODE_VALIDATION."""
+    global _default_indexes
+    with _default_lock:
+        if _default_indexes is None:
+            _default_indexes = CodeIndexSet(os.environ.get("CODE_INDEX_DIR", BUNDLED_CODE_DIR),
+                                            os.environ.get("CODE_VALIDATION", "fill"))
+        return _default_indexes
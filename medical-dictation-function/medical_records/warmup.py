@@ -0,0 +1,45 @@
+import logging
+import os
+import threading
+from typing import Callable, Optional
+
+from medical_records import telemetry
+
+logger = logging.getLogger(__name__)
+
+# "off": SDKs and clients load on the first request that needs them.
+# "background": a daemon thread loads them right after import, while the instance takes requests.
+# "blocking": they load during import, so the instance is ready before it receives traffic.
+WARM_UP_MODES = ("off", "background", "blocking")
+
+
+def run_warm_up(warm_up: Callable[[], None]) -> bool:
+    """Run a warm-up hook, timed as the "warm_up" stage.
+
+    Failures are logged, not raised: whatever was not loaded is loaded by the
+    first request instead.
+    """
+    try:
+        with telemetry.span("warm_up"):
+            warm_up()
+        return True
+    except Exception as e:
+        logger.warning(f"Warm-up failed: {str(e)}")
+        return False
+
+
+def start_warm_up(warm_up: Callable[[], None], mode: Optional[str] = None) -> Optional[threading.Thread]:
+    """Run a function's warm-up hook as configured by WARM_UP (default "off").
+
+    Returns the background thread in "background" mode, otherwise None.
+    """
+    mode = mode or os.environ.get("WARM_UP", "off")
+    if mode not in WARM_UP_MODES:
+        raise ValueError(f"Invalid warm-up mode: {mode}")
+    if mode == "blocking":
+        run_warm_up(warm_up)
+    elif mode == "background":
+        thread = threading.Thread(target=run_warm_up, args=(warm_up,), name="warm-up", daemon=True)
+        thread.start()
+        return thread
+    return None
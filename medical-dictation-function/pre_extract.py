@@ -0,0 +1,292 @@
+import datetime
+import re
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Short answers to the prompt for one of these fields are parsed locally. Each
+# rule either accounts for every meaningful word of the answer or declines, in
+# which case the turn goes to the model as usual.
+
+ONES = {"zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+        "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+        "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19}
+TENS = {"twenty": 20, "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90}
+ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7, "eighth": 8,
+            "ninth": 9, "tenth": 10, "eleventh": 11, "twelfth": 12, "thirteenth": 13, "fourteenth": 14,
+            "fifteenth": 15, "sixteenth": 16, "seventeenth": 17, "eighteenth": 18, "nineteenth": 19,
+            "twentieth": 20, "thirtieth": 30}
+MONTHS = {"january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4, "may": 5,
+          "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8, "september": 9, "sep": 9, "sept": 9,
+          "october": 10, "oct": 10, "november": 11, "nov": 11, "december": 12, "dec": 12}
+MALE_WORDS = {"male", "man", "gentleman", "boy"}
+FEMALE_WORDS = {"female", "woman", "lady", "girl"}
+AGE_UNITS = {"years", "year", "yrs", "yr", "yo"}
+OTHER_AGE_UNITS = {"months", "month", "weeks", "week", "days", "day"}
+
+# Words that may surround an answer without changing it
+FILLER_WORDS = {
+    "uh", "um", "umm", "er", "ah", "oh", "okay", "ok", "so", "well", "let", "s", "see", "alright", "yes", "yeah",
+    "the", "a", "an", "is", "was", "it", "its", "that", "this", "of", "on", "and", "as", "be", "would",
+    "patient", "patients", "he", "she", "his", "her", "they", "their", "sergeant", "private", "corporal",
+    "age", "aged", "old", "sex", "gender", "medical", "record", "number", "mrn", "date", "procedure", "surgery",
+    "operation", "performed", "done", "please", "thanks", "thank", "you",
+}
+
+MAX_ANSWER_CHARS = 200
+MRN_MIN_DIGITS = 4
+MAX_AGE = 125
+
+_TOKEN = re.compile(r"\d+(?:st|nd|rd|th)\b|\d+|[a-z]+")
+_NUMERIC_ORDINAL = re.compile(r"(\d+)(?:st|nd|rd|th)")
+
+Tokens = List[str]
+Match = Optional[Tuple[Any, Set[int]]]
+
+
+def tokenize(text: str) -> Tokens:
+    """Lowercase words and numbers; punctuation, hyphens and apostrophes separate tokens."""
+    return _TOKEN.findall(text.lower().replace("y/o", " yo "))
+
+
+def _at(tokens: Tokens, i: int) -> str:
+    return tokens[i] if i < len(tokens) else ""
+
+
+def _below_hundred(tokens: Tokens, i: int) -> Optional[Tuple[int, int]]:
+    word = _at(tokens, i)
+    if word in TENS:
+        unit = ONES.get(_at(tokens, i + 1), 0)
+        if 0 < unit < 10:
+            return TENS[word] + unit, i + 2
+        return TENS[word], i + 1
+    if word in ONES:
+        return ONES[word], i + 1
+    return None
+
+
+def _below_thousand(tokens: Tokens, i: int) -> Optional[Tuple[int, int]]:
+    part = _below_hundred(tokens, i)
+    if part is None:
+        return None
+    value, j = part
+    if _at(tokens, j) == "hundred" and 0 < value < 10:
+        value, j = value * 100, j + 1
+        rest = _below_hundred(tokens, j + 1 if _at(tokens, j) == "and" else j)
+        if rest is not None:
+            value, j = value + rest[0], rest[1]
+    return value, j
+
+
+def parse_cardinal(tokens: Tokens, i: int) -> Optional[Tuple[int, int]]:
+    """Parse "28", "twenty eight" or "one hundred and two" at tokens[i]; returns (value, next index)."""
+    if _at(tokens, i).isdigit():
+        return int(tokens[i]), i + 1
+    part = _below_thousand(tokens, i)
+    if part is None:
+        return None
+    value, j = part
+    if _at(tokens, j) == "thousand" and value > 0:
+        value, j = value * 1000, j + 1
+        rest = _below_thousand(tokens, j + 1 if _at(tokens, j) == "and" else j)
+        if rest is not None:
+            value, j = value + rest[0], rest[1]
+    return value, j
+
+
+def parse_ordinal(tokens: Tokens, i: int) -> Optional[Tuple[int, int]]:
+    """Parse "27th", "seventh" or "twenty seventh" at tokens[i]."""
+    word = _at(tokens, i)
+    numeric = _NUMERIC_ORDINAL.fullmatch(word)
+    if numeric:
+        return int(numeric.group(1)), i + 1
+    if word in ORDINALS:
+        return ORDINALS[word], i + 1
+    if word in TENS and ORDINALS.get(_at(tokens, i + 1), 10) < 10:
+        return TENS[word] + ORDINALS[tokens[i + 1]], i + 2
+    return None
+
+
+def parse_year(tokens: Tokens, i: int) -> Optional[Tuple[int, int]]:
+    """Parse "2023", "two thousand (and) twenty three", "twenty twenty three" or "twenty oh five"."""
+    word = _at(tokens, i)
+    if word.isdigit():
+        return (int(word), i + 1) if len(word) == 4 else None
+    number = parse_cardinal(tokens, i)
+    if number is not None and 1900 <= number[0] <= 2100:
+        return number
+    head = _below_hundred(tokens, i)
+    if head is None or head[0] not in (19, 20):
+        return None
+    j = head[1]
+    if _at(tokens, j) in ("oh", "o") and 0 < ONES.get(_at(tokens, j + 1), 0) < 10:
+        return head[0] * 100 + ONES[tokens[j + 1]], j + 2
+    tail = _below_hundred(tokens, j)
+    if tail is not None and 10 <= tail[0] < 100:
+        return head[0] * 100 + tail[0], tail[1]
+    return None
+
+
+def _date(year: int, month: int, day: int) -> Optional[str]:
+    try:
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _numeric_date(tokens: Tokens, i: int) -> Optional[Tuple[Optional[str], int]]:
+    """2023-10-27, 10/27/2023 or 27/10/23. Month and day orders are told apart by a day above 12;
+    when both readings are possible the date is ambiguous (None)."""
+    parts = tokens[i:i + 3]
+    if len(parts) < 3 or not all(part.isdigit() for part in parts):
+        return None
+    first, second, third = parts
+    if len(first) == 4:
+        return _date(int(first), int(second), int(third)), i + 3
+    if len(third) not in (2, 4):
+        return None
+    year = int(third) + (2000 if len(third) == 2 else 0)
+    a, b = int(first), int(second)
+    if a > 12 >= b:
+        return _date(year, b, a), i + 3
+    if b > 12 >= a or a == b:
+        return _date(year, a, b), i + 3
+    return None, i + 3
+
+
+def _day(tokens: Tokens, i: int) -> Optional[Tuple[int, int]]:
+    if _at(tokens, i) == "the":
+        i += 1
+    day = parse_ordinal(tokens, i) or parse_cardinal(tokens, i)
+    if day is None or not 1 <= day[0] <= 31:
+        return None
+    return day
+
+
+def _spoken_date(tokens: Tokens, i: int) -> Optional[Tuple[Optional[str], int]]:
+    """"October 27th, 2023", "October the twenty seventh twenty twenty three" or "27 Oct 2023"."""
+    if _at(tokens, i) in MONTHS:
+        month, j = MONTHS[tokens[i]], i + 1
+        day = _day(tokens, j)
+        if day is None:
+            return None
+        j = day[1]
+    else:
+        day = _day(tokens, i)
+        if day is None:
+            return None
+        j = day[1] + 1 if _at(tokens, day[1]) == "of" else day[1]
+        if _at(tokens, j) not in MONTHS:
+            return None
+        month, j = MONTHS[tokens[j]], j + 1
+    year = parse_year(tokens, j)
+    if year is None:
+        return None
+    return _date(year[0], month, day[0]), year[1]
+
+
+def extract_date(tokens: Tokens, require_marker: bool) -> Match:
+    for i in range(len(tokens)):
+        found = _numeric_date(tokens, i) or _spoken_date(tokens, i)
+        if found is not None:
+            value, end = found
+            return (value, set(range(i, end))) if value is not None else None
+    return None
+
+
+def extract_age(tokens: Tokens, require_marker: bool) -> Match:
+    candidates = []
+    i = 0
+    while i < len(tokens):
+        number = parse_cardinal(tokens, i)
+        if number is None:
+            i += 1
+            continue
+        value, end = number
+        if _at(tokens, end) in OTHER_AGE_UNITS:
+            # Ages in months or days are not a whole number of years
+            return None
+        indices = set(range(i, end))
+        if _at(tokens, end) in AGE_UNITS:
+            indices.add(end)
+            if _at(tokens, end + 1) == "old":
+                indices.add(end + 1)
+        marked = len(indices) > end - i or (i > 0 and tokens[i - 1] in ("age", "aged"))
+        candidates.append((value, indices, marked))
+        i = end
+    if len(candidates) != 1:
+        return None
+    value, indices, marked = candidates[0]
+    if not 0 < value <= MAX_AGE or (require_marker and not marked):
+        return None
+    return value, indices
+
+
+def extract_sex(tokens: Tokens, require_marker: bool) -> Match:
+    male = {i for i, token in enumerate(tokens) if token in MALE_WORDS}
+    female = {i for i, token in enumerate(tokens) if token in FEMALE_WORDS}
+    if bool(male) == bool(female):
+        return None
+    return ("male", male) if male else ("female", female)
+
+
+def extract_medical_record_number(tokens: Tokens, require_marker: bool) -> Match:
+    """Digits written or spoken one at a time, e.g. "one, two, three, oh, double five"."""
+    runs: List[Tuple[str, Set[int]]] = []
+    digits, indices = "", set()
+    i = 0
+    while i <= len(tokens):
+        word = _at(tokens, i)
+        repeat = {"double": 2, "triple": 3}.get(word)
+        if repeat and 0 <= ONES.get(_at(tokens, i + 1), 10) < 10:
+            digits += str(ONES[tokens[i + 1]]) * repeat
+            indices |= {i, i + 1}
+            i += 2
+            continue
+        if word.isdigit() or 0 <= ONES.get(word, 10) < 10 or (word in ("oh", "o") and digits):
+            digits += word if word.isdigit() else str(ONES.get(word, 0))
+            indices.add(i)
+        elif digits:
+            runs.append((digits, indices))
+            digits, indices = "", set()
+        i += 1
+    if len(runs) != 1 or len(runs[0][0]) < MRN_MIN_DIGITS:
+        return None
+    if require_marker and not ({"mrn", "record"} & set(tokens)):
+        return None
+    return runs[0]
+
+
+EXTRACTORS: Dict[str, Callable[[Tokens, bool], Match]] = {
+    "patient.age": extract_age,
+    "patient.sex": extract_sex,
+    "patient.medical_record_number": extract_medical_record_number,
+    "procedure.date": extract_date,
+}
+SUPPORTED_FIELDS = tuple(EXTRACTORS)
+
+
+def pre_extract(user_message: str, field: Optional[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Parse a short answer to the prompt for `field` without calling the model.
+
+    Returns an `updated_record`-shaped update, or None unless the message is
+    nothing but the answer: the prompted field, optionally other simple fields
+    that are clearly marked ("twenty-eight years old, male"), and filler words.
+    """
+    if field not in EXTRACTORS or len(user_message) > MAX_ANSWER_CHARS:
+        return None
+    tokens = tokenize(user_message)
+    update: Dict[str, Dict[str, Any]] = {}
+    for name in [field] + [other for other in EXTRACTORS if other != field]:
+        match = EXTRACTORS[name](tokens, name != field)
+        if match is None:
+            if name == field:
+                return None
+            continue
+        value, indices = match
+        section, key = name.split(".")
+        update.setdefault(section, {})[key] = value
+        # Consumed tokens cannot be matched again by the other rules
+        for i in indices:
+            tokens[i] = ""
+    if any(token and token not in FILLER_WORDS for token in tokens):
+        return None
+    return update
@@ -0,0 +1,178 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from medical_records.telemetry import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_EVENTS = metrics.counter("prediction_cache_events_total",
+                               "Prediction cache lookups and writes, by event (memory_hit, disk_hit, miss, store, eviction).")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so reformatted but identical prompts share a cache entry."""
+    return _WHITESPACE.sub(" ", prompt).strip()
+
+
+def cache_key(prompt: str, parameters: Dict[str, Any]) -> str:
+    """Content address of a prediction: hash of the normalized prompt and model parameters."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(parameters, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_prompt(prompt).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """Two-tier cache of deterministic (temperature 0) model completions.
+
+    The memory tier is an LRU of `max_entries` completions. The optional disk
+    tier keeps completions in `disk_dir` for `ttl` seconds and at most
+    `max_disk_bytes`. Prompts and completions contain PHI, so the disk tier is
+    only used when `memory_only` is off *and* an encryption key is configured;
+    entries are written as Fernet tokens and nothing is stored in plain text.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3600, disk_dir: Optional[str] = None,
+                 max_disk_bytes: int = 50 * 1024 * 1024, encryption_key: Optional[str] = None,
+                 memory_only: bool = True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self.disk_dir: Optional[str] = None
+        self._fernet = None
+        if disk_dir and not memory_only:
+            if not encryption_key:
+                logger.warning("Prediction cache disk tier disabled: no encryption key configured.")
+            else:
+                from cryptography.fernet import Fernet
+                self._fernet = Fernet(encryption_key)
+                os.makedirs(disk_dir, mode=0o700, exist_ok=True)
+                self.disk_dir = disk_dir
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    metrics.inc(CACHE_EVENTS, event="memory_hit")
+                    return value
+                del self._memory[key]
+        value = self._read_disk(key)
+        if value is None:
+            metrics.inc(CACHE_EVENTS, event="miss")
+            return None
+        metrics.inc(CACHE_EVENTS, event="disk_hit")
+        with self._lock:
+            self._store_memory_locked(key, value)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        metrics.inc(CACHE_EVENTS, event="store")
+        with self._lock:
+            self._store_memory_locked(key, value)
+        self._write_disk(key, value)
+
+    def get_or_compute(self, prompt: str, parameters: Dict[str, Any], compute: Callable[[], Optional[str]]) -> Optional[str]:
+        """Return the cached completion for prompt/parameters, computing and storing it on a miss."""
+        if not self.enabled:
+            return compute()
+        key = cache_key(prompt, parameters)
+        value = self.get(key)
+        if value is not None:
+            return value
+        value = compute()
+        if value is not None:
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self.disk_dir:
+            for name in os.listdir(self.disk_dir):
+                os.remove(os.path.join(self.disk_dir, name))
+
+    def _store_memory_locked(self, key: str, value: str) -> None:
+        self._memory[key] = (value, time.monotonic() + self.ttl)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            metrics.inc(CACHE_EVENTS, event="eviction")
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        path = os.path.join(self.disk_dir, key)
+        try:
+            with open(path, "rb") as f:
+                token = f.read()
+            # Fernet tokens carry their creation time, so the TTL is enforced on decrypt.
+            return self._fernet.decrypt(token, ttl=int(self.ttl)).decode("utf-8")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Discarding unreadable prediction cache entry: {type(e).__name__}")
+            self._remove(path)
+            return None
+
+    def _write_disk(self, key: str, value: str) -> None:
+        if not self.disk_dir:
+            return
+        path = os.path.join(self.disk_dir, key)
+        tmp_path = f"{path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(self._fernet.encrypt(value.encode("utf-8")))
+            os.replace(tmp_path, path)
+            self._enforce_disk_limits()
+        except OSError as e:
+            logger.warning(f"Could not write prediction cache entry: {str(e)}")
+            self._remove(tmp_path)
+
+    def _enforce_disk_limits(self) -> None:
+        """Drop expired entries, then the oldest ones until the tier fits in max_disk_bytes."""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.ttl:
+                self._remove(path)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
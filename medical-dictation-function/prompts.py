@@ -0,0 +1,248 @@
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+from medical_records.record_schema import RECORD_SCHEMA
+
+PROMPT_MODE_FULL = "full"
+PROMPT_MODE_COMPACT = "compact"
+PROMPT_MODES = (PROMPT_MODE_FULL, PROMPT_MODE_COMPACT)
+
+# Static part of the compact prompt, built once at import time. It carries the
+# same rules as the full prompt without indentation or the pretty-printed example.
+COMPACT_INSTRUCTIONS = "\n".join([
+    "## SYSTEM INSTRUCTIONS",
+    "Update specific fields of a medical record from the user's input and generate CPT, SNOMED CT and ICD-10 codes for mentioned diagnoses and procedures.",
+    "Rules:",
+    "1. When procedures or diagnoses are mentioned, update procedure.procedures_performed and add codes to the coding section.",
+    "2. Never put codes in procedure fields; all codes go in coding.",
+    '3. Each code is {"code":"12345","description":"..."}.',
+    "4. Dates are strings in YYYY-MM-DD format.",
+    "5. Pay special attention to pre/postoperative diagnoses, procedures performed and complications.",
+    "6. Focus on the missing required fields.",
+    "7. No comments in the JSON.",
+    "8. All property names in double quotes.",
+    "9. Keep arrays and nested objects well formed.",
+    "10. preoperative_diagnosis and postoperative_diagnosis are single strings, not arrays.",
+    "Do not add or modify information the user did not explicitly provide. Include only the fields that were updated.",
+    'Respond with only a JSON object shaped like: {"updated_record":{"patient":{"field_name":"value"},'
+    '"procedure":{"field_name":"value","procedures_performed":["Procedure 1"]},'
+    '"coding":{"cpt":[{"code":"12345","description":"..."}],"snomed_ct":[{"code":"123456789","description":"..."}],'
+    '"icd_10":[{"code":"A12.3","description":"..."}]}},"message":"Your response message here"}',
+])
+
+
+def non_empty_fields(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the record with empty values and empty sections removed."""
+    compact: Dict[str, Any] = {}
+    for section, data in record.items():
+        if isinstance(data, dict):
+            filled = {field: value for field, value in data.items() if value}
+            if filled:
+                compact[section] = filled
+        elif data:
+            compact[section] = data
+    return compact
+
+
+def create_compact_prompt(user_message: str, current_record: Dict[str, Any],
+                          current_prompt: Optional[Dict[str, str]], missing_fields: List[str]) -> str:
+    """Build a prompt holding only the filled fields and the list of missing ones."""
+    separators = (',', ':')
+    return "\n".join([
+        COMPACT_INSTRUCTIONS,
+        "## CURRENT RECORD (filled fields only)",
+        json.dumps(non_empty_fields(current_record), separators=separators, ensure_ascii=False),
+        "## MISSING REQUIRED FIELDS",
+        ",".join(missing_fields) or "none",
+        "## CURRENT PROMPT",
+        json.dumps(current_prompt, separators=separators, ensure_ascii=False),
+        "## USER MESSAGE",
+        user_message,
+        "## ASSISTANT RESPONSE",
+    ])
+
+
+# Whole-dictation extraction: every schema field is requested in one call per chunk.
+DICTATION_CHUNK_CHARS = 8000
+_RECORD_FIELDS = ",".join(f"{section}.{field}" for section, fields in RECORD_SCHEMA.items() for field in fields)
+DICTATION_INSTRUCTIONS = "\n".join([
+    "## SYSTEM INSTRUCTIONS",
+    "Extract a structured medical record from a dictated procedure report and generate CPT, SNOMED CT and ICD-10 codes for the diagnoses and procedures it mentions.",
+    f"Record fields: {_RECORD_FIELDS}",
+    "Rules:",
+    "1. Fill every field the dictation mentions; omit fields it does not mention.",
+    "2. patient.age is a number. Spoken numbers become digits (\"one, two, three\" -> \"123\").",
+    "3. Dates are strings in YYYY-MM-DD format.",
+    "4. preoperative_diagnosis and postoperative_diagnosis are single strings; procedures_performed is a list of strings.",
+    '5. Codes go only in coding, each as {"code":"12345","description":"..."}.',
+    "6. Ignore filler words and self-corrections; use the corrected value.",
+    "7. Do not invent information that is not in the dictation. No comments in the JSON.",
+    'Respond with only a JSON object: {"updated_record":{"patient":{...},"procedure":{...},"coding":{"cpt":[],"snomed_ct":[],"icd_10":[]}},"message":"One sentence summary"}',
+])
+
+
+def chunk_transcript(transcript: str, max_chars: int = DICTATION_CHUNK_CHARS) -> List[str]:
+    """Split a transcript into chunks of at most max_chars, on paragraph then sentence boundaries."""
+    pieces: List[str] = []
+    for paragraph in re.split(r"\n\s*\n", transcript.strip()):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            pieces.extend(sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars))
+
+    chunks: List[str] = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def create_dictation_prompt(transcript_chunk: str, current_record: Dict[str, Any], missing_fields: List[str],
+                            chunk_number: int = 1, chunk_count: int = 1) -> str:
+    """Build a prompt that extracts every field mentioned in (part of) a full dictation."""
+    separators = (',', ':')
+    return "\n".join([
+        DICTATION_INSTRUCTIONS,
+        "## ALREADY EXTRACTED (filled fields only)",
+        json.dumps(non_empty_fields(current_record), separators=separators, ensure_ascii=False),
+        "## MISSING REQUIRED FIELDS",
+        ",".join(missing_fields) or "none",
+        f"## DICTATION (part {chunk_number} of {chunk_count})",
+        transcript_chunk,
+        "## ASSISTANT RESPONSE",
+    ])
+
+
+# Fan-out pipeline: narrative fields first, then one small prompt per code system.
+NARRATIVE_INSTRUCTIONS = "\n".join([
+    "## SYSTEM INSTRUCTIONS",
+    "Update the patient and procedure fields of a medical record from the user's input. Do not generate any codes.",
+    "Rules:",
+    "1. When procedures are mentioned, update procedure.procedures_performed (a list of strings).",
+    "2. Dates are strings in YYYY-MM-DD format.",
+    "3. preoperative_diagnosis and postoperative_diagnosis are single strings, not arrays.",
+    "4. Focus on the missing required fields. Include only the fields that were updated.",
+    "5. Do not add or modify information the user did not explicitly provide. No comments in the JSON.",
+    'Respond with only a JSON object: {"updated_record":{"patient":{"field_name":"value"},"procedure":{"field_name":"value"}},"message":"Your response message here"}',
+])
+
+CODE_SYSTEMS: Dict[str, Dict[str, Any]] = {
+    "cpt": {"name": "CPT", "sources": ["procedures_performed"],
+            "example": '{"code":"27892","description":"Decompression fasciotomy, leg"}'},
+    "icd_10": {"name": "ICD-10-CM", "sources": ["preoperative_diagnosis", "postoperative_diagnosis"],
+               "example": '{"code":"S75.011A","description":"Minor laceration of femoral artery, right leg, initial encounter"}'},
+    "snomed_ct": {"name": "SNOMED CT", "sources": ["preoperative_diagnosis", "postoperative_diagnosis", "procedures_performed"],
+                  "example": '{"code":"81121007","description":"Fasciotomy"}'},
+}
+
+
+def create_narrative_prompt(user_message: str, current_record: Dict[str, Any],
+                            current_prompt: Optional[Dict[str, str]], missing_fields: List[str]) -> str:
+    """Build the first fan-out stage prompt: patient and procedure fields only, no codes."""
+    separators = (',', ':')
+    record = {section: data for section, data in non_empty_fields(current_record).items() if section != "coding"}
+    return "\n".join([
+        NARRATIVE_INSTRUCTIONS,
+        "## CURRENT RECORD (filled fields only)",
+        json.dumps(record, separators=separators, ensure_ascii=False),
+        "## MISSING REQUIRED FIELDS",
+        ",".join(field for field in missing_fields if not field.startswith("coding.")) or "none",
+        "## CURRENT PROMPT",
+        json.dumps(current_prompt, separators=separators, ensure_ascii=False),
+        "## USER MESSAGE",
+        user_message,
+        "## ASSISTANT RESPONSE",
+    ])
+
+
+def create_coding_prompt(code_system: str, procedure: Dict[str, Any]) -> str:
+    """Build a prompt asking for the codes of one code system for the record's procedures and diagnoses."""
+    spec = CODE_SYSTEMS[code_system]
+    sources = {field: procedure.get(field) for field in spec["sources"] if procedure.get(field)}
+    return "\n".join([
+        "## SYSTEM INSTRUCTIONS",
+        f"Assign {spec['name']} codes to the following procedure details. Use only codes that exist in {spec['name']}; "
+        "do not guess codes for information that is not given. Use the most specific code available.",
+        f'Respond with only a JSON object: {{"codes":[{spec["example"]}]}}',
+        "## PROCEDURE DETAILS",
+        json.dumps(sources, separators=(',', ':'), ensure_ascii=False),
+        "## ASSISTANT RESPONSE",
+    ])
+
+
+def create_prompt(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]],
+                  mode: str = PROMPT_MODE_FULL, missing_fields: Optional[List[str]] = None) -> str:
+    if mode == PROMPT_MODE_COMPACT:
+        return create_compact_prompt(user_message, current_record, current_prompt, missing_fields or [])
+    return f"""
+    ## SYSTEM INSTRUCTIONS
+    Purpose: This LLM is designed to assist in updating specific fields of a medical record based on user input, including generating appropriate SNOMED CT and ICD-10 codes for diagnoses and procedures.
+
+    Input: The LLM will accept free-text input related to a specific field in the medical record.
+
+    Output: The LLM will generate a JSON object containing only the fields that were updated based on the user's input, including SNOMED CT and ICD-10 codes when relevant medical information is provided.
+
+    Special Instructions:
+    1. When procedures or diagnoses are mentioned, update the 'procedure.procedures_performed' field and generate appropriate codes in the 'coding' section.
+    2. Do not insert codes directly into the 'procedure' section fields. All codes should be placed in the 'coding' section.
+    3. For CPT, SNOMED CT, and ICD-10 codes, provide both the code and its description in the following format:
+       {{"code": "12345", "description": "Description of the procedure or diagnosis"}}
+    4. For dates, always format them as strings in YYYY-MM-DD format (e.g., "2024-10-02" for October 2, 2024).
+    5. Pay special attention to preoperative and postoperative diagnoses, procedures performed, and any mentioned complications or conditions.
+    6. Focus on filling the missing required fields for BigQuery insertion.
+    7. Do not use comments in the JSON response.
+    8. Ensure all property names are enclosed in double quotes.
+    9. Maintain proper JSON structure, especially for arrays and nested objects.
+    10. For 'preoperative_diagnosis' and 'postoperative_diagnosis', provide a single string value, not an array.
+
+    Current Record State:
+    {json.dumps(current_record, indent=2)}
+
+    Current Prompt:
+    {json.dumps(current_prompt, indent=2)}
+
+    ## USER MESSAGE
+    {user_message}
+
+    ## ASSISTANT RESPONSE
+    Based on the user's input, please update the relevant fields in the record, including generating appropriate SNOMED CT and ICD-10 codes for any mentioned diagnoses or procedures. Focus on filling the missing required fields. Do not add or modify any information that was not explicitly provided by the user. Your response should be a valid JSON object with the following structure:
+    {{
+        "updated_record": {{
+            "patient": {{
+                "field_name": "value"
+            }},
+            "procedure": {{
+                "field_name": "value",
+                "preoperative_diagnosis": "Single string diagnosis",
+                "postoperative_diagnosis": "Single string diagnosis",
+                "procedures_performed": [
+                    "Procedure 1",
+                    "Procedure 2"
+                ]
+            }},
+            "coding": {{
+                "cpt": [
+                    {{"code": "12345", "description": "Description of procedure 1"}},
+                    {{"code": "67890", "description": "Description of procedure 2"}}
+                ],
+                "snomed_ct": [
+                    {{"code": "123456789", "description": "SNOMED CT description 1"}},
+                    {{"code": "987654321", "description": "SNOMED CT description 2"}}
+                ],
+                "icd_10": [
+                    {{"code": "A12.3", "description": "ICD-10 description 1"}},
+                    {{"code": "B45.6", "description": "ICD-10 description 2"}}
+                ]
+            }}
+        }},
+        "message": "Your response message here"
+    }}
+    """
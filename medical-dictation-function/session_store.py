@@ -0,0 +1,150 @@
+import abc
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 1800
+DEFAULT_MAX_SESSIONS = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+"""
+
+
+def new_session_id() -> str:
+    """Unguessable session id; it is the only credential for the session's record."""
+    return secrets.token_urlsafe(18)
+
+
+class SessionStore(abc.ABC):
+    """Dictation session state (record and current prompt) keyed by session id.
+
+    `get()` returns the state with its `version`. `save()` is a compare-and-set
+    on that version, so two requests racing on one session cannot silently
+    overwrite each other's updates: the loser gets False and should retry.
+    """
+
+    @abc.abstractmethod
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the session's state with its version, or None if it is unknown or expired."""
+
+    @abc.abstractmethod
+    def save(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int]) -> bool:
+        """Store state as the next version; expected_version None creates a new session."""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Forget the session."""
+
+
+class MemorySessionStore(SessionStore):
+    """LRU of at most `max_sessions` sessions, each expiring `ttl` seconds after its last save.
+
+    Sessions live in this instance's memory only: requests routed to another
+    instance, or arriving after a restart, see an unknown session.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, ttl: float = DEFAULT_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            state, version, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+        # Stored as JSON so callers can mutate what they get back
+        return {**json.loads(state), "version": version}
+
+    def save(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int]) -> bool:
+        payload = json.dumps({key: value for key, value in state.items() if key != "version"})
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            current_version = entry[1] if entry is not None and entry[2] > time.monotonic() else None
+            if current_version != expected_version:
+                return False
+            self._sessions[session_id] = (payload, (current_version or 0) + 1, time.monotonic() + self.ttl)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return True
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a local SQLite file, so they survive restarts of the same instance."""
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        if path != ":memory:":
+            # Sessions hold patient records; keep the file private to this user.
+            os.chmod(path, 0o600)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT state, version FROM sessions WHERE id = ? AND expires_at > ?",
+                                     (session_id, time.time())).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[0]), "version": row[1]}
+
+    def save(self, session_id: str, state: Dict[str, Any], expected_version: Optional[int]) -> bool:
+        payload = json.dumps({key: value for key, value in state.items() if key != "version"})
+        now = time.time()
+        with self._lock:
+            if expected_version is None:
+                self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO sessions (id, state, version, expires_at) VALUES (?, ?, 1, ?)",
+                    (session_id, payload, now + self.ttl))
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE sessions SET state = ?, version = version + 1, expires_at = ? "
+                    "WHERE id = ? AND version = ? AND expires_at > ?",
+                    (payload, now + self.ttl, session_id, expected_version, now))
+        return cursor.rowcount == 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+
+def create_session_store() -> SessionStore:
+    """Session store configured by SESSION_STORE ("memory" or "sqlite"), SESSION_STORE_PATH,
+    SESSION_TTL_SECONDS and SESSION_MAX_ENTRIES."""
+    ttl = float(os.environ.get("SESSION_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+    backend = os.environ.get("SESSION_STORE", "memory")
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.environ.get("SESSION_STORE_PATH", "/tmp/dictation_sessions.db"), ttl)
+    if backend != "memory":
+        raise ValueError(f"Invalid session store: {backend}")
+    return MemorySessionStore(int(os.environ.get("SESSION_MAX_ENTRIES", str(DEFAULT_MAX_SESSIONS))), ttl)
@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class InFlightCall:
+    """Result slot for one call shared by a leader and any number of followers."""
+
+    def __init__(self):
+        self.followers = 0
+        self._done = threading.Event()
+        self._value: Any = None
+        self._error: Optional[BaseException] = None
+
+    def resolve(self, value: Any = None, error: Optional[BaseException] = None) -> None:
+        self._value, self._error = value, error
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> Any:
+        """Block until the leader finishes; return its value or raise its exception."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Timed out waiting for an identical call in flight")
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one.
+
+    The first caller for a key (the leader) makes the call. Callers arriving
+    while it is in flight (followers) wait for it and get the same value, or
+    the same exception. Nothing is kept after the call finishes, so a later
+    caller starts a new call; serving repeats is the prediction cache's job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, InFlightCall] = {}
+
+    def begin(self, key: str) -> Tuple[InFlightCall, bool]:
+        """Join the call in flight for `key`, or start one; returns (call, is_leader).
+
+        A leader must call `finish()` exactly once, whether the call succeeds or fails.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.followers += 1
+                return call, False
+            call = self._calls[key] = InFlightCall()
+            return call, True
+
+    def finish(self, key: str, call: InFlightCall, value: Any = None, error: Optional[BaseException] = None) -> None:
+        """Publish the leader's result to its followers and let the next caller start a new call."""
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        call.resolve(value, error)
+
+    def do(self, key: str, function: Callable[[], Any], on_join: Optional[Callable[[], None]] = None) -> Any:
+        """Run `function` once for all concurrent callers with `key` and return its value.
+
+        `on_join` is called when this caller joins a call in flight instead of
+        making its own, before waiting for it (so failed calls are counted too).
+        """
+        call, is_leader = self.begin(key)
+        if not is_leader:
+            if on_join is not None:
+                on_join()
+            return call.wait()
+        value, error = None, None
+        try:
+            value = function()
+            return value
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.finish(key, call, value, error)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
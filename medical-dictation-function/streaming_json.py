@@ -0,0 +1,106 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+WHITESPACE = " \t\r\n"
+
+
+class _Frame:
+    __slots__ = ("kind", "key", "expect_key", "value_start", "string_is_key")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.key: Optional[str] = None
+        self.expect_key = kind == "{"
+        self.value_start: Optional[int] = None
+        self.string_is_key = False
+
+
+class IncrementalFieldParser:
+    """Incrementally scan a streamed JSON completion for finished record fields.
+
+    Feed text chunks as they arrive; each call returns the
+    `(section, field, value)` triples under `updated_record` whose values were
+    completed by that chunk. Text before the first `{` (such as a ```json fence)
+    is ignored, and scanning stops once the top-level object closes. The full
+    text seen so far is kept in `text` for the final parse.
+    """
+
+    def __init__(self, root_key: str = "updated_record"):
+        self.root_key = root_key
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, str, Any]]:
+        self.text += chunk
+        fields: List[Tuple[str, str, Any]] = []
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            i = self._pos
+            char = text[i]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if frame.string_is_key:
+                        frame.key = json.loads(text[self._string_start:i + 1])
+                        frame.string_is_key = False
+                    else:
+                        self._complete(i + 1, fields)
+                continue
+            if not self._stack:
+                if char == "{":
+                    self._stack.append(_Frame("{"))
+                continue
+            frame = self._stack[-1]
+            if char in WHITESPACE:
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = i
+                if frame.kind == "{" and frame.expect_key:
+                    frame.string_is_key = True
+                else:
+                    frame.value_start = i
+            elif char == ":":
+                frame.expect_key = False
+            elif char == ",":
+                self._complete(i, fields)
+                frame.expect_key = frame.kind == "{"
+            elif char in "{[":
+                frame.value_start = i
+                self._stack.append(_Frame(char))
+            elif char in "}]":
+                self._complete(i, fields)
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                else:
+                    self._complete(i + 1, fields)
+            elif frame.value_start is None and not frame.expect_key:
+                # Start of a number or literal (true, false, null)
+                frame.value_start = i
+        return fields
+
+    def _complete(self, end: int, fields: List[Tuple[str, str, Any]]) -> None:
+        """Finish the value pending in the innermost frame, emitting it if it is a record field."""
+        frame = self._stack[-1]
+        if frame.value_start is None:
+            return
+        start, frame.value_start = frame.value_start, None
+        stack = self._stack
+        if len(stack) == 3 and stack[0].key == self.root_key and stack[1].key and frame.key:
+            try:
+                value = json.loads(self.text[start:end])
+            except json.JSONDecodeError:
+                return
+            fields.append((stack[1].key, frame.key, value))
@@ -0,0 +1,47 @@
+import os
+from typing import Dict, Optional
+
+from prompts import CODE_SYSTEMS
+
+# Output tokens for a turn answering the prompt for each type of field: the
+# updated fields, any codes they imply, and a one-sentence message.
+# TOKEN_BUDGET=fixed always asks for GENERATION_PARAMETERS["maxOutputTokens"].
+TOKEN_BUDGET = os.environ.get("TOKEN_BUDGET", "adaptive")
+FIELD_TYPE_BUDGETS: Dict[str, int] = {
+    "short": 256,      # names, numbers, dates
+    "narrative": 384,  # free-text procedure fields
+    "coded": 1024,     # diagnoses and procedures, which also produce code lists
+}
+# Used when there is no current prompt, e.g. the opening turn of a dictation
+DEFAULT_BUDGET = 1024
+MAX_BUDGET = 2048
+# A message can fill more than the prompted field; allow one output token per this many characters of it
+MESSAGE_CHARS_PER_TOKEN = 2
+BUDGET_STEP = 64
+
+SHORT_PROCEDURE_FIELDS = {"date", "surgeon", "assistant_surgeon", "anesthesiologist", "estimated_blood_loss"}
+CODED_FIELDS = {source for spec in CODE_SYSTEMS.values() for source in spec["sources"]}
+
+
+def field_type(field: Optional[str]) -> Optional[str]:
+    """"short", "narrative" or "coded" for a dotted record field, or None if there is no field."""
+    if not field or "." not in field:
+        return None
+    section, _, key = field.partition(".")
+    if section == "coding" or key in CODED_FIELDS:
+        return "coded"
+    if section == "patient" or key in SHORT_PROCEDURE_FIELDS:
+        return "short"
+    return "narrative"
+
+
+def turn_budget(field: Optional[str], user_message: str, fixed: int) -> int:
+    """maxOutputTokens for a turn answering the prompt for `field`, or `fixed` when budgeting is off."""
+    if TOKEN_BUDGET == "fixed":
+        return fixed
+    kind = field_type(field)
+    if kind not in FIELD_TYPE_BUDGETS:
+        # Nothing to size the answer by; never ask for more than the fixed budget did
+        return min(fixed, DEFAULT_BUDGET)
+    budget = FIELD_TYPE_BUDGETS[kind] + len(user_message) // MESSAGE_CHARS_PER_TOKEN
+    return min(MAX_BUDGET, -(-budget // BUDGET_STEP) * BUDGET_STEP)
@@ -0,0 +1,111 @@
+"""Export accepted records to date-partitioned Parquet/Arrow files, load them, and query code statistics.
+
+Records are read from a JSON Lines file (one record per line) or a JSON array.
+Each record is validated the way submit-to-bigquery validates it, and only the
+accepted ones are exported. --load appends them to BigQuery with one load job
+instead of streaming inserts, which is cheaper and faster for backfills.
+`stats` counts the most frequent codes per procedure field from the exported
+files, without BigQuery.
+
+Requires pyarrow (and google-cloud-bigquery for --load).
+
+    python scripts/export_records.py export records.jsonl --out exports/
+    python scripts/export_records.py export records.jsonl --out exports/ --load
+    python scripts/export_records.py stats exports/ --system cpt --by location --top 5
+    python scripts/export_records.py stats exports/ --system icd_10 --from 2024-01-01 --to 2024-03-31
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+
+from medical_records.columnar_export import (COLUMN_KINDS, EXPORT_FORMATS, code_frequency,  # noqa: E402
+                                             load_table, records_to_table, write_partitioned)
+from medical_records.idempotency import load_job_id  # noqa: E402
+from medical_records.insert_path import to_bq_record  # noqa: E402
+from medical_records.validation import correct_codes, validate_record  # noqa: E402
+
+PROJECT_ID = "<redacted>"
+DATASET_ID = "health"
+TABLE_ID = "usu_procedures"
+
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def export(args: argparse.Namespace) -> None:
+    accepted, rejected = [], 0
+    for number, record in enumerate(read_records(args.input), 1):
+        is_valid, error_message = validate_record(correct_codes(record)) if isinstance(record, dict) else \
+            (False, "Record must be an object")
+        if is_valid:
+            accepted.append(to_bq_record(record))
+        else:
+            rejected += 1
+            print(f"record {number}: {error_message}", file=sys.stderr)
+    paths = write_partitioned(accepted, args.out, args.format) if accepted else []
+    print(f"accepted {len(accepted)}, rejected {rejected}, files written {len(paths)} under {args.out}")
+
+    if args.load and accepted:
+        from google.cloud import bigquery
+        client = bigquery.Client(project=args.project)
+        table_ref = client.dataset(args.dataset, project=args.project).table(args.table)
+        # Rerunning the same export waits for the earlier job instead of appending the rows again
+        load = load_table(client, table_ref, records_to_table(accepted), job_id=load_job_id(accepted))
+        print(f"load job {load['job_id']}: {load['rows']} rows appended to {args.project}.{args.dataset}.{args.table}")
+
+
+def stats(args: argparse.Namespace) -> None:
+    by = None if args.by == "none" else args.by
+    rows = code_frequency(args.directory, args.system, by, args.top, args.start, args.end, args.format)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    group = object()
+    for row in rows:
+        if row["group"] != group:
+            group = row["group"]
+            print(f"{by}: {group}" if by else "all records")
+        print(f"  {row['count']:>6}  {row['code']:<10}  {row['description']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="export accepted records")
+    export_parser.add_argument("input", help="records as JSON Lines or a JSON array")
+    export_parser.add_argument("--out", required=True, help="directory for the partitioned files")
+    export_parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    export_parser.add_argument("--load", action="store_true", help="also append the records with a BigQuery load job")
+    export_parser.add_argument("--project", default=PROJECT_ID)
+    export_parser.add_argument("--dataset", default=DATASET_ID)
+    export_parser.add_argument("--table", default=TABLE_ID)
+    export_parser.set_defaults(run=export)
+
+    stats_parser = commands.add_parser("stats", help="most frequent codes from exported files")
+    stats_parser.add_argument("directory")
+    stats_parser.add_argument("--system", choices=list(COLUMN_KINDS["coding"]), default="cpt")
+    stats_parser.add_argument("--by", default="location", help="procedure field to group by, or none")
+    stats_parser.add_argument("--top", type=int, default=10, help="codes per group")
+    stats_parser.add_argument("--from", dest="start", help="first procedure date, YYYY-MM-DD")
+    stats_parser.add_argument("--to", dest="end", help="last procedure date, YYYY-MM-DD")
+    stats_parser.add_argument("--format", choices=EXPORT_FORMATS, default="parquet")
+    stats_parser.add_argument("--json", action="store_true", help="print the rows as JSON")
+    stats_parser.set_defaults(run=stats)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
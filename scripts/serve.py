@@ -0,0 +1,120 @@
+"""Serve all three Cloud Functions from one process with a threaded WSGI server.
+
+The functions are mounted under their deployed names, so the frontend only
+needs a different host:
+
+    POST /medical-dictation-function
+    GET  /generate-field-report
+    POST /submit-to-bigquery  (GET for the health check)
+    GET  /metrics             (Prometheus text for all three, or ?format=json)
+
+Requests run concurrently on SERVER_THREADS threads of a single process, the
+way functions-framework runs a deployed function under gunicorn. One process
+keeps one copy of the module state (model and BigQuery clients, prediction
+cache, in-flight calls, sessions, insert queue) for every request; see
+"Concurrency" in the README for what that state guarantees.
+
+Uses gunicorn (installed with functions-framework) when it is available,
+otherwise Werkzeug's threaded server. Each function still needs its own
+dependencies (pip install -r <function>/requirements.txt).
+
+    python scripts/serve.py
+    SERVER_THREADS=64 BIGQUERY_POOL_SIZE=32 python scripts/serve.py --port 8080
+    python scripts/serve.py --server werkzeug
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# URL path -> (function directory, handler, methods)
+FUNCTIONS = {
+    "/medical-dictation-function": ("medical-dictation-function", "medical_record_assistant", ["POST", "OPTIONS"]),
+    "/generate-field-report": ("generate-field-report-function", "generate_field_report_http", ["GET", "OPTIONS"]),
+    "/submit-to-bigquery": ("submit-to-bigquery-function", "submit_to_bigquery", ["GET", "POST", "OPTIONS"]),
+}
+SERVERS = ("gunicorn", "werkzeug")
+# A streaming dictation turn holds its thread until the completion ends, so allow for many at once
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", str((os.cpu_count() or 1) * 8)))
+
+logger = logging.getLogger(__name__)
+
+
+def load_function(module_name: str, directory: str):
+    """Import a function's main.py under its own module name, with its directory on sys.path."""
+    path = os.path.join(ROOT, directory)
+    sys.path.insert(0, path)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(path, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_app():
+    """Flask app with every function mounted under its path."""
+    from flask import Flask, request
+    app = Flask("medical_records_server")
+
+    for path, (directory, handler_name, methods) in FUNCTIONS.items():
+        # The medical_records copies are identical (scripts/sync_shared.py --check), so the
+        # first one imported serves all three functions, with one InsertPath and one registry.
+        handler = getattr(load_function(directory.replace("-", "_") + "_main", directory), handler_name)
+        app.add_url_rule(path, endpoint=handler_name, methods=methods,
+                         view_func=lambda handler=handler: handler(request))
+
+    from medical_records import telemetry
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return telemetry.metrics_response(request)
+
+    return app
+
+
+def serve_gunicorn(app, host: str, port: int, threads: int) -> None:
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            # One worker: the caches, in-flight calls and insert queue are per process.
+            # timeout 0 like functions-framework: a long model call is not a hung worker.
+            for key, value in {"bind": f"{host}:{port}", "workers": 1, "worker_class": "gthread",
+                               "threads": threads, "timeout": 0}.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def serve_werkzeug(app, host: str, port: int) -> None:
+    from werkzeug.serving import run_simple
+    # A thread per request; the limit on concurrent work is the model and BigQuery settings
+    run_simple(host, port, app, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("HOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8080")))
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="concurrent requests (gunicorn)")
+    parser.add_argument("--server", choices=SERVERS, help="default: gunicorn if installed, otherwise werkzeug")
+    args = parser.parse_args()
+
+    server = args.server
+    if server is None:
+        server = "gunicorn" if importlib.util.find_spec("gunicorn") and os.name != "nt" else "werkzeug"
+    app = create_app()
+    logger.info(f"Serving {', '.join(FUNCTIONS)} on {args.host}:{args.port} with {server}")
+    if server == "gunicorn":
+        serve_gunicorn(app, args.host, args.port, args.threads)
+    else:
+        serve_werkzeug(app, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Copy the shared medical_records package into each Cloud Function directory.
+
+Each function is deployed from its own directory, so the package under
+shared/ is vendored into them. Edit shared/medical_records only, then run:
+
+    python scripts/sync_shared.py          # copy
+    python scripts/sync_shared.py --check  # exit 1 if any copy is out of date
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, "shared", "medical_records")
+FUNCTION_DIRS = ["generate-field-report-function", "medical-dictation-function", "submit-to-bigquery-function"]
+IGNORE = shutil.ignore_patterns("__pycache__", "*.pyc")
+
+
+def differences(left, right):
+    """Relative paths that differ between two directory trees."""
+    if not os.path.isdir(right):
+        return ["(missing)"]
+    comparison = filecmp.dircmp(left, right, ignore=["__pycache__"])
+    diffs = comparison.left_only + comparison.right_only + comparison.diff_files + comparison.funny_files
+    _, mismatch, errors = filecmp.cmpfiles(left, right, comparison.common_files, shallow=False)
+    diffs += mismatch + errors
+    for sub in comparison.common_dirs:
+        diffs += [os.path.join(sub, path) for path in differences(os.path.join(left, sub), os.path.join(right, sub))]
+    return sorted(set(diffs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--check", action="store_true", help="only report out-of-date copies")
+    args = parser.parse_args()
+
+    stale = False
+    for function_dir in FUNCTION_DIRS:
+        target = os.path.join(ROOT, function_dir, "medical_records")
+        diffs = differences(SOURCE, target)
+        if not diffs:
+            continue
+        if args.check:
+            stale = True
+            print(f"{function_dir}/medical_records is out of date: {', '.join(diffs)}")
+        else:
+            shutil.rmtree(target, ignore_errors=True)
+            shutil.copytree(SOURCE, target, ignore=IGNORE)
+            print(f"Updated {function_dir}/medical_records")
+    sys.exit(1 if stale else 0)
+
+
+if __name__ == "__main__":
+    main()
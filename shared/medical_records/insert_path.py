@@ -0,0 +1,259 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from medical_records import telemetry
+from medical_records.batch_writer import BatchWriter
+from medical_records.bigquery_client import BigQueryClientCache, default_client_factory, is_auth_error
+from medical_records.columnar_export import load_table, records_to_table, write_partitioned
+from medical_records.durable_queue import DurableQueue, QueueWorker
+from medical_records.idempotency import INSERT_ID_KEY, ReceiptCache, insert_id, load_job_id
+from medical_records.retry import RetryPolicy, call_with_retry, is_retryable_row_error
+from medical_records.telemetry import BIGQUERY_RETRIES, metrics
+from medical_records.validation import correct_codes, validate_record
+
+logger = logging.getLogger(__name__)
+
+BATCH_WAIT_TIMEOUT_SECONDS = 30
+ASYNC_UNAVAILABLE_MESSAGE = ("Asynchronous submission is disabled: set INSERT_QUEUE_PATH to a file on persistent "
+                             "storage to enable it")
+# Successful submissions are replayed to duplicates for this long (RECEIPT_TTL_SECONDS, RECEIPT_CACHE_SIZE)
+RECEIPT_TTL_SECONDS = float(os.environ.get("RECEIPT_TTL_SECONDS", "600"))
+RECEIPT_CACHE_SIZE = int(os.environ.get("RECEIPT_CACHE_SIZE", "10000"))
+
+
+def to_bq_record(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a record to match the BigQuery schema."""
+    bq_record = {
+        "patient": record.get("patient", {}),
+        "procedure": {
+            **record.get("procedure", {}),
+            "date": record.get("procedure", {}).get("date"),  # Keep as string
+            "procedures_performed": record.get("procedure", {}).get("procedures_performed", [])
+        },
+        "coding": {
+            "snomed_ct": record.get("coding", {}).get("snomed_ct", []),
+            "icd_10": record.get("coding", {}).get("icd_10", []),
+            "cpt": record.get("coding", {}).get("cpt", [])
+        }
+    }
+    # Round-trip through JSON to ensure it's valid JSON
+    return json.loads(json.dumps(bq_record))
+
+
+class InsertPath:
+    """Validation and batched, retried BigQuery inserts for finished records.
+
+    One instance per process is shared by every caller: submit-to-bigquery
+    requests and records auto-submitted by the dictation function go through
+    the same client, batch writer and durable queue.
+    """
+
+    def __init__(self, project_id: str, dataset_id: str, table_id: str, queue_path: Optional[str],
+                 client_factory: Callable[[], Any] = default_client_factory):
+        self.queue_path = queue_path
+        self.clients = BigQueryClientCache(project_id, dataset_id, table_id, client_factory)
+        # Synchronous inserts give up after 5 s in total; queued inserts back off for up to a minute
+        self.insert_retry_policy = RetryPolicy(max_attempts=3, base_delay=0.2, max_delay=2.0, deadline=5.0)
+        self.queue_retry_policy = RetryPolicy(base_delay=1.0, max_delay=60.0)
+        self.batch_writer = BatchWriter(lambda rows: self.insert_rows_with_retry(rows))
+        self._queue_lock = threading.Lock()
+        self._queue: Optional[DurableQueue] = None
+        self._queue_worker: Optional[QueueWorker] = None
+        self.receipts = ReceiptCache(RECEIPT_TTL_SECONDS, RECEIPT_CACHE_SIZE)
+
+    def validate(self, record: Dict[str, Any]) -> Tuple[bool, str]:
+        """Correct codes against the local code index, then validate the record."""
+        with telemetry.span("validate"):
+            correct_codes(record)
+            return validate_record(record)
+
+    def insert_rows_with_retry(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert rows into BigQuery, retrying transient failures within the deadline budget.
+
+        Returns the per-row errors reported by BigQuery. Invalid rows are skipped so
+        that one bad row does not fail the other callers sharing the same batch.
+        Every attempt sends the same insertIds, so BigQuery drops the rows of a
+        retry whose earlier attempt was written but timed out.
+        """
+        attempts = 0
+        # Rows queued before insert ids existed get theirs from their content
+        row_ids = [row.get(INSERT_ID_KEY) or insert_id(row) for row in rows]
+        rows = [{key: value for key, value in row.items() if key != INSERT_ID_KEY} for row in rows]
+
+        def insert():
+            nonlocal attempts
+            attempts += 1
+            client, table_ref = self.clients.get()
+            with telemetry.span("insert_rows_json"):
+                return client.insert_rows_json(table_ref, rows, row_ids=row_ids, skip_invalid_rows=True)
+
+        def on_error(error: Exception, attempt: int):
+            if is_auth_error(error):
+                self.clients.reset()
+
+        try:
+            errors = call_with_retry(insert, self.insert_retry_policy, on_error=on_error)
+        finally:
+            metrics.observe(BIGQUERY_RETRIES, attempts - 1)
+        if errors:
+            logger.error(f"Errors inserting into BigQuery: {errors}")
+        return errors
+
+    def prepare(self, record: Dict[str, Any], idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """The BigQuery row for a record, tagged with its deterministic insert id."""
+        row = to_bq_record(record)
+        row[INSERT_ID_KEY] = insert_id(row, idempotency_key)
+        return row
+
+    def write(self, records: List[Dict[str, Any]],
+              timeout: float = BATCH_WAIT_TIMEOUT_SECONDS) -> List[Optional[List[Dict[str, Any]]]]:
+        """Insert validated records through the shared batch writer; returns the errors per record."""
+        return self.write_rows([self.prepare(record) for record in records], timeout)
+
+    def write_rows(self, rows: List[Dict[str, Any]],
+                   timeout: float = BATCH_WAIT_TIMEOUT_SECONDS) -> List[Optional[List[Dict[str, Any]]]]:
+        """Insert rows from prepare() through the shared batch writer; returns the errors per row."""
+        with telemetry.span("insert"):
+            return self.batch_writer.write(rows, timeout=timeout)
+
+    def load(self, records: List[Dict[str, Any]], timeout: float = BATCH_WAIT_TIMEOUT_SECONDS,
+             idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """Append validated records with one BigQuery load job instead of streaming inserts.
+
+        Returns a receipt with the job id and the number of rows loaded. The job
+        loads every record or none, and raises if it fails. Its id is derived
+        from the key or the records (load_job_id), so a retry after a lost
+        response, or a resubmission, waits for the same job instead of loading
+        the rows again; within RECEIPT_TTL_SECONDS it gets the original receipt
+        with `"duplicate": true`.
+        """
+        with telemetry.span("load"):
+            bq_records = [to_bq_record(record) for record in records]
+            job_id = load_job_id(bq_records, idempotency_key)
+            receipt = self.receipts.get(job_id)
+            if receipt is not None:
+                receipt["duplicate"] = True
+                return receipt
+            table = records_to_table(bq_records)
+
+            def load_once():
+                client, table_ref = self.clients.get()
+                return load_table(client, table_ref, table, timeout=timeout, job_id=job_id)
+
+            receipt = {"status": "inserted", **call_with_retry(load_once, self.insert_retry_policy)}
+            self.receipts.put(job_id, receipt)
+            return receipt
+
+    def export(self, records: List[Dict[str, Any]], export_dir: str, export_format: str = "parquet") -> List[str]:
+        """Write records to date-partitioned Parquet or Arrow files under export_dir; returns the new files."""
+        with telemetry.span("export"):
+            return write_partitioned([to_bq_record(record) for record in records], export_dir, export_format)
+
+    @property
+    def async_enabled(self) -> bool:
+        """Whether records can be queued, i.e. a queue path was configured explicitly.
+
+        There is no default path: a queue on an instance's in-memory /tmp loses
+        accepted records when the instance is recycled.
+        """
+        return bool(self.queue_path)
+
+    def get_queue(self) -> DurableQueue:
+        """Open the durable insert queue and start its background worker on first use."""
+        if not self.async_enabled:
+            raise RuntimeError(ASYNC_UNAVAILABLE_MESSAGE)
+        with self._queue_lock:
+            if self._queue is None:
+                self._queue = DurableQueue(self.queue_path)
+                self._queue_worker = QueueWorker(
+                    self._queue,
+                    lambda rows: self.batch_writer.write(rows, timeout=BATCH_WAIT_TIMEOUT_SECONDS),
+                    self.queue_retry_policy.backoff,
+                    is_retryable_row_error)
+            self._queue_worker.start()
+            return self._queue
+
+    def resume(self) -> None:
+        """Resume draining records queued before a restart, if the queue file exists."""
+        if self.async_enabled and os.path.exists(self.queue_path):
+            self.get_queue()
+
+    def enqueue(self, records: List[Dict[str, Any]]) -> List[int]:
+        """Durably queue validated records for background insertion and return their queue ids."""
+        return self.enqueue_rows([self.prepare(record) for record in records])
+
+    def enqueue_rows(self, rows: List[Dict[str, Any]]) -> List[int]:
+        """Durably queue rows from prepare(); they keep their insert ids in the queue."""
+        queue = self.get_queue()
+        queue_ids = queue.enqueue(rows)
+        self._queue_worker.notify()
+        return queue_ids
+
+    def submit(self, record: Dict[str, Any], async_mode: bool = False,
+               idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+        """Validate and insert (or queue) one record and return an insert receipt."""
+        return self.submit_many([record], async_mode, [idempotency_key])[0]
+
+    def submit_many(self, records: List[Any], async_mode: bool = False,
+                    idempotency_keys: Optional[List[Optional[str]]] = None) -> List[Dict[str, Any]]:
+        """Validate and insert (or queue) records and return an insert receipt for each.
+
+        A receipt has a `status` (inserted, queued, invalid or error) and, for valid
+        records, the `insert_id`. A record already inserted or queued within
+        RECEIPT_TTL_SECONDS, by insert id, gets the original receipt with
+        `"duplicate": true` and is not sent again.
+        """
+        keys = idempotency_keys or [None] * len(records)
+        receipts: List[Dict[str, Any]] = []
+        pending: List[Tuple[int, Dict[str, Any]]] = []
+        for index, (record, key) in enumerate(zip(records, keys)):
+            if not isinstance(record, dict):
+                receipts.append({"status": "invalid", "error": "Invalid record: Record must be an object"})
+                continue
+            is_valid, error_message = self.validate(record)
+            if not is_valid:
+                receipts.append({"status": "invalid", "error": f"Invalid record: {error_message}"})
+                continue
+            row = self.prepare(record, key)
+            receipt = self.receipts.get(row[INSERT_ID_KEY])
+            if receipt is not None:
+                receipt["duplicate"] = True
+            else:
+                receipt = {"status": "pending", "insert_id": row[INSERT_ID_KEY]}
+                pending.append((index, row))
+            receipts.append(receipt)
+
+        # The same record twice in one call is written once
+        rows = list({row[INSERT_ID_KEY]: row for _, row in pending}.values())
+        if rows and async_mode:
+            results = {row[INSERT_ID_KEY]: {"status": "queued", "queue_id": queue_id}
+                       for row, queue_id in zip(rows, self.enqueue_rows(rows))}
+        elif rows:
+            results = {}
+            for row, errors in zip(rows, self.write_rows(rows)):
+                if errors:
+                    logger.error(f"Insertion failed: {errors}")
+                    results[row[INSERT_ID_KEY]] = {"status": "error", "error": "Failed to insert record into BigQuery",
+                                                   "details": errors}
+                else:
+                    results[row[INSERT_ID_KEY]] = {"status": "inserted"}
+        for index, row in pending:
+            receipts[index].update(results[row[INSERT_ID_KEY]])
+            self.receipts.put(row[INSERT_ID_KEY], receipts[index])
+        return receipts
+
+
+_shared_paths: Dict[Tuple[str, str, str], InsertPath] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_insert_path(project_id: str, dataset_id: str, table_id: str, queue_path: Optional[str]) -> InsertPath:
+    """Process-wide InsertPath for a table, so functions running in one process share its batches."""
+    key = (project_id, dataset_id, table_id)
+    with _shared_lock:
+        if key not in _shared_paths:
+            _shared_paths[key] = InsertPath(project_id, dataset_id, table_id, queue_path)
+        return _shared_paths[key]
@@ -0,0 +1,113 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+# JSON schema for BigQuery record
+RECORD_SCHEMA: Dict[str, Any] = {
+    "patient": {
+        "name": "",
+        "age": 0,
+        "sex": "",
+        "medical_record_number": ""
+    },
+    "procedure": {
+        "date": "",
+        "location": "",
+        "preoperative_diagnosis": "",
+        "postoperative_diagnosis": "",
+        "procedures_performed": [],
+        "surgeon": "",
+        "assistant_surgeon": "",
+        "anesthesiologist": "",
+        "estimated_blood_loss": "",
+        "fluids_administered": "",
+        "complications": "",
+        "disposition": ""
+    },
+    "coding": {
+        "snomed_ct": [],
+        "icd_10": [],
+        "cpt": []
+    }
+}
+
+# Fields that must be filled before a record is ready to insert, in the order they are prompted for
+REQUIRED_FIELDS: List[str] = [
+    "patient.name",
+    "patient.age",
+    "patient.sex",
+    "patient.medical_record_number",
+    "procedure.date",
+    "procedure.location",
+    "procedure.preoperative_diagnosis",
+    "procedure.postoperative_diagnosis",
+    "procedure.procedures_performed",
+    "procedure.surgeon",
+    "coding.cpt"
+]
+
+class FieldSpec:
+    """A required field with its dotted path split into keys once."""
+    __slots__ = ("path", "keys", "prompt")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.keys: Tuple[str, ...] = tuple(path.split('.'))
+        # Format the field name for better readability
+        formatted_field = path.replace('.', ' ').replace('_', ' ').title()
+        self.prompt = f"Please provide the {formatted_field}:"
+
+    def get(self, record: Dict[str, Any]) -> Any:
+        value: Any = record
+        for key in self.keys:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        return value
+
+class CompiledSchema:
+    """Required-field accessors built once from RECORD_SCHEMA."""
+
+    def __init__(self, schema: Dict[str, Any], required_fields: List[str]):
+        self.fields: Tuple[FieldSpec, ...] = tuple(FieldSpec(path) for path in required_fields)
+        for spec in self.fields:
+            section = schema.get(spec.keys[0])
+            if len(spec.keys) != 2 or not isinstance(section, dict) or spec.keys[1] not in section:
+                raise ValueError(f"Required field {spec.path} is not in the record schema")
+        self.required_fields: List[str] = [spec.path for spec in self.fields]
+        self.specs: Dict[str, FieldSpec] = {spec.path: spec for spec in self.fields}
+
+    def missing_fields(self, record: Dict[str, Any]) -> List[str]:
+        """Return every required field that is empty, in prompt order."""
+        missing = []
+        for spec in self.fields:
+            section = record.get(spec.keys[0])
+            if not (isinstance(section, dict) and section.get(spec.keys[1])):
+                missing.append(spec.path)
+        return missing
+
+    def is_complete(self, record: Dict[str, Any]) -> bool:
+        return not self.missing_fields(record)
+
+    def prompt_for(self, field: str) -> Dict[str, str]:
+        return {"field": field, "prompt": self.specs[field].prompt}
+
+COMPILED_SCHEMA = CompiledSchema(RECORD_SCHEMA, REQUIRED_FIELDS)
+
+class PromptGenerator:
+    def __init__(self, schema: CompiledSchema = COMPILED_SCHEMA):
+        self.schema = schema
+        self.required_fields = schema.required_fields
+
+    def missing_fields(self, current_record: Dict[str, Any]) -> List[str]:
+        return self.schema.missing_fields(current_record)
+
+    def get_next_prompt(self, current_record: Dict[str, Any],
+                        missing_fields: Optional[List[str]] = None) -> Optional[Dict[str, str]]:
+        """Prompt for the first missing field; pass missing_fields to reuse an earlier check."""
+        if missing_fields is None:
+            missing_fields = self.schema.missing_fields(current_record)
+        if not missing_fields:
+            return None
+        return self.schema.prompt_for(missing_fields[0])
+
+    def is_field_complete(self, record: Dict[str, Any], field: str) -> bool:
+        return bool(self.schema.specs[field].get(record))
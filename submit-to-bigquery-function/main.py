@@ -1,10 +1,14 @@
 import functions_framework
 from flask import jsonify
-from google.cloud import bigquery
-import json
 import logging
-import time
-from typing import Dict, Any, List, Tuple
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from medical_records import telemetry
+from medical_records.columnar_export import EXPORT_FORMATS
+from medical_records.export_buffer import ExportBuffer
+from medical_records.insert_path import ASYNC_UNAVAILABLE_MESSAGE, shared_insert_path
+from medical_records.warmup import start_warm_up
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,9 +18,28 @@ logger = logging.getLogger(__name__)
 PROJECT_ID = "<redacted>"
 DATASET_ID = "health"
 TABLE_ID = "usu_procedures"
-MAX_CPT_CODES = 10
+MAX_BULK_RECORDS = 500
+MAX_IDEMPOTENCY_KEY_LENGTH = 256
+# Bulk requests with "loadJob": true (backfills) use one BigQuery load job and may be larger
+MAX_LOAD_RECORDS = 5000
+# When set, accepted bulk records are also written to date-partitioned Parquet/Arrow files here,
+# in the background and in batches of up to EXPORT_BATCH_ROWS records or every EXPORT_FLUSH_SECONDS
+EXPORT_DIR = os.environ.get("EXPORT_DIR")
+EXPORT_FORMAT = os.environ.get("EXPORT_FORMAT", "parquet")
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "1000"))
+EXPORT_FLUSH_SECONDS = float(os.environ.get("EXPORT_FLUSH_SECONDS", "60"))
+# Local SQLite file backing the 202 Accepted mode; must be on persistent disk to survive restarts.
+# Unset (the default), async submission is disabled.
+INSERT_QUEUE_PATH = os.environ.get("INSERT_QUEUE_PATH")
+
+# Process-wide BigQuery client, batch writer and durable queue, shared across requests
+# and request threads; each locks its own state (BIGQUERY_POOL_SIZE sizes the HTTP pool)
+insert_path = shared_insert_path(PROJECT_ID, DATASET_ID, TABLE_ID, INSERT_QUEUE_PATH)
+export_buffer = ExportBuffer(lambda records: insert_path.export(records, EXPORT_DIR, EXPORT_FORMAT),
+                             EXPORT_BATCH_ROWS, EXPORT_FLUSH_SECONDS) if EXPORT_DIR else None
 
 @functions_framework.http
+@telemetry.instrument_handler("submit_to_bigquery")
 def submit_to_bigquery(request):
     """HTTP Cloud Function for submitting a medical record to BigQuery."""
     # Handle CORS preflight request
@@ -24,7 +47,7 @@ def submit_to_bigquery(request):
         headers = {
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Methods': 'POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Allow-Headers': 'Content-Type, Prefer, Idempotency-Key',
             'Access-Control-Max-Age': '3600'
         }
         return ('', 204, headers)
@@ -34,109 +57,141 @@ def submit_to_bigquery(request):
         'Access-Control-Allow-Origin': '*'
     }
 
+    # Health check, also used to rebuild the client after credentials rotate
+    if request.method == 'GET':
+        if insert_path.clients.check_health():
+            return jsonify({"status": "ok"}), 200, headers
+        return jsonify({"status": "unavailable"}), 503, headers
+
     # Parse request data
     request_json = request.get_json(silent=True)
     if not request_json:
         return jsonify({"error": "No JSON data provided"}), 400, headers
 
+    # Accept now and insert in the background when asked to (Prefer: respond-async). Without an
+    # explicit INSERT_QUEUE_PATH there is no durable queue: "async" is refused rather than risk
+    # losing accepted records, and the Prefer header, being only a preference, is ignored.
+    if request_json.get('async') is True and not insert_path.async_enabled:
+        return jsonify({"error": ASYNC_UNAVAILABLE_MESSAGE}), 501, headers
+    async_mode = insert_path.async_enabled and (
+        request_json.get('async') is True or 'respond-async' in request.headers.get('Prefer', ''))
+
+    # Retries and resubmissions of the same record, or with the same key, map to the same row
+    key = request.headers.get('Idempotency-Key') or request_json.get('idempotencyKey')
+    if key is not None and (not isinstance(key, str) or not 0 < len(key) <= MAX_IDEMPOTENCY_KEY_LENGTH):
+        return jsonify({"error": f"idempotencyKey must be a string of 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters"}), 400, headers
+
+    # Bulk mode: {"records": [...]} returns a result per record
+    if 'records' in request_json:
+        return submit_records(request_json.get('records'), headers, async_mode, request_json.get('loadJob') is True, key)
+
     record = request_json.get('record')
     if not record:
         return jsonify({"error": "No record provided"}), 400, headers
 
-    # Validate the record
-    is_valid, error_message = validate_record(record)
-    if not is_valid:
-        return jsonify({"error": f"Invalid record: {error_message}"}), 400, headers
-
-    # Insert the record into BigQuery
-    success = insert_into_bigquery_with_retry(record)
-    if success:
-        return jsonify({"message": "Record successfully inserted into BigQuery"}), 200, headers
+    # Validate and insert (or queue) the record; a duplicate gets the original receipt
+    receipt = insert_path.submit(record, async_mode, key)
+    body = {field: receipt[field] for field in ("insert_id", "queue_id", "duplicate") if field in receipt}
+    if receipt["status"] == "invalid":
+        return jsonify({"error": receipt["error"]}), 400, headers
+    if receipt["status"] == "queued":
+        return jsonify({"message": "Record accepted for insertion into BigQuery", **body}), 202, headers
+    if receipt["status"] == "inserted":
+        return jsonify({"message": "Record successfully inserted into BigQuery", **body}), 200, headers
+    return jsonify({"error": "Failed to insert record into BigQuery", **body}), 500, headers
+
+def submit_records(records: Any, headers: Dict[str, str], async_mode: bool = False, load_job: bool = False,
+                   key: Optional[str] = None):
+    """Validate and insert a list of records, reporting errors per record.
+
+    With `load_job`, the valid records are appended by one BigQuery load job
+    instead of streaming inserts, so they are all inserted or all fail. With an
+    idempotency `key`, record i is inserted under the key "<key>:<i>".
+    """
+    if not isinstance(records, list) or not records:
+        return jsonify({"error": "No records provided"}), 400, headers
+    max_records = MAX_LOAD_RECORDS if load_job else MAX_BULK_RECORDS
+    if len(records) > max_records:
+        return jsonify({"error": f"Number of records exceeds the maximum limit of {max_records}"}), 400, headers
+    if load_job and async_mode:
+        return jsonify({"error": "loadJob cannot be combined with async submission"}), 400, headers
+
+    load: Dict[str, Any] = {}
+    if load_job:
+        results, load = load_records(records, key)
     else:
-        return jsonify({"error": "Failed to insert record into BigQuery"}), 500, headers
-
-def validate_record(record: Dict[str, Any]) -> Tuple[bool, str]:
-    """Validate the structure and content of the record."""
-    required_sections = ["patient", "procedure", "coding"]
-    for section in required_sections:
-        if section not in record:
-            return False, f"Missing required section: {section}"
-
-    # Validate patient section
-    patient = record.get("patient", {})
-    required_patient_fields = ["name", "age", "sex", "medical_record_number"]
-    for field in required_patient_fields:
-        if not patient.get(field):
-            return False, f"Missing required patient field: {field}"
-
-    # Validate procedure section
-    procedure = record.get("procedure", {})
-    required_procedure_fields = ["date", "location", "procedures_performed"]
-    for field in required_procedure_fields:
-        if not procedure.get(field):
-            return False, f"Missing required procedure field: {field}"
-
-    # Validate coding section
-    coding = record.get("coding", {})
-    if not coding.get("cpt"):
-        return False, "Missing CPT codes in coding section"
-
-    # Validate CPT codes
-    is_valid, error_message = validate_cpt_codes(coding.get("cpt", []))
-    if not is_valid:
-        return False, f"Invalid CPT codes: {error_message}"
-
-    return True, ""
-
-def validate_cpt_codes(cpt_codes: List[Dict[str, str]]) -> Tuple[bool, str]:
-    """Validate CPT codes."""
-    if not isinstance(cpt_codes, list):
-        return False, "CPT codes must be a list"
-    if len(cpt_codes) > MAX_CPT_CODES:
-        return False, f"Number of CPT codes exceeds the maximum limit of {MAX_CPT_CODES}"
-    for code in cpt_codes:
-        if not isinstance(code, dict) or 'code' not in code or 'description' not in code:
-            return False, "Each CPT code must be a dictionary with 'code' and 'description' fields"
-    return True, ""
-
-def insert_into_bigquery_with_retry(record: Dict[str, Any], max_retries: int = 3) -> bool:
-    """Insert the record into BigQuery with retry mechanism."""
-    client = bigquery.Client()
-    table_ref = client.dataset(DATASET_ID, project=PROJECT_ID).table(TABLE_ID)
-    
-    for attempt in range(max_retries):
+        keys = [f"{key}:{index}" for index in range(len(records))] if key else None
+        receipts = insert_path.submit_many(records, async_mode, keys)
+        results = [{"index": index, **receipt} for index, receipt in enumerate(receipts)]
+
+    queued = sum(1 for result in results if result["status"] == "queued")
+    if queued:
+        body = {"queued": queued, "failed": len(results) - queued, "results": results}
+        return jsonify(body), 202 if queued == len(results) else 207, headers
+
+    # Duplicates were exported when they were first inserted
+    new_records = [records[result["index"]] for result in results
+                   if result["status"] == "inserted" and not result.get("duplicate")]
+    if export_buffer is not None:
+        export_buffer.add(new_records)
+
+    inserted = sum(1 for result in results if result["status"] == "inserted")
+    body = {"inserted": inserted, "failed": len(results) - inserted, "results": results}
+    if load:
+        body["load_job_id"] = load["job_id"]
+    if inserted == len(results):
+        return jsonify(body), 200, headers
+    if inserted == 0:
+        status = 400 if all(result["status"] == "invalid" for result in results) else 500
+        return jsonify(body), status, headers
+    return jsonify(body), 207, headers
+
+def load_records(records: List[Any], key: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Validate records and append the valid ones with one load job; returns per-record results and the job.
+
+    The job id comes from the idempotency `key` or the records, so a repeated
+    request does not load them again: its records are marked as duplicates.
+    """
+    results: List[Dict[str, Any]] = []
+    valid_indexes: List[int] = []
+    for index, record in enumerate(records):
+        if isinstance(record, dict):
+            is_valid, error_message = insert_path.validate(record)
+        else:
+            is_valid, error_message = False, "Record must be an object"
+        if is_valid:
+            valid_indexes.append(index)
+            results.append({"index": index, "status": "pending"})
+        else:
+            results.append({"index": index, "status": "invalid", "error": f"Invalid record: {error_message}"})
+
+    load: Dict[str, Any] = {}
+    if valid_indexes:
         try:
-            # Convert the record to match BigQuery schema
-            bq_record = {
-                "patient": record.get("patient", {}),
-                "procedure": {
-                    **record.get("procedure", {}),
-                    "date": record.get("procedure", {}).get("date"),  # Keep as string
-                    "procedures_performed": record.get("procedure", {}).get("procedures_performed", [])
-                },
-                "coding": {
-                    "snomed_ct": record.get("coding", {}).get("snomed_ct", []),
-                    "icd_10": record.get("coding", {}).get("icd_10", []),
-                    "cpt": record.get("coding", {}).get("cpt", [])
-                }
-            }
-            
-            # Serialize the record to JSON
-            json_record = json.dumps(bq_record)
-            bq_record = json.loads(json_record)  # Deserialize to ensure it's valid JSON
-
-            errors = client.insert_rows_json(table_ref, [bq_record])
-            if errors:
-                logger.error(f"Errors inserting into BigQuery: {errors}")
-                raise Exception(f"BigQuery insertion error: {errors}")
-            return True
+            load = insert_path.load([records[i] for i in valid_indexes], idempotency_key=key)
         except Exception as e:
-            logger.error(f"Attempt {attempt + 1} failed: {str(e)}")
-            if attempt == max_retries - 1:
-                logger.error("Max retries reached. Insertion failed.")
-                return False
-            time.sleep(2 ** attempt)  # Exponential backoff
-    return False
+            logger.error(f"Load job failed: {str(e)}")
+    for index in valid_indexes:
+        if load:
+            results[index]["status"] = "inserted"
+            if load.get("duplicate"):
+                results[index]["duplicate"] = True
+        else:
+            results[index] = {"index": index, "status": "error", "error": "Failed to load records into BigQuery"}
+    return results, load
+
+def warm_up() -> None:
+    """Import the BigQuery SDK and create the client that the first insert would otherwise create."""
+    insert_path.clients.get()
+
+if EXPORT_FORMAT not in EXPORT_FORMATS:
+    raise ValueError(f"EXPORT_FORMAT must be one of {', '.join(EXPORT_FORMATS)}")
+
+# Resume draining records queued before a restart
+insert_path.resume()
+
+# Optional warm-up at instance start (WARM_UP: off, background or blocking)
+start_warm_up(warm_up)
 
 if __name__ == "__main__":
     # This is used when running locally only. When deploying to Google Cloud Functions,
@@ -144,8 +199,12 @@ if __name__ == "__main__":
     from flask import Flask, request
     app = Flask(__name__)
 
-    @app.route('/', methods=['POST'])
+    @app.route('/', methods=['GET', 'POST'])
     def local_submit_to_bigquery():
         return submit_to_bigquery(request)
 
+    @app.route('/metrics', methods=['GET'])
+    def local_metrics():
+        return telemetry.metrics_response(request)
+
     app.run(host='localhost', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,84 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Rows carry their insert id under this key through the batch writer and the durable
+# queue; insert_rows_with_retry strips it and sends it to BigQuery as the row's insertId.
+INSERT_ID_KEY = "__insert_id"
+
+DEFAULT_RECEIPT_TTL_SECONDS = 600
+DEFAULT_MAX_RECEIPTS = 10000
+# Receipts worth replaying: the record is in BigQuery or durably queued for it
+CACHEABLE_STATUSES = ("inserted", "queued")
+
+
+def insert_id(bq_record: Dict[str, Any], idempotency_key: Optional[str] = None) -> str:
+    """Deterministic BigQuery insertId for a row.
+
+    With a client idempotency key, the id depends on the key alone, so every
+    retry of that request maps to the same row. Otherwise it is a hash of the
+    MRN, the procedure date and the row's content, so a resubmitted identical
+    record gets the same id. The id is a hex digest, so no PHI is sent in it.
+    """
+    if idempotency_key:
+        material: Any = ["key", str(idempotency_key)]
+    else:
+        row = {key: value for key, value in bq_record.items() if key != INSERT_ID_KEY}
+        material = [(row.get("patient") or {}).get("medical_record_number"), (row.get("procedure") or {}).get("date"),
+                    hashlib.sha256(json.dumps(row, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()]
+    return hashlib.sha256(json.dumps(material, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def load_job_id(bq_records: List[Dict[str, Any]], idempotency_key: Optional[str] = None) -> str:
+    """Deterministic BigQuery job id for loading rows, from the key or else from the rows' insert ids.
+
+    BigQuery refuses a second job with the same id, so a retried or resubmitted
+    load cannot append the same rows twice.
+    """
+    if idempotency_key:
+        material: Any = ["load", str(idempotency_key)]
+    else:
+        material = ["load", [row.get(INSERT_ID_KEY) or insert_id(row) for row in bq_records]]
+    return "records_load_" + hashlib.sha256(json.dumps(material, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class ReceiptCache:
+    """Short-lived, process-wide map of insert id -> receipt of a successful submission.
+
+    A duplicate submission (a retry after a timeout, or a user submitting the same
+    record again) is answered from here without a BigQuery call. BigQuery's own
+    insertId de-duplication is best effort and short, so this also covers the
+    duplicates it would miss within the TTL on this instance.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_RECEIPT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_RECEIPTS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, receipt = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(receipt)
+
+    def put(self, key: str, receipt: Dict[str, Any]) -> None:
+        """Remember a receipt if its status is worth replaying."""
+        if self.max_entries <= 0 or receipt.get("status") not in CACHEABLE_STATUSES:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, copy.deepcopy(receipt))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
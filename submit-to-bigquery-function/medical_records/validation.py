@@ -0,0 +1,74 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+from medical_records.code_index import CODE_SYSTEMS, CodeIndexSet, default_code_indexes
+from medical_records.record_schema import COMPILED_SCHEMA, RECORD_SCHEMA
+
+MAX_CPT_CODES = 10
+
+def correct_codes(record: Dict[str, Any], code_indexes: Optional[CodeIndexSet] = None) -> Dict[str, Any]:
+    """Give codes found in the local code index their canonical code and description.
+
+    With CODE_VALIDATION=correct, near misses are substituted and flagged for
+    review, and validate_record rejects the record until the flag is cleared.
+    """
+    code_indexes = code_indexes or default_code_indexes()
+    coding = record.get("coding")
+    if not isinstance(coding, dict):
+        return record
+    for code_system in CODE_SYSTEMS:
+        codes = coding.get(code_system)
+        if isinstance(codes, list):
+            accepted, rejected = code_indexes.review(code_system, codes)
+            # Rejected entries stay in place so validate_record can report them
+            coding[code_system] = accepted + rejected
+    return record
+
+def validate_record(record: Dict[str, Any], code_indexes: Optional[CodeIndexSet] = None) -> Tuple[bool, str]:
+    """Validate the structure and content of the record."""
+    for section in RECORD_SCHEMA:
+        if section not in record:
+            return False, f"Missing required section: {section}"
+
+    # The same required fields the dictation function prompts for before ready_to_insert
+    missing = COMPILED_SCHEMA.missing_fields(record)
+    if missing:
+        section, field = missing[0].split('.', 1)
+        return False, f"Missing required {section} field: {field}"
+
+    # Validate coding section
+    coding = record.get("coding", {})
+
+    # Validate CPT codes
+    is_valid, error_message = validate_cpt_codes(coding.get("cpt", []))
+    if not is_valid:
+        return False, f"Invalid CPT codes: {error_message}"
+
+    # Substituted codes are inserted only once someone has confirmed them
+    for code_system in CODE_SYSTEMS:
+        codes = coding.get(code_system)
+        for entry in codes if isinstance(codes, list) else []:
+            if isinstance(entry, dict) and entry.get("needs_review"):
+                return False, (f"{code_system} code {entry.get('original_code')} was corrected to "
+                               f"{entry.get('code')} and needs review")
+
+    # Reject codes missing from the local code index when CODE_VALIDATION is "enforce"
+    code_indexes = code_indexes or default_code_indexes()
+    if code_indexes.mode == "enforce":
+        for code_system in CODE_SYSTEMS:
+            codes = coding.get(code_system) or []
+            unknown = code_indexes.unknown_codes(code_system, codes if isinstance(codes, list) else [])
+            if unknown:
+                return False, f"Unknown {code_system} codes: {', '.join(unknown)}"
+
+    return True, ""
+
+def validate_cpt_codes(cpt_codes: List[Dict[str, str]]) -> Tuple[bool, str]:
+    """Validate CPT codes."""
+    if not isinstance(cpt_codes, list):
+        return False, "CPT codes must be a list"
+    if len(cpt_codes) > MAX_CPT_CODES:
+        return False, f"Number of CPT codes exceeds the maximum limit of {MAX_CPT_CODES}"
+    for code in cpt_codes:
+        if not isinstance(code, dict) or 'code' not in code or 'description' not in code:
+            return False, "Each CPT code must be a dictionary with 'code' and 'description' fields"
+    return True, ""
@@ -0,0 +1,151 @@
+import importlib.util
+import os
+import sys
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTION_DIRS = ["generate-field-report-function", "medical-dictation-function", "submit-to-bigquery-function"]
+
+# Function modules (single_flight, report_pool, ...) import as they do when deployed. The shared
+# package comes first, so medical_records is always the canonical copy under shared/.
+for directory in reversed(FUNCTION_DIRS):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+
+
+@pytest.fixture
+def load_function(monkeypatch, tmp_path):
+    """Import a function's main.py under a fresh module name, with the environment it is given.
+
+    The insert queue goes to a temporary file unless INSERT_QUEUE_PATH=None is
+    passed (None unsets a variable). Each module gets its own InsertPath, and
+    is removed from sys.modules again after the test.
+    """
+    from medical_records import insert_path
+    loaded = []
+
+    def load(directory: str, **environ: Optional[str]):
+        monkeypatch.setattr(insert_path, "_shared_paths", {})
+        environ = {"INSERT_QUEUE_PATH": str(tmp_path / "queue.db"), **environ}
+        for name, value in environ.items():
+            if value is None:
+                monkeypatch.delenv(name, raising=False)
+            else:
+                monkeypatch.setenv(name, value)
+        module_name = f"test_{directory.replace('-', '_')}_main_{len(loaded)}"
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, directory, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        loaded.append(module_name)
+        spec.loader.exec_module(module)
+        return module
+
+    yield load
+    for module_name in loaded:
+        sys.modules.pop(module_name, None)
+
+
+@pytest.fixture
+def call_handler():
+    """Call an HTTP function like functions-framework does; returns the Flask response."""
+    from flask import Flask, request
+    app = Flask("tests")
+
+    def call(handler, method: str = "POST", json: Any = None, headers: Optional[Dict[str, str]] = None,
+             remote_addr: str = "127.0.0.1"):
+        with app.test_request_context("/", method=method, json=json, headers=headers or {},
+                                      environ_base={"REMOTE_ADDR": remote_addr}):
+            return app.make_response(handler(request))
+
+    return call
+
+
+class FakeServiceUnavailable(Exception):
+    """Like google.api_core.exceptions.ServiceUnavailable."""
+    code = 503
+
+
+class FakeConflict(Exception):
+    """Like google.api_core.exceptions.Conflict, raised for a job id that is already taken."""
+    code = 409
+
+
+class FakeLoadJob:
+    def __init__(self, job_id: str, output_rows: int):
+        self.job_id = job_id
+        self.output_rows = output_rows
+
+    def result(self, timeout: Optional[float] = None) -> "FakeLoadJob":
+        return self
+
+
+class FakeBigQueryClient:
+    """Stands in for google.cloud.bigquery.Client, for streaming inserts and load jobs.
+
+    Like BigQuery, it drops streamed rows whose insertId it has already seen
+    and refuses a second job with the same id. The next `fail_after_write`
+    calls store their rows and then raise, as when the response to a
+    successful write is lost.
+    """
+
+    def __init__(self, fail_after_write: int = 0):
+        self.fail_after_write = fail_after_write
+        self.lock = threading.Lock()
+        self.rows: List[Dict[str, Any]] = []
+        self.row_ids: List[str] = []
+        self.jobs: Dict[str, FakeLoadJob] = {}
+        self.calls = 0
+
+    def dataset(self, dataset_id: str, project: Optional[str] = None):
+        return SimpleNamespace(table=lambda table_id: f"{project}.{dataset_id}.{table_id}")
+
+    def insert_rows_json(self, table_ref: Any, rows: List[Dict[str, Any]], row_ids: List[str], **kwargs):
+        with self.lock:
+            self.calls += 1
+            for row, row_id in zip(rows, row_ids):
+                if row_id not in self.row_ids:
+                    self.rows.append(row)
+                    self.row_ids.append(row_id)
+            self._maybe_fail()
+        return []
+
+    def load_table_from_file(self, file: Any, table_ref: Any, job_id: Optional[str] = None, **kwargs) -> FakeLoadJob:
+        import pyarrow.parquet as pq
+        with self.lock:
+            self.calls += 1
+            job_id = job_id or f"job_{len(self.jobs)}"
+            if job_id in self.jobs:
+                raise FakeConflict(f"Already Exists: Job {job_id}")
+            rows = pq.read_table(file).to_pylist()
+            self.rows.extend(rows)
+            self.jobs[job_id] = FakeLoadJob(job_id, len(rows))
+            self._maybe_fail()
+            return self.jobs[job_id]
+
+    def get_job(self, job_id: str) -> FakeLoadJob:
+        return self.jobs[job_id]
+
+    def _maybe_fail(self) -> None:
+        if self.fail_after_write > 0:
+            self.fail_after_write -= 1
+            raise FakeServiceUnavailable("503 Service Unavailable after the write succeeded")
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def fake_bigquery():
+    """Point an InsertPath at a FakeBigQueryClient; returns the client."""
+    from medical_records.bigquery_client import BigQueryClientCache
+
+    def install(insert_path, client: Optional[FakeBigQueryClient] = None) -> FakeBigQueryClient:
+        client = client or FakeBigQueryClient()
+        insert_path.clients = BigQueryClientCache("test-project", "test_dataset", "test_table", factory=lambda: client)
+        return client
+
+    return install
@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+
+from medical_records.batch_writer import BatchWriter
+
+
+class FakeInsertRowsJson:
+    """Records each insert_rows_json call; `fail` maps a row's "id" to the errors BigQuery reports for it."""
+
+    def __init__(self, fail=None):
+        self.fail = fail or {}
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, rows):
+        with self.lock:
+            self.batches.append([row["id"] for row in rows])
+        return [{"index": index, "errors": self.fail[row["id"]]} for index, row in enumerate(rows) if row["id"] in self.fail]
+
+
+def rows(*ids):
+    return [{"id": row_id, "payload": "x" * 20} for row_id in ids]
+
+
+def test_flushes_when_the_row_limit_is_reached():
+    insert = FakeInsertRowsJson()
+    writer = BatchWriter(insert, max_rows=3, max_age=60)
+
+    first = writer.submit(rows("a", "b"))
+    assert insert.batches == []
+    second = writer.submit(rows("c", "d"))
+
+    assert insert.batches == [["a", "b", "c"]]
+    assert all(item.ok for item in first + second[:1])
+    assert not second[1].done.is_set()
+
+
+def test_flushes_before_the_byte_limit_is_exceeded():
+    insert = FakeInsertRowsJson()
+    row_bytes = len(json.dumps(rows("a")[0]))
+    writer = BatchWriter(insert, max_rows=100, max_bytes=2 * row_bytes + 1, max_age=60)
+
+    writer.submit(rows("a", "b", "c", "d", "e"))
+    writer.flush()
+
+    assert insert.batches == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_flushes_when_the_oldest_row_reaches_the_age_limit():
+    insert = FakeInsertRowsJson()
+    writer = BatchWriter(insert, max_rows=100, max_age=0.05)
+
+    start = time.monotonic()
+    pending = writer.submit(rows("a"))
+    assert insert.batches == []
+    assert writer.wait(pending, timeout=5)
+
+    assert time.monotonic() - start >= 0.05
+    assert insert.batches == [["a"]]
+    assert pending[0].ok
+
+
+def test_insert_errors_go_back_to_the_caller_that_submitted_the_row():
+    error = [{"reason": "invalid", "message": "no such field"}]
+    insert = FakeInsertRowsJson(fail={"b2": error})
+    writer = BatchWriter(insert, max_rows=100, max_age=0.2)
+    results = {}
+    barrier = threading.Barrier(2)
+
+    def caller(name, ids):
+        barrier.wait()
+        results[name] = writer.write(rows(*ids), timeout=5)
+
+    threads = [threading.Thread(target=caller, args=("a", ["a1", "a2"])),
+               threading.Thread(target=caller, args=("b", ["b1", "b2", "b3"]))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Both callers shared one multi-row insert
+    assert len(insert.batches) == 1 and sorted(insert.batches[0]) == ["a1", "a2", "b1", "b2", "b3"]
+    assert results["a"] == [None, None]
+    assert results["b"] == [None, error, None]
+
+
+def test_a_failed_insert_fails_every_row_in_the_batch():
+    def insert(rows):
+        raise ConnectionError("connection reset")
+
+    writer = BatchWriter(insert, max_rows=2, max_age=60)
+    pending = writer.submit(rows("a", "b"))
+
+    assert [item.errors[0]["reason"] for item in pending] == ["insertFailed", "insertFailed"]
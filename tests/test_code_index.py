@@ -0,0 +1,83 @@
+import shutil
+
+import pytest
+
+from medical_records.code_index import BUNDLED_CODE_DIR, CodeIndexSet
+from medical_records.validation import correct_codes, validate_record
+from test_record_schema import FULL_RECORD
+
+# A subsequent-encounter code missing from the sample, described like the initial encounter next to it
+NEAR_MISS = {"code": "S27.0XXD", "description": "Traumatic pneumothorax, initial encounter"}
+
+
+@pytest.fixture
+def full_table(tmp_path):
+    """A copy of the bundled codes, standing in for a full code table in CODE_INDEX_DIR."""
+    directory = tmp_path / "codes"
+    shutil.copytree(BUNDLED_CODE_DIR, directory)
+    return str(directory)
+
+
+def test_fill_adds_descriptions_to_exact_matches_only():
+    indexes = CodeIndexSet(mode="fill")
+
+    accepted, rejected = indexes.review("icd_10", [{"code": "s27.0xxa", "description": "pneumothorax"}, NEAR_MISS])
+
+    assert accepted == [{"code": "S27.0XXA", "description": "Traumatic pneumothorax, initial encounter"}, NEAR_MISS]
+    assert rejected == []
+
+
+def test_fill_never_substitutes_a_neighbouring_code():
+    entry = {"code": "27893", "description": "Decompression fasciotomy, leg, any compartment, with debridement"}
+
+    assert CodeIndexSet(mode="fill").review("cpt", [entry]) == ([entry], [])
+
+
+def test_correct_needs_a_full_code_table():
+    with pytest.raises(ValueError):
+        CodeIndexSet(mode="correct")
+
+
+def test_correct_keeps_the_original_code_and_flags_the_substitution(full_table):
+    accepted, _ = CodeIndexSet(full_table, mode="correct").review("icd_10", [NEAR_MISS])
+
+    assert accepted == [{"code": "S27.0XXA", "description": "Traumatic pneumothorax, initial encounter",
+                         "original_code": "S27.0XXD", "needs_review": True}]
+
+
+def test_a_flagged_code_blocks_validation_until_it_is_confirmed(full_table):
+    indexes = CodeIndexSet(full_table, mode="correct")
+    record = {**FULL_RECORD, "coding": {**FULL_RECORD["coding"], "icd_10": [dict(NEAR_MISS)]}}
+
+    record = correct_codes(record, indexes)
+    assert validate_record(record, indexes) == (
+        False, "icd_10 code S27.0XXD was corrected to S27.0XXA and needs review")
+
+    record["coding"]["icd_10"] = [{"code": "S27.0XXA", "description": ""}]
+    assert validate_record(correct_codes(record, indexes), indexes) == (True, "")
+
+
+def test_enforce_rejects_unknown_codes_without_substituting():
+    accepted, rejected = CodeIndexSet(mode="enforce").review("icd_10", [NEAR_MISS])
+
+    assert (accepted, rejected) == ([], [NEAR_MISS])
+
+
+def test_lookup_by_code_ignores_case_and_punctuation():
+    icd_10 = CodeIndexSet().get("icd_10")
+
+    assert icd_10.get("s27.0xxa") == icd_10.get("S270XXA") \
+        == {"code": "S27.0XXA", "description": "Traumatic pneumothorax, initial encounter"}
+    assert icd_10.get("S27.0XXD") is None
+    assert CodeIndexSet().get("loinc") is None
+
+
+def test_search_by_description_ranks_the_closest_description_first():
+    cpt = CodeIndexSet().get("cpt")
+
+    results = cpt.search("fasciotomy of the leg, anterior and lateral compartments")
+
+    assert results[0][1]["code"] == "27892"
+    scores = [score for score, _ in results]
+    assert scores == sorted(scores, reverse=True) and 0 < scores[0] <= 1
+    assert cpt.search("") == []
@@ -0,0 +1,18 @@
+import copy
+
+import pytest
+
+from medical_records import columnar_export
+from test_record_schema import FULL_RECORD
+
+
+@pytest.mark.parametrize("age, expected", [(28, 28), ("28", 28), ("twenty-eight", None), ("", None), (None, None)])
+def test_an_age_that_is_not_a_number_is_exported_as_null(age, expected):
+    pytest.importorskip("pyarrow")
+    record = copy.deepcopy(FULL_RECORD)
+    record["patient"]["age"] = age
+
+    table = columnar_export.records_to_table([record, FULL_RECORD])
+
+    ages = [row["age"] for row in table.column("patient").to_pylist()]
+    assert ages == [expected, 28]
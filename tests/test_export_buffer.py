@@ -0,0 +1,60 @@
+import threading
+
+from medical_records.export_buffer import ExportBuffer
+
+
+class Batches:
+    """Collects the batches written, signalling each one."""
+
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def write(self, records):
+        self.batches.append(list(records))
+        self.written.set()
+
+
+def test_records_are_written_in_one_batch_once_the_buffer_is_full():
+    batches = Batches()
+    buffer = ExportBuffer(batches.write, max_rows=3, max_age=60)
+
+    buffer.add([{"n": 1}, {"n": 2}])
+    assert not batches.written.wait(0.1)
+    buffer.add([{"n": 3}])
+
+    assert batches.written.wait(5)
+    assert batches.batches == [[{"n": 1}, {"n": 2}, {"n": 3}]]
+    buffer.stop(timeout=5)
+
+
+def test_a_partial_batch_is_written_once_its_oldest_record_is_old_enough():
+    batches = Batches()
+    buffer = ExportBuffer(batches.write, max_rows=100, max_age=0.05)
+
+    buffer.add([{"n": 1}])
+    buffer.add([{"n": 2}])
+
+    assert batches.written.wait(5)
+    assert batches.batches == [[{"n": 1}, {"n": 2}]]
+    buffer.stop(timeout=5)
+
+
+def test_a_failed_write_does_not_stop_later_batches():
+    batches = Batches()
+    failed = threading.Event()
+
+    def write(records):
+        if not failed.is_set():
+            failed.set()
+            raise OSError("disk full")
+        batches.write(records)
+
+    buffer = ExportBuffer(write, max_rows=1, max_age=60)
+    buffer.add([{"n": 1}])
+    assert failed.wait(5)
+    buffer.add([{"n": 2}])
+
+    assert batches.written.wait(5)
+    assert batches.batches == [[{"n": 2}]]
+    buffer.stop(timeout=5)
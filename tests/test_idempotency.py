@@ -0,0 +1,142 @@
+import copy
+import time
+
+import pytest
+
+from conftest import FakeBigQueryClient
+from medical_records import columnar_export
+from medical_records.insert_path import InsertPath
+from medical_records.retry import RetryPolicy
+from test_record_schema import FULL_RECORD
+
+
+def make_records(count):
+    records = []
+    for index in range(count):
+        record = copy.deepcopy(FULL_RECORD)
+        record["patient"]["medical_record_number"] = f"{index:010d}"
+        records.append(record)
+    return records
+
+
+def mrns(rows):
+    return sorted(row["patient"]["medical_record_number"] for row in rows)
+
+
+@pytest.fixture
+def make_insert_path(tmp_path):
+    """An InsertPath writing to `client`, retrying without real delays; each call is a separate instance."""
+    def make(client):
+        path = InsertPath("test-project", "test_dataset", "test_table", str(tmp_path / "queue.db"), lambda: client)
+        path.insert_retry_policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01)
+        path.queue_retry_policy = RetryPolicy(base_delay=0.01, max_delay=0.05)
+        return path
+    return make
+
+
+@pytest.fixture
+def load_jobs(monkeypatch):
+    """Load jobs against the fake client, which needs pyarrow but not the BigQuery SDK for its job config."""
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(columnar_export, "load_job_config", lambda: None)
+
+
+def test_a_retry_after_a_lost_response_does_not_insert_the_row_twice(make_insert_path):
+    client = FakeBigQueryClient(fail_after_write=1)
+    path = make_insert_path(client)
+
+    receipt = path.submit(make_records(1)[0])
+
+    assert receipt["status"] == "inserted"
+    assert client.calls == 2
+    assert mrns(client.rows) == ["0000000000"]
+
+
+def test_a_resubmitted_record_gets_the_original_receipt_without_a_bigquery_call(make_insert_path):
+    client = FakeBigQueryClient()
+    path = make_insert_path(client)
+    record = make_records(1)[0]
+    first = path.submit(record)
+
+    second = path.submit(copy.deepcopy(record))
+
+    assert second == {**first, "duplicate": True}
+    assert client.calls == 1
+
+
+def test_an_idempotency_key_maps_every_retry_to_the_same_row(make_insert_path):
+    client = FakeBigQueryClient()
+    record = make_records(1)[0]
+    make_insert_path(client).submit(record, idempotency_key="request-1")
+    # The client retries on another instance, after changing nothing but a field
+    record["procedure"]["complications"] = "None"
+    make_insert_path(client).submit(record, idempotency_key="request-1")
+
+    assert len(client.rows) == 1
+
+
+def test_queued_records_are_stored_once_when_a_write_fails_after_succeeding(make_insert_path):
+    client = FakeBigQueryClient(fail_after_write=2)
+    path = make_insert_path(client)
+
+    receipts = path.submit_many(make_records(3), async_mode=True)
+    assert {receipt["status"] for receipt in receipts} == {"queued"}
+    queue = path.get_queue()
+    deadline = time.monotonic() + 10
+    while queue.depth() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    path._queue_worker.stop(timeout=5)
+
+    assert queue.depth() == 0
+    assert mrns(client.rows) == ["0000000000", "0000000001", "0000000002"]
+
+
+def test_a_retried_load_job_waits_for_the_job_that_already_ran(make_insert_path, load_jobs):
+    client = FakeBigQueryClient(fail_after_write=1)
+    path = make_insert_path(client)
+
+    receipt = path.load(make_records(3))
+
+    assert receipt["status"] == "inserted" and receipt["rows"] == 3
+    assert list(client.jobs) == [receipt["job_id"]]
+    assert len(client.rows) == 3
+
+
+def test_a_repeated_load_does_not_append_the_records_again(make_insert_path, load_jobs):
+    client = FakeBigQueryClient()
+    records = make_records(3)
+    path = make_insert_path(client)
+    first = path.load(records)
+
+    # Answered from the receipt cache on the same instance...
+    assert path.load(copy.deepcopy(records)) == {**first, "duplicate": True}
+    assert client.calls == 1
+    # ...and by the existing job on another one
+    assert make_insert_path(client).load(copy.deepcopy(records))["job_id"] == first["job_id"]
+    assert len(client.rows) == 3
+
+
+def test_load_jobs_with_the_same_key_are_one_job(make_insert_path, load_jobs):
+    client = FakeBigQueryClient()
+    first = make_insert_path(client).load(make_records(2), idempotency_key="backfill-1")
+    second = make_insert_path(client).load(make_records(2), idempotency_key="backfill-1")
+    other = make_insert_path(client).load(make_records(2), idempotency_key="backfill-2")
+
+    assert first["job_id"] == second["job_id"] != other["job_id"]
+    assert len(client.rows) == 4
+
+
+def test_a_repeated_load_job_request_is_reported_as_a_duplicate(load_function, call_handler, fake_bigquery, load_jobs):
+    pytest.importorskip("functions_framework")
+    main = load_function("submit-to-bigquery-function")
+    client = fake_bigquery(main.insert_path, FakeBigQueryClient(fail_after_write=1))
+    main.insert_path.insert_retry_policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.01)
+    body = {"records": make_records(2), "loadJob": True}
+
+    first = call_handler(main.submit_to_bigquery, json=body)
+    second = call_handler(main.submit_to_bigquery, json=body)
+
+    assert first.status_code == second.status_code == 200
+    assert first.get_json()["load_job_id"] == second.get_json()["load_job_id"]
+    assert [result.get("duplicate") for result in second.get_json()["results"]] == [True, True]
+    assert len(client.rows) == 2
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from json_extract import TruncatedJSONError, extract_json_object, find_json_object, is_unterminated, salvage_json_object
+
+
+def test_prose_and_fences_around_the_object_are_ignored():
+    text = 'Sure, here is the update:\n```json\n{"message": "Updated.", "updated_record": {}}\n```\nAnything else?'
+
+    assert find_json_object(text) == ({"message": "Updated.", "updated_record": {}}, 1)
+
+
+def test_braces_in_prose_before_the_object_are_skipped():
+    text = 'Fields in {curly braces} were left blank. {"message": "ok"}'
+
+    assert find_json_object(text) == ({"message": "ok"}, 2)
+
+
+def test_nested_brackets_and_brackets_inside_strings():
+    text = '{"updated_record": {"procedure": {"procedures_performed": ["Fasciotomy [left]", "Wound {wash}out"]}},' \
+           ' "message": "Done."}'
+
+    assert extract_json_object(text) == json.loads(text)
+
+
+def test_comments_and_trailing_commas_are_tolerated():
+    text = '{\n  // the age\n  "age": 28, /* years */\n  "codes": ["a", "b",],\n}'
+
+    assert extract_json_object(text) == {"age": 28, "codes": ["a", "b"]}
+
+
+def test_a_truncated_object_raises_a_truncated_error():
+    with pytest.raises(TruncatedJSONError):
+        find_json_object('{"updated_record": {"patient": {"name": "Jane')
+
+
+def test_text_without_an_object_raises_a_decode_error():
+    with pytest.raises(json.JSONDecodeError) as error:
+        find_json_object("I could not find any fields in that dictation.")
+
+    assert not isinstance(error.value, TruncatedJSONError)
+
+
+@pytest.mark.parametrize("text, unterminated", [
+    ('{"message": "Updated."}', False),
+    ('Here you go: {"codes": [{"code": "S82"}]} and {"more"', False),
+    ('{"codes": [{"code": "S82"}, {"code": "T79', True),
+    ('{"message": "He said \\"stop\\" and', True),
+    ('{"message": "a brace } inside"', True),
+    ('{"a": 1 /* the rest was cut', True),
+    ("no object at all", False),
+])
+def test_is_unterminated(text, unterminated):
+    assert is_unterminated(text) is unterminated
+
+
+def test_salvage_drops_a_string_cut_off_mid_value():
+    text = '{"updated_record": {"patient": {"age": 28, "name": "Jane Do'
+
+    assert salvage_json_object(text) == {"updated_record": {"patient": {"age": 28}}}
+
+
+def test_salvage_keeps_the_complete_elements_of_an_array_cut_off_midway():
+    text = 'Update: {"message": "Coded.", "codes": ["S82.201A", "T79.A21A", "S8'
+
+    assert salvage_json_object(text) == {"message": "Coded.", "codes": ["S82.201A", "T79.A21A"]}
+
+
+def test_salvage_closes_nested_objects_inside_an_array():
+    text = '{"codes": [{"system": "CPT", "code": "27892"}, {"system": "CPT", "co'
+
+    assert salvage_json_object(text) == {"codes": [{"system": "CPT", "code": "27892"}, {"system": "CPT"}]}
+
+
+def test_salvage_returns_a_complete_object_unchanged():
+    assert salvage_json_object('{"a": [1, 2], "b": {"c": null},}') == {"a": [1, 2], "b": {"c": None}}
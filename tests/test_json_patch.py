@@ -0,0 +1,33 @@
+import copy
+
+import pytest
+
+from json_patch import apply_patch, make_patch
+from test_record_schema import FULL_RECORD
+
+
+def test_an_unchanged_record_has_an_empty_patch():
+    assert make_patch(FULL_RECORD, copy.deepcopy(FULL_RECORD)) == []
+
+
+@pytest.mark.parametrize("change", [
+    lambda record: record["patient"].update(name="Jane Roe"),
+    lambda record: record["coding"]["cpt"].append({"code": "11044", "description": "Debridement"}),
+    lambda record: record["procedure"].pop("disposition"),
+    lambda record: record.update(notes={"a/b": "slash", "c~d": "tilde"}),
+])
+def test_applying_the_patch_gives_back_the_updated_record(change):
+    updated = copy.deepcopy(FULL_RECORD)
+    change(updated)
+
+    patch = make_patch(FULL_RECORD, updated)
+
+    assert patch
+    assert apply_patch(FULL_RECORD, patch) == updated
+
+
+def test_only_changed_members_are_sent():
+    updated = copy.deepcopy(FULL_RECORD)
+    updated["patient"]["age"] = 29
+
+    assert make_patch(FULL_RECORD, updated) == [{"op": "replace", "path": "/patient/age", "value": 29}]
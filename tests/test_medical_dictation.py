@@ -0,0 +1,121 @@
+import copy
+import json
+import secrets
+
+import pytest
+
+from admission import TokenBucket
+from test_record_schema import FULL_RECORD
+
+pytest.importorskip("functions_framework")
+
+FUNCTION = "medical-dictation-function"
+
+
+@pytest.fixture
+def dictation(load_function, fake_bigquery):
+    """The dictation function with a fake model that answers every turn with `main.completion`."""
+    main = load_function(FUNCTION)
+    main.bigquery = fake_bigquery(main.insert_path)
+    main.completion = {"updated_record": {}, "message": ""}
+    main.generate_content = lambda prompt, max_output_tokens=None: json.dumps(main.completion)
+    return main
+
+
+def turn(main, call_handler, update, **payload):
+    main.completion = {"updated_record": update, "message": "Updated."}
+    response = call_handler(main.medical_record_assistant, json={"userMessage": "dictation", **payload})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def incomplete_record():
+    record = copy.deepcopy(FULL_RECORD)
+    record["procedure"]["surgeon"] = ""
+    return record
+
+
+def test_auto_submit_inserts_once_when_the_record_becomes_complete(dictation, call_handler):
+    first = turn(dictation, call_handler, {"procedure": {"surgeon": "Captain Jane Smith"}},
+                 currentRecord=incomplete_record(), autoSubmit=True)
+    assert first["ready_to_insert"] and first["insert_receipt"]["status"] == "inserted"
+
+    # A correction to the finished record
+    second = turn(dictation, call_handler, {"procedure": {"surgeon": "Major Emily Brown"}},
+                  currentRecord=first["updated_record"], autoSubmit=True)
+
+    assert second["updated_record"]["procedure"]["surgeon"] == "Major Emily Brown"
+    assert "insert_receipt" not in second
+    assert len(dictation.bigquery.rows) == 1
+
+
+def test_a_session_remembers_its_submission(dictation, call_handler):
+    first = turn(dictation, call_handler, {"procedure": {"surgeon": "Captain Jane Smith"}},
+                 session=True, currentRecord=incomplete_record(), autoSubmit=True)
+    assert first["insert_receipt"]["status"] == "inserted"
+
+    # Even a correction that blanks a field and a later turn that fills it again is not a new record
+    for surgeon in ("", "Major Emily Brown"):
+        later = turn(dictation, call_handler, {"procedure": {"surgeon": surgeon}},
+                     sessionId=first["sessionId"], autoSubmit=True)
+        assert "insert_receipt" not in later
+
+    assert len(dictation.bigquery.rows) == 1
+
+
+def test_a_failed_submission_is_retried_on_the_next_turn_of_the_session(dictation, call_handler):
+    def insert_rows_json(*args, **kwargs):
+        raise ValueError("table not found")
+
+    working = dictation.bigquery.insert_rows_json
+    dictation.bigquery.insert_rows_json = insert_rows_json
+    first = turn(dictation, call_handler, {"procedure": {"surgeon": "Captain Jane Smith"}},
+                 session=True, currentRecord=incomplete_record(), autoSubmit=True)
+    assert first["insert_receipt"]["status"] == "error"
+
+    dictation.bigquery.insert_rows_json = working
+    second = turn(dictation, call_handler, {}, sessionId=first["sessionId"], autoSubmit=True)
+
+    assert second["insert_receipt"]["status"] == "inserted"
+    assert len(dictation.bigquery.rows) == 1
+
+
+def statuses(main, call_handler, requests, **kwargs):
+    """Status codes for a series of turns, each given as (payload, headers)."""
+    return [call_handler(main.medical_record_assistant, json={"userMessage": "dictation", **payload},
+                         headers=headers, **kwargs).status_code for payload, headers in requests]
+
+
+@pytest.fixture
+def limited(dictation):
+    """The dictation function allowing a burst of two requests per client."""
+    dictation.rate_limiter = TokenBucket(rate=1 / 60, burst=2)
+    return dictation
+
+
+def test_a_made_up_session_id_does_not_get_its_own_rate_limit(limited, call_handler):
+    requests = [({"sessionId": secrets.token_urlsafe(18), "currentRecord": incomplete_record()}, {})
+                for _ in range(3)]
+
+    assert statuses(limited, call_handler, requests) == [200, 200, 429]
+
+
+def test_a_forged_forwarded_for_address_does_not_get_its_own_rate_limit(limited, call_handler):
+    requests = [({"currentRecord": incomplete_record()},
+                 {"X-Forwarded-For": f"198.51.100.{index}, 203.0.113.7"}) for index in range(3)]
+
+    assert statuses(limited, call_handler, requests) == [200, 200, 429]
+    # Another client behind the same front end is limited separately
+    assert statuses(limited, call_handler, [({"currentRecord": incomplete_record()},
+                                              {"X-Forwarded-For": "203.0.113.8"})]) == [200]
+
+
+def test_a_stored_session_is_limited_on_its_own(limited, call_handler):
+    created = call_handler(limited.medical_record_assistant,
+                           json={"userMessage": "dictation", "session": True, "currentRecord": incomplete_record()})
+    session_id = created.get_json()["sessionId"]
+
+    # The address has one request left; the session has its own two
+    requests = [({"sessionId": session_id}, {})] * 3
+    assert statuses(limited, call_handler, requests) == [200, 200, 429]
+    assert statuses(limited, call_handler, [({"currentRecord": incomplete_record()}, {})]) == [200]
@@ -0,0 +1,39 @@
+import pytest
+
+from pre_extract import pre_extract
+
+FUNCTION = "medical-dictation-function"
+
+
+@pytest.mark.parametrize("message, field, update", [
+    ("Twenty-eight years old, male.", "patient.age", {"patient": {"age": 28, "sex": "male"}}),
+    ("Uh, she's female", "patient.sex", {"patient": {"sex": "female"}}),
+    ("MRN 1234567890", "patient.medical_record_number", {"patient": {"medical_record_number": "1234567890"}}),
+])
+def test_short_answers_are_parsed(message, field, update):
+    assert pre_extract(message, field) == update
+
+
+@pytest.mark.parametrize("message, field", [
+    ("Twenty-eight, and he had a fasciotomy of the left leg", "patient.age"),
+    ("Twenty-eight", "procedure.surgeon"),
+    ("I don't know yet", "patient.age"),
+])
+def test_anything_else_is_left_to_the_model(message, field):
+    assert pre_extract(message, field) is None
+
+
+def test_a_rule_based_answer_does_not_call_the_model(load_function, call_handler):
+    pytest.importorskip("functions_framework")
+    main = load_function(FUNCTION)
+
+    def generate_content(*args, **kwargs):
+        raise AssertionError("the model was called")
+
+    main.generate_content = generate_content
+    response = call_handler(main.medical_record_assistant,
+                            json={"userMessage": "twenty-eight years old", "currentPrompt": {"field": "patient.age"}})
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["updated_record"]["patient"]["age"] == 28
+    assert main.rule_based_update("twenty-eight", {"field": "procedure.surgeon"}) is None
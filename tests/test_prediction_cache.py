@@ -0,0 +1,26 @@
+from medical_records.telemetry import metrics
+from prediction_cache import CACHE_EVENTS, PredictionCache, cache_key
+
+
+def events():
+    return dict(CACHE_EVENTS.snapshot())
+
+
+def delta(before, after, event):
+    label = f'{{event="{event}"}}'
+    return after.get(label, 0) - before.get(label, 0)
+
+
+def test_hits_misses_stores_and_evictions_are_published_as_metrics():
+    cache = PredictionCache(max_entries=1)
+    before = events()
+
+    cache.get(cache_key("a", {}))
+    cache.put(cache_key("a", {}), "completion a")
+    cache.get(cache_key("a", {}))
+    cache.put(cache_key("b", {}), "completion b")
+
+    after = events()
+    assert {event: delta(before, after, event) for event in ("miss", "store", "memory_hit", "eviction")} == \
+        {"miss": 1, "store": 2, "memory_hit": 1, "eviction": 1}
+    assert "prediction_cache_events_total" in metrics.render_prometheus()
@@ -0,0 +1,59 @@
+import copy
+
+import pytest
+
+from medical_records.record_schema import COMPILED_SCHEMA, REQUIRED_FIELDS, PromptGenerator
+from medical_records.validation import validate_record
+
+FULL_RECORD = {
+    "patient": {"name": "John Doe", "age": 28, "sex": "male", "medical_record_number": "1234567890"},
+    "procedure": {
+        "date": "2023-10-27", "location": "Field Surgical Unit Alpha",
+        "preoperative_diagnosis": "Gunshot wound to the right lower extremity",
+        "postoperative_diagnosis": "Transection of the superficial femoral artery",
+        "procedures_performed": ["Fasciotomy"], "surgeon": "Captain Jane Smith",
+        "assistant_surgeon": "", "anesthesiologist": "", "estimated_blood_loss": "",
+        "fluids_administered": "", "complications": "", "disposition": "",
+    },
+    "coding": {"snomed_ct": [], "icd_10": [], "cpt": [{"code": "27892", "description": "Decompression fasciotomy"}]},
+}
+
+
+def blank(record, path):
+    section, field = path.split(".")
+    record[section][field] = type(record[section][field])()
+    return record
+
+
+def test_a_complete_record_passes_validation():
+    assert COMPILED_SCHEMA.is_complete(FULL_RECORD)
+    assert validate_record(copy.deepcopy(FULL_RECORD)) == (True, "")
+
+
+@pytest.mark.parametrize("path", REQUIRED_FIELDS)
+def test_validation_rejects_exactly_the_records_the_dictation_function_would_keep_prompting_for(path):
+    record = blank(copy.deepcopy(FULL_RECORD), path)
+    section, field = path.split(".")
+
+    assert COMPILED_SCHEMA.missing_fields(record) == [path]
+    assert PromptGenerator().get_next_prompt(record)["field"] == path
+    assert validate_record(record) == (False, f"Missing required {section} field: {field}")
+
+
+def test_optional_fields_are_not_required_by_either():
+    record = copy.deepcopy(FULL_RECORD)
+    for section, fields in record.items():
+        for field in fields:
+            if f"{section}.{field}" not in REQUIRED_FIELDS:
+                blank(record, f"{section}.{field}")
+
+    assert COMPILED_SCHEMA.is_complete(record)
+    assert validate_record(record) == (True, "")
+
+
+def test_is_field_complete_uses_the_compiled_field():
+    generator = PromptGenerator()
+    record = blank(copy.deepcopy(FULL_RECORD), "patient.age")
+
+    assert not generator.is_field_complete(record, "patient.age")
+    assert generator.is_field_complete(record, "patient.name")
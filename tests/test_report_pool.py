@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from report_pool import ReportPool
+
+FUNCTION = "generate-field-report-function"
+
+
+class FakeReportBackend:
+    """Numbered reports, counting the calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate(self):
+        with self.lock:
+            self.calls += 1
+            return f"report {self.calls}"
+
+
+def test_the_pool_fills_to_its_high_watermark_and_refills_below_the_low_one():
+    backend = FakeReportBackend()
+    pool = ReportPool(backend.generate, low_watermark=1, high_watermark=3, workers=2)
+
+    assert pool.get() is None
+    assert pool.wait_until_filled(timeout=5)
+    assert backend.calls == 3
+
+    # Still at the low watermark: nothing is generated
+    assert pool.get() and pool.get()
+    assert backend.calls == 3
+
+    assert pool.get()
+    assert pool.wait_until_filled(timeout=5)
+    assert backend.calls == 6
+    assert pool.stats == {"served_from_pool": 3, "pool_empty": 1, "generated": 6, "errors": 0}
+
+
+def test_a_failed_generation_backs_off_instead_of_retrying_at_once():
+    def generate():
+        raise RuntimeError("quota exceeded")
+
+    pool = ReportPool(generate, low_watermark=1, high_watermark=2, workers=1, error_backoff=60)
+    pool.refill()
+    assert not pool.wait_until_filled(timeout=0.2)
+    pool.refill()
+
+    assert pool.stats["errors"] == 1
+
+
+def test_the_function_does_not_generate_reports_it_was_not_asked_for(load_function, call_handler):
+    pytest.importorskip("functions_framework")
+    main = load_function(FUNCTION, REPORT_POOL_HIGH_WATERMARK=None)
+    main.report_backend = FakeReportBackend()
+
+    response = call_handler(main.generate_field_report_http, method="GET")
+
+    assert main.report_pool is None
+    assert response.get_json() == {"fieldReport": "report 1", "source": "generated"}
+    assert main.report_backend.calls == 1
+
+
+def test_an_enabled_pool_starts_filling_on_the_first_request(load_function, call_handler):
+    pytest.importorskip("functions_framework")
+    main = load_function(FUNCTION, REPORT_POOL_HIGH_WATERMARK="2")
+    main.report_backend = backend = FakeReportBackend()
+    assert len(main.report_pool) == 0 and backend.calls == 0
+
+    first = call_handler(main.generate_field_report_http, method="GET").get_json()
+    assert first["source"] == "generated"
+    assert main.report_pool.wait_until_filled(timeout=5)
+
+    second = call_handler(main.generate_field_report_http, method="GET").get_json()
+    assert second["source"] == "pool"
@@ -0,0 +1,49 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+pytest.importorskip("functions_framework")
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """scripts/serve.py, with the function modules it loads removed from sys.modules afterwards."""
+    from medical_records import insert_path
+    monkeypatch.setattr(insert_path, "_shared_paths", {})
+    monkeypatch.delenv("INSERT_QUEUE_PATH", raising=False)
+    monkeypatch.setattr(sys, "path", list(sys.path))
+    spec = importlib.util.spec_from_file_location("serve_under_test", os.path.join(ROOT, "scripts", "serve.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module
+    for directory, _, _ in module.FUNCTIONS.values():
+        sys.modules.pop(directory.replace("-", "_") + "_main", None)
+
+
+def test_every_function_is_mounted_under_its_path_with_its_methods(serve):
+    client = serve.create_app().test_client()
+
+    for path in serve.FUNCTIONS:
+        assert client.options(path).status_code == 204, path
+    assert client.get("/medical-dictation-function").status_code == 405
+    assert client.post("/generate-field-report").status_code == 405
+    assert client.get("/metrics").status_code == 200
+
+
+def test_gunicorn_runs_one_threaded_worker_without_a_timeout(serve, monkeypatch):
+    base = pytest.importorskip("gunicorn.app.base")
+    configs = []
+    monkeypatch.setattr(base.BaseApplication, "run", lambda self: configs.append((self.cfg, self.load())))
+    app = object()
+
+    serve.serve_gunicorn(app, "127.0.0.1", 8099, threads=12)
+
+    [(cfg, loaded)] = configs
+    assert loaded is app
+    assert cfg.bind == ["127.0.0.1:8099"]
+    assert (cfg.workers, cfg.threads, cfg.timeout) == (1, 12, 0)
+    assert cfg.worker_class_str == "gthread"
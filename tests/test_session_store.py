@@ -0,0 +1,55 @@
+import pytest
+
+from session_store import MemorySessionStore, SessionStore, SQLiteSessionStore, new_session_id
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore()
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"))
+
+
+def test_the_base_class_cannot_be_used_as_a_store():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_save_is_a_compare_and_set_on_the_version(store):
+    session_id = new_session_id()
+    assert store.get(session_id) is None
+
+    assert store.save(session_id, {"record": {"a": 1}}, None)
+    assert not store.save(session_id, {"record": {"a": 2}}, None)
+    state = store.get(session_id)
+    assert state == {"record": {"a": 1}, "version": 1}
+
+    assert store.save(session_id, {**state, "record": {"a": 2}}, 1)
+    # A second writer that read version 1 loses
+    assert not store.save(session_id, {"record": {"a": 3}}, 1)
+    assert store.get(session_id) == {"record": {"a": 2}, "version": 2}
+
+    store.delete(session_id)
+    assert store.get(session_id) is None
+
+
+def test_sessions_expire_after_their_ttl(store):
+    store.ttl = -1
+    session_id = new_session_id()
+    store.save(session_id, {"record": {}}, None)
+
+    assert store.get(session_id) is None
+
+
+def test_two_sqlite_stores_on_one_file_conflict_on_a_stale_version(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    session_id = new_session_id()
+    assert first.save(session_id, {"record": {}}, None)
+
+    # Both instances read version 1; the first save wins and the second is stale
+    state = second.get(session_id)
+    assert first.save(session_id, {"record": {"a": 1}}, state["version"])
+    assert not second.save(session_id, {"record": {"a": 2}}, state["version"])
+
+    assert second.get(session_id) == {"record": {"a": 1}, "version": 2}
@@ -0,0 +1,90 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from single_flight import SingleFlight
+
+CALLERS = 8
+
+
+class SlowFakeModel:
+    """Holds every call until `release` is set, then answers (or raises `error`)."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+
+    def predict(self, **kwargs):
+        with self.lock:
+            self.calls += 1
+        assert self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return SimpleNamespace(predictions=[{"content": '{"updated_record": {}, "message": ""}',
+                                             "finishReason": "STOP"}])
+
+
+def call_concurrently(function, joined, model):
+    """Run function in CALLERS threads; release the model once every other caller has joined the first call."""
+    outcomes = [None] * CALLERS
+
+    def caller(index):
+        try:
+            outcomes[index] = ("value", function())
+        except Exception as e:
+            outcomes[index] = ("error", e)
+
+    threads = [threading.Thread(target=caller, args=(index,)) for index in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while joined() < CALLERS - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    model.release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+@pytest.mark.parametrize("error", [None, ConnectionError("503 Service Unavailable")])
+def test_concurrent_identical_calls_share_one_call(error):
+    model = SlowFakeModel(error)
+    flight = SingleFlight()
+    joined = []
+
+    outcomes = call_concurrently(lambda: flight.do("prompt", model.predict, on_join=lambda: joined.append(1)),
+                                 lambda: len(joined), model)
+
+    assert model.calls == 1
+    kinds = {kind for kind, _ in outcomes}
+    assert kinds == {"error" if error else "value"}
+    first = outcomes[0][1]
+    assert all(result is first for _, result in outcomes)
+    if error:
+        assert first is error
+    assert flight.in_flight() == 0
+
+
+def test_the_dictation_model_call_is_made_once_for_concurrent_identical_turns(load_function, monkeypatch):
+    pytest.importorskip("functions_framework")
+    main = load_function("medical-dictation-function", PREDICTION_CACHE_SIZE="0", MODEL_MAX_CONCURRENCY="0")
+    main.client = model = SlowFakeModel()
+    joined = []
+    inc = main.metrics.inc
+
+    def count_joins(counter, **labels):
+        if counter is main.COALESCED_CALLS:
+            joined.append(labels)
+        inc(counter, **labels)
+
+    monkeypatch.setattr(main.metrics, "inc", count_joins)
+
+    outcomes = call_concurrently(lambda: main.generate_content("Dictation prompt"), lambda: len(joined), model)
+
+    assert model.calls == 1
+    assert {kind for kind, _ in outcomes} == {"value"}
+    assert len({result for _, result in outcomes}) == 1
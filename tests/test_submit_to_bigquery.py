@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from medical_records import columnar_export
+from medical_records.insert_path import ASYNC_UNAVAILABLE_MESSAGE
+from test_idempotency import make_records
+
+pytest.importorskip("functions_framework")
+
+FUNCTION = "submit-to-bigquery-function"
+
+
+def test_async_submission_is_refused_without_an_explicit_queue_path(load_function, call_handler):
+    main = load_function(FUNCTION, INSERT_QUEUE_PATH=None)
+
+    response = call_handler(main.submit_to_bigquery, json={"record": {"patient": {}}, "async": True})
+
+    assert response.status_code == 501
+    assert response.get_json()["error"] == ASYNC_UNAVAILABLE_MESSAGE
+    with pytest.raises(RuntimeError):
+        main.insert_path.get_queue()
+
+
+def test_bulk_requests_are_exported_in_one_batch_after_the_responses(load_function, call_handler, fake_bigquery,
+                                                                      tmp_path):
+    pytest.importorskip("pyarrow")
+    export_dir = tmp_path / "exports"
+    main = load_function(FUNCTION, EXPORT_DIR=str(export_dir), EXPORT_BATCH_ROWS="1000", EXPORT_FLUSH_SECONDS="60")
+    fake_bigquery(main.insert_path)
+    records = make_records(6)
+
+    for start in range(0, 6, 2):
+        response = call_handler(main.submit_to_bigquery, json={"records": records[start:start + 2]})
+        assert response.status_code == 200, response.get_json()
+    # A resubmission is not exported again
+    call_handler(main.submit_to_bigquery, json={"records": records[:2]})
+
+    assert not export_dir.exists()
+    assert main.export_buffer.flush() == 6
+    files = [os.path.join(directory, name) for directory, _, names in os.walk(export_dir) for name in names]
+    assert len(files) == 1
+    table = columnar_export.read_table(str(export_dir))
+    assert sorted(row["medical_record_number"] for row in table.column("patient").to_pylist()) \
+        == [record["patient"]["medical_record_number"] for record in records]
+    main.export_buffer.stop(timeout=5)
@@ -0,0 +1,25 @@
+import re
+
+from template_reports import TemplateReportBackend
+
+# A swapped pronoun glued to the end of another word, as in "tshe left lower leg".
+BROKEN_WORD = re.compile(r"\b(?!higher\b)\w+(?:she|her)\b", re.IGNORECASE)
+
+
+def test_the_indication_follows_the_patients_sex_without_breaking_words():
+    for seed in (0, 1):
+        backend = TemplateReportBackend(seed=seed)
+        for index in range(300):
+            text, record = backend.generate_example(index)
+            assert not BROKEN_WORD.search(text), (seed, index, text)
+            indication = text.split("Now, for the indications... ")[1].split("\n")[0].lower()
+            if record["patient"]["sex"] == "female":
+                assert not re.search(r"\b(?:he|his)\b", indication), (seed, index, indication)
+            else:
+                assert not re.search(r"\b(?:she|her)\b", indication), (seed, index, indication)
+
+
+def test_example_twelve_keeps_the_word_the():
+    text, _ = TemplateReportBackend(seed=0).generate_example(12)
+
+    assert "tshe" not in text
@@ -0,0 +1,42 @@
+import pytest
+
+import token_budget
+from token_budget import DEFAULT_BUDGET, FIELD_TYPE_BUDGETS, MAX_BUDGET, turn_budget
+
+FIXED = 1024
+
+
+@pytest.mark.parametrize("field, kind", [
+    ("patient.age", "short"),
+    ("procedure.date", "short"),
+    ("procedure.indications", "narrative"),
+    ("procedure.preoperative_diagnosis", "coded"),
+    ("coding.cpt", "coded"),
+])
+def test_an_empty_message_gets_the_budget_for_its_field_type(field, kind):
+    assert turn_budget(field, "", FIXED) == FIELD_TYPE_BUDGETS[kind]
+
+
+def test_the_message_length_raises_the_budget_in_steps():
+    base = FIELD_TYPE_BUDGETS["short"]
+
+    assert turn_budget("patient.age", "x" * 2, FIXED) == base + token_budget.BUDGET_STEP
+    assert turn_budget("patient.age", "x" * 2 * token_budget.BUDGET_STEP, FIXED) == base + token_budget.BUDGET_STEP
+    assert turn_budget("patient.age", "x" * (2 * token_budget.BUDGET_STEP + 2), FIXED) \
+        == base + 2 * token_budget.BUDGET_STEP
+
+
+def test_a_long_message_is_capped_at_the_maximum():
+    assert turn_budget("coding.icd_10", "x" * 10000, FIXED) == MAX_BUDGET
+
+
+@pytest.mark.parametrize("field", [None, "", "indications"])
+def test_a_turn_without_a_field_type_never_exceeds_the_fixed_budget(field):
+    assert turn_budget(field, "x" * 10000, FIXED) == min(FIXED, DEFAULT_BUDGET)
+    assert turn_budget(field, "", 512) == 512
+
+
+def test_fixed_budgeting_ignores_the_field(monkeypatch):
+    monkeypatch.setattr(token_budget, "TOKEN_BUDGET", "fixed")
+
+    assert turn_budget("patient.age", "twenty-eight", FIXED) == FIXED